@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+除錯檔（頁面 HTML、文字、截圖）擷取策略
+- DEBUG_CAPTURE（或 options["debug_capture"]）：
+    off      完全不擷取
+    failure  只在失敗時擷取（預設）；成功的 run 不做任何 page_source / 截圖
+    sampled  失敗必擷取，另外 DEBUG_SAMPLE_RATE 比例的 run 連同一般除錯點一起擷取
+    always   每個除錯點都擷取
+- 擷取只在記憶體拿到內容（page_source / get_screenshot_as_png），gzip 壓縮與寫檔交給背景執行緒
+- 檔案寫在本次 run 目錄的 debug/ 底下（HTML/文字為 <name>.gz，PNG 原樣）；每個 run 最多 DEBUG_MAX_MB，
+  同類型只有最近 DEBUG_KEEP_RUNS 個 run 保留 debug/
+"""
+
+import os
+import gzip
+import queue
+import random
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from snapshot import RUNS_DIRNAME
+
+DEBUG_CAPTURE = os.getenv("DEBUG_CAPTURE", "failure").strip().lower()
+DEBUG_SAMPLE_RATE = float(os.getenv("DEBUG_SAMPLE_RATE", "0.05"))
+DEBUG_MAX_MB = float(os.getenv("DEBUG_MAX_MB", "20"))
+DEBUG_KEEP_RUNS = int(os.getenv("DEBUG_KEEP_RUNS", "3"))
+DEBUG_DIRNAME = "debug"
+# 結束時最多等背景寫檔幾秒
+FLUSH_TIMEOUT = 15.0
+
+_mode = DEBUG_CAPTURE
+_keep_routine = False
+_dir: Optional[Path] = None
+_bytes = 0
+
+_queue: "queue.Queue[Tuple[Path, str, bytes]]" = queue.Queue()
+_writer: Optional[threading.Thread] = None
+_writer_pid = 0
+
+
+def stored_name(name: str) -> str:
+    """實際檔名：文字類 gzip 壓縮成 <name>.gz；PNG 本身已壓縮，原樣保存。"""
+    return name if name.lower().endswith(".png") else f"{name}.gz"
+
+
+def _write_loop() -> None:
+    while True:
+        target, name, data = _queue.get()
+        try:
+            target.mkdir(parents=True, exist_ok=True)
+            final = target / stored_name(name)
+            tmp = final.with_name(final.name + ".tmp")
+            if final.name.endswith(".gz"):
+                with gzip.open(tmp, "wb", compresslevel=6) as f:
+                    f.write(data)
+            else:
+                tmp.write_bytes(data)
+            os.replace(tmp, final)
+            _prune(target.parent)
+        except OSError as e:
+            print(f"⚠️ 除錯檔寫入失敗（{name}）：{e}")
+        finally:
+            _queue.task_done()
+
+
+def _ensure_writer() -> None:
+    global _writer, _writer_pid
+    # forkserver 的子行程不會繼承執行緒，依 pid 判斷要不要重開
+    if _writer is None or _writer_pid != os.getpid() or not _writer.is_alive():
+        _writer = threading.Thread(target=_write_loop, name="debug-capture", daemon=True)
+        _writer_pid = os.getpid()
+        _writer.start()
+
+
+def _prune(run_dir: Path) -> None:
+    """同類型只有最近 DEBUG_KEEP_RUNS 個 run 保留 debug/（run_id 以時間開頭，字串排序即時間排序）。"""
+    kind_dir = run_dir.parent
+    if kind_dir.parent.name != RUNS_DIRNAME:  # 腳本模式直接在使用者目錄執行，不整理
+        return
+    with_debug = sorted((d for d in kind_dir.iterdir() if (d / DEBUG_DIRNAME).is_dir()),
+                        key=lambda d: d.name, reverse=True)
+    for d in with_debug[DEBUG_KEEP_RUNS:]:
+        shutil.rmtree(d / DEBUG_DIRNAME, ignore_errors=True)
+
+
+def begin(work_dir: Union[str, Path], options: Optional[Dict[str, Any]] = None) -> None:
+    """一次 run 開始：決定模式、這次是否抽中（sampled），除錯檔寫到 <work_dir>/debug/。"""
+    global _mode, _keep_routine, _dir, _bytes
+    _mode = str((options or {}).get("debug_capture") or DEBUG_CAPTURE).strip().lower()
+    _keep_routine = _mode == "always" or (_mode == "sampled" and random.random() < DEBUG_SAMPLE_RATE)
+    _dir = Path(work_dir).resolve() / DEBUG_DIRNAME
+    _bytes = 0
+
+
+def wanted(failure: bool = False) -> bool:
+    """這個除錯點要不要擷取（一般除錯點只在 always / 抽中時擷取）。"""
+    if _mode == "off":
+        return False
+    return failure or _keep_routine
+
+
+def _put(name: str, data: bytes) -> None:
+    global _bytes
+    if _dir is None:
+        begin(".")
+    if _bytes + len(data) > DEBUG_MAX_MB * 1024 * 1024:
+        print(f"⚠️ 除錯檔超過 {DEBUG_MAX_MB:g} MB 上限，略過 {name}")
+        return
+    _bytes += len(data)
+    _ensure_writer()
+    _queue.put((_dir, name, data))
+
+
+def text(name: str, content: str, failure: bool = False) -> None:
+    if wanted(failure):
+        _put(name, content.encode("utf-8"))
+
+
+def html(driver, name: str, failure: bool = False) -> None:
+    if not wanted(failure):
+        return
+    try:
+        _put(name, driver.page_source.encode("utf-8"))
+    except Exception as e:
+        print(f"⚠️ 無法取得頁面 HTML（{name}）：{e}")
+
+
+def png(driver, name: str, failure: bool = False) -> None:
+    if not wanted(failure):
+        return
+    try:
+        _put(name, driver.get_screenshot_as_png())
+    except Exception as e:
+        print(f"⚠️ 無法截圖（{name}）：{e}")
+
+
+def element_png(element, name: str, failure: bool = False) -> None:
+    """單一元素的截圖（WebElement.screenshot_as_png）。"""
+    if not wanted(failure):
+        return
+    try:
+        _put(name, element.screenshot_as_png)
+    except Exception as e:
+        print(f"⚠️ 無法截圖（{name}）：{e}")
+
+
+def capture_failure(driver, png_name: Optional[str] = None, html_name: Optional[str] = None) -> None:
+    """失敗現場：截圖 + HTML（off 以外的模式都會擷取）。"""
+    if png_name:
+        png(driver, png_name, failure=True)
+    if html_name:
+        html(driver, html_name, failure=True)
+
+
+def finish() -> None:
+    """run 結束：等背景執行緒把這次的除錯檔寫完（最多 FLUSH_TIMEOUT 秒），行程才不會先結束。"""
+    if _writer is None or _writer_pid != os.getpid():
+        return
+    done = threading.Event()
+    threading.Thread(target=lambda: (_queue.join(), done.set()), daemon=True).start()
+    if not done.wait(FLUSH_TIMEOUT):
+        print("⚠️ 除錯檔尚未寫完，略過")
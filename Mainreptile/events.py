@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+爬蟲 → app 的結構化事件（JSON lines）
+- 每個事件是一行：@@event {"type": ..., "ts": ..., ...}，和一般 print 的文字混在 stdout 裡
+- type：phase（start/end/fail）、count（筆數）、output（輸出檔）、error（具型別的錯誤）
+- app 邊讀邊解析：看到 fatal error 就能提早收掉子行程，失敗原因直接查 ERROR_MESSAGES，不用掃整份日誌
+"""
+
+import sys
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+EVENT_PREFIX = "@@event "
+
+# 已送出過 error 事件就不再由 guard() 重複送
+_error_sent = False
+
+# 錯誤型別 → 給使用者看的訊息
+ERROR_MESSAGES = {
+    "bad_credentials":    "學號或密碼錯誤，請重新輸入。",
+    "frame_missing":      "無法切換到教務系統主畫面（main frame），網站結構可能變更，請稍後重試。",
+    "selector_not_found": "頁面元素找不到，可能網站改版或載入失敗，請重試或更新選擇器。",
+    "timeout":            "操作逾時，請檢查網路或稍後再試。",
+    "network":            "網路連線錯誤，請檢查網路狀態或校務系統是否可連線。",
+    "driver_mismatch":    "Chrome/Driver 版本不相容，請更新瀏覽器或驅動程式。",
+    "no_data":            "查無資料，頁面結構可能變更。",
+    "unknown":            "爬蟲執行失敗。",
+}
+
+
+def reset() -> None:
+    """同一個行程連續執行多次爬蟲（worker 模式）時，每次開始前清掉上一次的狀態。"""
+    global _error_sent
+    _error_sent = False
+
+
+def emit(type_: str, **fields: Any) -> None:
+    """輸出一個事件（立即 flush，app 才能即時收到）。"""
+    event = {"type": type_, "ts": round(time.time(), 3), **fields}
+    sys.stdout.write(EVENT_PREFIX + json.dumps(event, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """app 端：若這行是事件就回傳 dict，否則 None。"""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+@contextmanager
+def phase(name: str):
+    """包住一個步驟：開始、結束（含耗時 ms）或失敗各送一個事件。"""
+    emit("phase", name=name, status="start")
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        emit("phase", name=name, status="fail", ms=int((time.perf_counter() - t0) * 1000), error=str(e)[:200])
+        raise
+    emit("phase", name=name, status="end", ms=int((time.perf_counter() - t0) * 1000))
+
+
+def count(name: str, n: int) -> None:
+    emit("count", name=name, n=int(n))
+
+
+def output(path: str, rows: int) -> None:
+    emit("output", path=str(path), rows=int(rows))
+
+
+def error(code: str, message: Any = "", fatal: bool = True) -> None:
+    global _error_sent
+    _error_sent = True
+    emit("error", code=code if code in ERROR_MESSAGES else "unknown", message=str(message)[:300], fatal=fatal)
+
+
+@contextmanager
+def guard():
+    """最外層保險：沒被處理到的例外也送一個 fatal error 事件再往外丟。"""
+    try:
+        yield
+    except SystemExit:
+        raise
+    except BaseException as e:
+        if not _error_sent:
+            error(classify_exception(e), e)
+        raise
+
+
+def classify_exception(exc: BaseException) -> str:
+    """把 selenium / 爬蟲自己丟出的例外對應成錯誤型別。"""
+    name = type(exc).__name__
+    text = str(exc).lower()
+    if name == "NoSuchFrameException" or "main frame" in text:
+        return "frame_missing"
+    if name == "SessionNotCreatedException" or "only supports" in text:
+        return "driver_mismatch"
+    if name == "TimeoutException":
+        return "timeout"
+    if "net::err" in text or "connection refused" in text:
+        return "network"
+    if name in ("NoSuchElementException", "ElementNotInteractableException") or "點不到" in text or "找不到" in text:
+        return "selector_not_found"
+    if "解析不到" in text:
+        return "no_data"
+    return "unknown"
@@ -1,190 +1,16 @@
 # -*- coding: utf-8 -*-
 
-import time
-import os
-from typing import List, Tuple, Optional, Dict, Any
+from typing import Optional, Dict, Any
 import re
 import pandas as pd
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
-
-# 載入環境變數
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    print("✅ 已載入 .env 檔案")
-except ImportError:
-    print("⚠️ 未安裝 python-dotenv，請執行: pip install python-dotenv")
-    print("⚠️ 或手動設定環境變數")
-
-# ========= 設定區 =========
-# 從環境變數讀取帳號密碼
-USERNAME = os.getenv('SHU_USERNAME')
-PASSWORD = os.getenv('SHU_PASSWORD')
-
-# 檢查是否有設定帳號密碼
-if not USERNAME or not PASSWORD:
-    print("❌ 錯誤：請在 .env 檔案中設定 SHU_USERNAME 和 SHU_PASSWORD")
-    print("📝 .env 檔案格式範例：")
-    print("SHU_USERNAME=你的學號")
-    print("SHU_PASSWORD=你的密碼")
-    exit(1)
-
-HOME_URL = "https://www.shu.edu.tw/"
-HEADLESS = False
-MAX_WAIT = 25
-
-print(f"🔐 使用帳號：{USERNAME[:3]}***{USERNAME[-3:] if len(USERNAME) > 6 else '***'}")  # 部分遮蔽帳號
-
-# ---------------- 基礎工具函數 ----------------
-def build_driver():
-    opt = webdriver.ChromeOptions()
-    if HEADLESS:
-        opt.add_argument("--headless=new")
-    opt.add_argument("--no-sandbox")
-    opt.add_argument("--disable-gpu")
-    opt.add_argument("--window-size=1440,900")
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
-
-def js_click(driver, el):
-    driver.execute_script("""
-        const el = arguments[0];
-        el.scrollIntoView({block:'center'});
-        try{ el.dispatchEvent(new MouseEvent('mouseover',{bubbles:true})); }catch(e){}
-        try{ el.dispatchEvent(new MouseEvent('mousedown',{bubbles:true})); }catch(e){}
-        try{ el.dispatchEvent(new MouseEvent('mouseup',{bubbles:true})); }catch(e){}
-        try{ el.click(); }catch(e){}
-    """, el)
-
-def find_and_js_click(driver, selector: str, by="css") -> bool:
-    try:
-        el = driver.find_element(By.CSS_SELECTOR, selector) if by=="css" else driver.find_element(By.XPATH, selector)
-        js_click(driver, el)
-        return True
-    except Exception:
-        return False
-
-def click_first_working(driver, selectors: List[Tuple[str, str]]) -> bool:
-    for by, sel in selectors:
-        if find_and_js_click(driver, sel, by=by):
-            return True
-    return False
-
-def save_html(driver, path):
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(driver.page_source)
-
-def _die(driver, msg, png, html):
-    driver.save_screenshot(png)
-    save_html(driver, html)
-    raise RuntimeError(f"{msg}；已存 {png} / {html}")
-
-# ---------------- 導覽函數 ----------------
-def goto_student_system_from_home(driver):
-    driver.get(HOME_URL)
-    # 校務系統
-    ok = click_first_working(driver, [
-        ("css",  "body > div.logosearch-area > div.n2021-area > p > a:nth-child(4)"),
-        ("xpath","//a[contains(@href,'System-info.aspx')]"),
-    ])
-    if not ok:
-        _die(driver, "找不到『校務系統』連結", "fail_sys_link.png", "fail_sys_link.html")
-    time.sleep(0.6)
-
-    # 學生教務系統
-    ok = click_first_working(driver, [
-        ("css",  "body > div:nth-child(10) > div > div.sm-page-all-area > div:nth-child(2) > div.ct-sub-sbox.ct-sub-nsbox.ct-sub-nsortbox > a:nth-child(9)"),
-        ("css",  "body > div:nth-child(11) > div > div.sm-page-all-area > div:nth-child(2) > div.ct-sub-sbox.ct-sub-nsbox.ct-sub-nsortbox > a:nth-child(9)"),
-        ("xpath","//a[contains(@href,'stulb.shu.edu.tw')]"),
-        ("xpath","//a[normalize-space()='學生教務系統' or contains(normalize-space(.),'學生教務系統')]"),
-    ])
-    if not ok:
-        driver.execute_script("window.open('https://stulb.shu.edu.tw/','_blank');")
+import debug_capture
+import report_engine
+from report_engine import ReportSpec
+from grade_analytics import ANALYTICS_FILE, write_analytics
+from runtime import cli
 
-    driver.switch_to.window(driver.window_handles[-1])
-
-def login_if_needed(driver):
-    try:
-        u = WebDriverWait(driver, 12).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'],input[autocomplete='username']"))
-        )
-        p = WebDriverWait(driver, 12).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='password'],input[autocomplete='current-password']"))
-        )
-        u.clear()
-        u.send_keys(USERNAME)
-        p.clear()
-        p.send_keys(PASSWORD)
-        try:
-            btn = driver.find_element(By.CSS_SELECTOR, "input[type='submit'],button[type='submit']")
-            js_click(driver, btn)
-        except NoSuchElementException:
-            p.submit()
-        time.sleep(1.2)
-    except TimeoutException:
-        pass
-
-def open_grade_history(driver):
-    driver.switch_to.default_content()
-    try:
-        driver.switch_to.frame("main")
-    except Exception:
-        _die(driver, "找不到 main frame", "no_main_frame.png", "frameset_outer.html")
-
-    WebDriverWait(driver, 20).until(lambda d: d.execute_script("return document.readyState") == "complete")
-    try:
-        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".label")))
-    except TimeoutException:
-        _die(driver, "main frame 內未出現 .label", "main_no_labels.png", "main_no_labels.html")
-
-    def click_label(text) -> bool:
-        return driver.execute_script("""
-            const wanted = arguments[0].trim();
-            const els = Array.from(document.querySelectorAll('.label, a, button, span, div'));
-            for (const el of els) {
-              const t = (el.textContent || '').trim();
-              if (t === wanted) {
-                el.scrollIntoView({block:'center'});
-                try { el.click(); return true; } catch(e){}
-                try { el.parentElement?.click(); return true; } catch(e){}
-              }
-            }
-            return false;
-        """, text)
-
-    # 點擊成績作業
-    if not click_label("成績作業"):
-        ok = click_first_working(driver, [("xpath","//span[@class='label' and normalize-space()='成績作業']")])
-        if not ok:
-            _die(driver, "點不到『成績作業』", "click_fail_grade.png", "click_fail_grade.html")
-    time.sleep(0.6)
-
-    # 點擊SD0101-歷年成績查詢
-    ok = click_label("SD0101-歷年成績查詢")
-    if not ok:
-        ok = driver.execute_script("""
-            const wanted = "SD0101-歷年成績查詢".replace(/\s+/g,'');
-            const els = Array.from(document.querySelectorAll('.label, a, button, span, div'));
-            for (const el of els) {
-              const t = (el.textContent||'').replace(/\s+/g,'');
-              if (t.includes(wanted)) {
-                el.scrollIntoView({block:'center'});
-                try { el.click(); return true; } catch(e){}
-                try { el.parentElement?.click(); return true; } catch(e){}
-              }
-            }
-            return false;
-        """)
-    if not ok:
-        _die(driver, "點不到『SD0101-歷年成績查詢』", "click_fail_sd0101.png", "click_fail_sd0101.html")
-    
-    time.sleep(3.0)
+from selenium.webdriver.common.by import By
 
 # ---------------- 工具函數 ----------------
 def safe_int(value):
@@ -225,17 +51,10 @@ def parse_grade_table_precisely(driver):
     driver.switch_to.default_content()
     driver.switch_to.frame("main")
     
-    # 確保頁面完全載入
-    time.sleep(2)
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(2)
-    driver.execute_script("window.scrollTo(0, 0);")
-    time.sleep(1)
-    
     print("🔍 開始精確解析表格...")
     
     # 保存頁面HTML供除錯
-    save_html(driver, "debug_page.html")
+    debug_capture.html(driver, "debug_page.html")
     
     # 方法1: 嘗試直接解析HTML表格
     try:
@@ -396,9 +215,8 @@ def parse_text_content(driver):
     lines = [line.strip() for line in body_text.split('\n') if line.strip()]
     
     # 保存除錯資訊
-    with open("debug_text_lines.txt", "w", encoding="utf-8") as f:
-        for i, line in enumerate(lines):
-            f.write(f"{i:3d}: {line}\n")
+    if debug_capture.wanted():
+        debug_capture.text("debug_text_lines.txt", "".join(f"{i:3d}: {line}\n" for i, line in enumerate(lines)))
     
     courses = []
     summaries = []
@@ -661,105 +479,30 @@ def clean_summary_df(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
-# ---------------- 主程式 ----------------
-def main():
-    driver = build_driver()
-    try:
-        print("🚀 開始執行成績爬蟲（完整修正版）...")
-        
-        goto_student_system_from_home(driver)
-        print("✅ 已進入學生教務系統")
-        
-        login_if_needed(driver)
-        print("✅ 登入完成")
-        
-        open_grade_history(driver)
-        print("✅ 已開啟成績查詢頁面")
-        
-        courses_df, summary_df = parse_grade_table_precisely(driver)
-        
-        # 輸出檔案
-        if not courses_df.empty:
-            courses_df.to_csv("grades_courses_fixed.csv", index=False, encoding="utf-8-sig")
-            courses_df.to_json("grades_courses_fixed.json", orient="records", force_ascii=False, indent=2)
-            print(f"✅ 已輸出課程資料：{len(courses_df)} 筆")
-            
-            # 顯示詳細統計
-            year_counts = courses_df['學年'].value_counts().sort_index()
-            category_counts = courses_df['選別'].value_counts()
-            print(f"   學年分佈：{dict(year_counts)}")
-            print(f"   選別分佈：{dict(category_counts)}")
-            
-            # 檢查跨學期課程
-            cross_semester = courses_df[
-                courses_df['上學期_成績'].notna() & courses_df['下學期_成績'].notna()
-            ]
-            print(f"   跨學期課程：{len(cross_semester)} 筆")
-            if len(cross_semester) > 0:
-                print("   跨學期課程列表：")
-                for _, course in cross_semester.iterrows():
-                    print(f"     - {course['學年']}學年 {course['科目']} (上:{course['上學期_成績']}, 下:{course['下學期_成績']})")
-            
-            # 顯示所有有成績的課程統計
-            has_up_grade = courses_df['上學期_成績'].notna().sum()
-            has_down_grade = courses_df['下學期_成績'].notna().sum()
-            print(f"   上學期有成績：{has_up_grade} 筆")
-            print(f"   下學期有成績：{has_down_grade} 筆")
-            
-        else:
-            print("⚠️ 沒有找到課程資料")
-        
-        if not summary_df.empty:
-            summary_df.to_csv("grades_summary_fixed.csv", index=False, encoding="utf-8-sig")
-            summary_df.to_json("grades_summary_fixed.json", orient="records", force_ascii=False, indent=2)
-            print(f"✅ 已輸出彙總資料：{len(summary_df)} 筆")
-        else:
-            print("⚠️ 沒有找到彙總資料")
-        
-        # 顯示前幾筆資料預覽
-        if not courses_df.empty:
-            print("\n📊 課程資料預覽：")
-            # 只顯示有成績的欄位，避免顯示過多None
-            display_columns = ['學年', '選別', '科目']
-            if courses_df['上學期_學分'].notna().any():
-                display_columns.append('上學期_學分')
-            if courses_df['上學期_成績'].notna().any():
-                display_columns.append('上學期_成績')
-            if courses_df['下學期_學分'].notna().any():
-                display_columns.append('下學期_學分')
-            if courses_df['下學期_成績'].notna().any():
-                display_columns.append('下學期_成績')
-            
-            preview_df = courses_df[display_columns].head(15)
-            print(preview_df.to_string(index=False, max_colwidth=20))
-        
-        if not summary_df.empty:
-            print("\n📊 彙總資料：")
-            print(summary_df.to_string(index=False))
-        
+# ---------------- 報表宣告 ----------------
+SPEC = ReportSpec(
+    "grades", "歷年成績", "成績作業", ["SD0101-歷年成績查詢"],
+    parse_grade_table_precisely, ["grades_courses_fixed", "grades_summary_fixed"],
+    counts=["courses", "summaries"],
+    lazy_load=True,
+    # 各學期 / 累計平均、GPA、學分統計：跟快照一起存一次，網頁直接讀
+    after_export=[write_analytics],
+    extra_files=[ANALYTICS_FILE],
+)
+
+
+def fetch_report(driver, options: Dict[str, Any]):
+    """已登入的瀏覽器（目前分頁）→ 開啟成績查詢頁面、解析、輸出快照（流程見 report_engine）"""
+    return report_engine.fetch_report(SPEC, driver, options)
+
+
+def run(credentials: Dict[str, str], work_dir: str = ".", options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    可 import 呼叫的入口：credentials = {"username", "password"}，options = {"headless"}。
+    在 work_dir 內執行並輸出快照，回傳 {"code", "ok", "error"}（code 2 = 帳密錯誤）。
+    """
+    return report_engine.run(SPEC, credentials, work_dir, options)
 
-        print("✅ 爬蟲執行完成！")
-        
-    except Exception as e:
-        print(f"❌ 執行失敗: {e}")
-        driver.save_screenshot("error_final.png")
-        save_html(driver, "error_final.html")
-        
-        # 輸出除錯資訊
-        try:
-            driver.switch_to.default_content()
-            driver.switch_to.frame("main")
-            page_text = driver.find_element(By.TAG_NAME, "body").text
-            with open("page_text_debug.txt", "w", encoding="utf-8") as f:
-                f.write(page_text)
-            print("已儲存除錯資訊到 page_text_debug.txt")
-        except:
-            pass
-        
-        raise
-    finally:
-        time.sleep(2 if not HEADLESS else 0)
-        driver.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli(run)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+歷年成績統計（爬完成績時算一次，存成 grades_analytics.json 與正本放在同一個 run 目錄）
+- 以 grades_courses_fixed（每列一門課、上下學期各一組學分/成績）攤平成「一學期一門課」一列，全部用向量運算
+- 各學期：修習 / 實得學分、學分加權平均、GPA（4.0 制）、不及格與停修門數；
+  另附上教務系統自己算的學業成績總平均與學分數（grades_summary_fixed）對照
+- 累計：到每個學期為止的加權平均、GPA、實得學分
+- 依選別（必 / 選 / 通）：修習 / 實得學分、加權平均
+- 及格 60 分；成績欄寫「停修」算停修（不計修習學分），「抵免」「通過」算實得但不計入平均
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+ANALYTICS_FILE = "grades_analytics.json"
+PASS_SCORE = 60
+SEMESTERS = ("上學期", "下學期")
+# 百分制 → 4.0 制
+GPA_BANDS = [(80, 4.0), (70, 3.0), (60, 2.0), (50, 1.0)]
+
+
+def long_form(courses: pd.DataFrame) -> pd.DataFrame:
+    """[學年, 選別, 科目, 上/下學期_學分, 上/下學期_成績] → [學年, 學期, 選別, 科目, 學分, 成績]"""
+    parts = []
+    for sem in SEMESTERS:
+        part = courses[["學年", "選別", "科目", f"{sem}_學分", f"{sem}_成績"]].rename(
+            columns={f"{sem}_學分": "學分", f"{sem}_成績": "成績"})
+        part.insert(1, "學期", sem)
+        parts.append(part)
+    df = pd.concat(parts, ignore_index=True)
+    df = df[df["成績"].notna()].copy()
+    df["成績"] = df["成績"].astype(str).str.strip()
+    df = df[~df["成績"].isin(["", "nan", "None"])].copy()
+
+    df["學分"] = pd.to_numeric(df["學分"], errors="coerce").fillna(0.0)
+    df["分數"] = pd.to_numeric(df["成績"], errors="coerce")
+    df["停修"] = df["成績"].str.contains("停修", na=False)
+    df["免計"] = df["分數"].isna() & df["成績"].str.contains("抵免|通過", na=False)
+    df["修習學分"] = np.where(df["停修"], 0.0, df["學分"])
+    df["及格"] = (df["分數"] >= PASS_SCORE) | df["免計"]
+    df["不及格"] = df["分數"] < PASS_SCORE
+    df["實得學分"] = np.where(df["及格"], df["學分"], 0.0)
+    # 只有數字成績計入平均
+    df["計分學分"] = np.where(df["分數"].notna(), df["學分"], 0.0)
+    df["加權分數"] = df["分數"].fillna(0.0) * df["計分學分"]
+    df["GPA點數"] = np.select([df["分數"] >= lo for lo, _ in GPA_BANDS], [p for _, p in GPA_BANDS], 0.0)
+    df["加權GPA"] = df["GPA點數"] * df["計分學分"]
+    df["學期序"] = pd.to_numeric(df["學年"], errors="coerce").fillna(0).astype(int) * 2 + \
+        (df["學期"] == "下學期").astype(int)
+    return df
+
+
+def _ratio(num: pd.Series, den: pd.Series, digits: int) -> pd.Series:
+    return (num / den.where(den > 0)).round(digits)
+
+
+def _records(df: pd.DataFrame) -> list:
+    """NaN → None，numpy 數值 → Python 數值，才能直接 json.dumps。"""
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+def compute(courses: pd.DataFrame, summary: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """課程 / 彙總 DataFrame → 統計結果（dict，可直接序列化）。"""
+    if courses is None or courses.empty:
+        return {"semesters": [], "by_category": [], "cumulative": None}
+    df = long_form(courses)
+    sums = ["修習學分", "實得學分", "計分學分", "加權分數", "加權GPA", "不及格", "停修"]
+
+    by_sem = df.groupby(["學期序", "學年", "學期"], sort=True)
+    sem = by_sem[sums].sum()
+    sem["門數"] = by_sem.size()  # 同一組鍵對齊（依 index），不靠位置
+    sem = sem.reset_index()
+    sem["平均"] = _ratio(sem["加權分數"], sem["計分學分"], 2)
+    sem["GPA"] = _ratio(sem["加權GPA"], sem["計分學分"], 2)
+    cum = sem[["修習學分", "實得學分", "計分學分", "加權分數", "加權GPA"]].cumsum()
+    sem["累計_修習學分"] = cum["修習學分"]
+    sem["累計_實得學分"] = cum["實得學分"]
+    sem["累計_平均"] = _ratio(cum["加權分數"], cum["計分學分"], 2)
+    sem["累計_GPA"] = _ratio(cum["加權GPA"], cum["計分學分"], 2)
+
+    if summary is not None and not summary.empty:
+        portal = summary[["學年", "學期", "學業成績總平均", "修習學分數", "實得學分數"]].copy()
+        portal["學年"] = portal["學年"].astype(str)
+        portal = portal.rename(columns={"學業成績總平均": "教務系統_平均", "修習學分數": "教務系統_修習學分",
+                                        "實得學分數": "教務系統_實得學分"})
+        sem["學年"] = sem["學年"].astype(str)
+        sem = sem.merge(portal, on=["學年", "學期"], how="left")
+
+    sem = sem.drop(columns=["學期序", "計分學分", "加權分數", "加權GPA"])
+    sem[["不及格", "停修"]] = sem[["不及格", "停修"]].astype(int)
+
+    cat = df.groupby("選別", sort=False)[["修習學分", "實得學分", "計分學分", "加權分數", "不及格", "停修"]].sum()
+    cat["平均"] = _ratio(cat["加權分數"], cat["計分學分"], 2)
+    cat = cat.drop(columns=["計分學分", "加權分數"]).reset_index()
+    cat[["不及格", "停修"]] = cat[["不及格", "停修"]].astype(int)
+
+    total = df[["修習學分", "實得學分", "計分學分", "加權分數", "加權GPA"]].sum()
+    cumulative = {
+        "修習學分": float(total["修習學分"]),
+        "實得學分": float(total["實得學分"]),
+        "平均": round(total["加權分數"] / total["計分學分"], 2) if total["計分學分"] else None,
+        "GPA": round(total["加權GPA"] / total["計分學分"], 2) if total["計分學分"] else None,
+        "不及格": int(df["不及格"].sum()),
+        "停修": int(df["停修"].sum()),
+        "學期數": int(len(sem)),
+    }
+    return {"semesters": _records(sem), "by_category": _records(cat), "cumulative": cumulative}
+
+
+def write_analytics(courses: pd.DataFrame, summary: Optional[pd.DataFrame] = None,
+                    work_dir: Union[str, Path] = ".") -> Path:
+    """算好統計並原子寫成 <work_dir>/grades_analytics.json。"""
+    result = compute(courses, summary)
+    path = Path(work_dir) / ANALYTICS_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+    c = result["cumulative"] or {}
+    print(f"✅ 成績統計已保存：{path}（累計平均 {c.get('平均')}、GPA {c.get('GPA')}、"
+          f"實得 {c.get('實得學分')} / 修習 {c.get('修習學分')} 學分）")
+    return path
+
+
+def load_analytics(path: Union[str, Path]) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
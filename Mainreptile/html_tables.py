@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+從 page_source 一次解析出所有表格（標準庫 HTMLParser，不再對每個 table / tr / td 各呼叫一次 WebDriver）
+- 每一列只算在「最近的那個 table」底下：外層表格不會重複包含內層表格的列，
+  儲存格文字也不含巢狀表格的內容 → 每個資料列只會被走過一次
+- 儲存格文字：連續空白合併成一個空格（接近 WebElement.text）；<script> / <style> 略過
+- 少寫結束標籤（<td> 沒有 </td>、<tr> 沒有 </tr>）時依 HTML 規則自動補上
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+_WS = re.compile(r"\s+")
+
+
+class _Table:
+    def __init__(self, attrs: Dict[str, Optional[str]], depth: int):
+        self.id = attrs.get("id") or ""
+        self.cls = attrs.get("class") or ""
+        self.depth = depth
+        self.nested = 0  # 直接包含幾個子表格
+        self.rows: List[List[str]] = []
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+
+    def close_cell(self) -> None:
+        if self._cell is not None:
+            if self._row is None:
+                self._row = []
+            self._row.append(_WS.sub(" ", "".join(self._cell)).strip())
+            self._cell = None
+
+    def close_row(self) -> None:
+        self.close_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "class": self.cls, "depth": self.depth, "nested": self.nested, "rows": self.rows}
+
+
+class _Extractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[_Table] = []
+        self.tables: List[_Table] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+            return
+        top = self.stack[-1] if self.stack else None
+        if tag == "table":
+            if top:
+                top.nested += 1
+            t = _Table(dict(attrs), len(self.stack))
+            self.stack.append(t)
+            self.tables.append(t)
+        elif top is None:
+            return
+        elif tag == "tr":
+            top.close_row()
+            top._row = []
+        elif tag in ("td", "th"):
+            top.close_cell()
+            top._cell = []
+        elif tag == "br" and top._cell is not None:
+            top._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._skip = max(0, self._skip - 1)
+            return
+        if not self.stack:
+            return
+        top = self.stack[-1]
+        if tag == "table":
+            top.close_row()
+            self.stack.pop()
+        elif tag == "tr":
+            top.close_row()
+        elif tag in ("td", "th"):
+            top.close_cell()
+
+    def handle_data(self, data):
+        if self._skip or not self.stack:
+            return
+        top = self.stack[-1]
+        if top._cell is not None:
+            top._cell.append(data)
+
+
+def extract_tables(html: str) -> List[Dict[str, Any]]:
+    """
+    解析 HTML 中所有表格（依出現順序），每個表格：
+    {"id", "class", "depth"（巢狀層數，最外層 0）, "nested"（直接包含的子表格數）, "rows": [[儲存格文字, ...], ...]}
+    """
+    p = _Extractor()
+    p.feed(html or "")
+    p.close()
+    for t in p.stack:  # 沒有 </table> 的也收尾
+        t.close_row()
+    return [t.as_dict() for t in p.tables]
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+main frame 左側選單的索引（成績作業 → SD0101/SD0104、課務作業 → SC0106/SC0108 ...）
+- scan()：一次 execute_script 掃完選單，頁面內留一份「文字 → 元素」對照（window.__shuMenu），
+  Python 這邊拿到所有選單文字、所屬群組與 CSS 路徑；之後每次點擊只是一次查表，不再整頁 querySelectorAll
+- click(text)：先查這次 session 的對照；沒有的話試上次執行記下的 CSS 路徑（不用掃描）；都不行才重新掃描，
+  但每次載入（或 invalidate() 之後）最多掃一次：掃過之後的未命中直接查 entries，不再碰 DOM
+- click_containing(keywords)：在 Python 端比對已索引的文字（取代逐字整頁 JS 掃描的備援），同樣最多掃一次
+- expanded(group)：群組的子選單是否已經展開（群組標題點一下是切換，重試時不能再點一次把它收起來）
+- 頁面換掉（window.__shuMenu 不見了）時 _CLICK_JS 回傳 -1，索引視為過期，下一次未命中會再掃
+- 路徑存在 data/.menu_index.json（MENU_INDEX 可改），跨次執行沿用
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MENU_INDEX_PATH = Path(os.getenv(
+    "MENU_INDEX",
+    str(Path(__file__).resolve().parent.parent / "data" / ".menu_index.json"),
+))
+
+# 一次掃描：建立頁面內的對照表，回傳 [{text, group, path}]
+_SCAN_JS = r"""
+const norm = s => (s || '').replace(/\s+/g, ' ').trim();
+const els = document.querySelectorAll('.label, a, button, span, div');
+const map = new Map();
+for (const el of els) {
+  const t = norm(el.textContent);
+  if (!t || t.length > 40) continue;
+  const prev = map.get(t);
+  // 同一段文字外層、內層都有時取最內層（真正的 label）
+  if (!prev || prev.contains(el)) map.set(t, el);
+}
+function cssPath(el) {
+  const parts = [];
+  while (el && el.nodeType === 1 && el !== document.body) {
+    if (el.id) { parts.unshift('#' + CSS.escape(el.id)); break; }
+    const i = Array.prototype.indexOf.call(el.parentElement.children, el) + 1;
+    parts.unshift(el.tagName.toLowerCase() + ':nth-child(' + i + ')');
+    el = el.parentElement;
+  }
+  return parts.join(' > ');
+}
+function groupOf(el) {
+  const items = el.closest('.bar-menu-items');
+  const head = items && items.parentElement && items.parentElement.querySelector(':scope > .label, :scope > span');
+  return head ? norm(head.textContent) : null;
+}
+window.__shuMenu = map;
+return Array.from(map, ([t, el]) => ({text: t, group: groupOf(el), path: cssPath(el)}));
+"""
+
+# 點擊：arguments[0] 文字、arguments[1] 備用的 CSS 路徑；頁面內沒有對照表（換過頁）且點不到時回傳 -1
+_CLICK_JS = r"""
+const wanted = arguments[0], path = arguments[1];
+const norm = s => (s || '').replace(/\s+/g, ' ').trim();
+let el = window.__shuMenu && window.__shuMenu.get(wanted);
+if (!el || !el.isConnected) {
+  el = path ? document.querySelector(path) : null;
+  if (!el || norm(el.textContent) !== wanted) return window.__shuMenu ? false : -1;
+}
+el.scrollIntoView({block: 'center'});
+try { el.click(); return true; } catch (e) {}
+try { el.parentElement.click(); return true; } catch (e) {}
+return false;
+"""
+
+# 群組是否已展開：arguments 同 _CLICK_JS；找不到群組或看不出來回傳 null
+_EXPANDED_JS = r"""
+const wanted = arguments[0], path = arguments[1];
+const norm = s => (s || '').replace(/\s+/g, ' ').trim();
+let el = window.__shuMenu && window.__shuMenu.get(wanted);
+if (!el || !el.isConnected) {
+  el = path ? document.querySelector(path) : null;
+  if (!el || norm(el.textContent) !== wanted) return null;
+}
+// 群組標題和它的 .bar-menu-items 是兄弟（標題文字可能包在更內層）
+for (let p = el.parentElement, i = 0; p && p !== document.body && i < 3; p = p.parentElement, i++) {
+  const box = p.querySelector(':scope > .bar-menu-items');
+  if (box) return box.getClientRects().length > 0 && getComputedStyle(box).display !== 'none';
+}
+return null;
+"""
+
+
+def _load() -> Dict[str, Any]:
+    try:
+        return json.loads(MENU_INDEX_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(entries: Dict[str, Any]) -> None:
+    try:
+        MENU_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        data = _load()
+        data.update(entries)
+        tmp = MENU_INDEX_PATH.with_name(f"{MENU_INDEX_PATH.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, MENU_INDEX_PATH)
+    except OSError as e:
+        print(f"⚠️ 選單索引寫入失敗：{e}")
+
+
+class MenuIndex:
+    """一個 driver（目前所在的 frame）的選單索引。換頁後頁面內的對照會失效，click() 會自動重掃（每次載入最多一次）。"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.known: Dict[str, Any] = _load()  # 上次執行記下的 {文字: {group, path}}
+        self.scans = 0
+        self._fresh = False  # entries 是這次載入掃的（未命中不必再掃）
+
+    def invalidate(self) -> None:
+        """選單內容變了（換頁、展開群組後多出項目）：下一次未命中時允許再掃一次。"""
+        self._fresh = False
+
+    def scan(self) -> List[str]:
+        items = self.driver.execute_script(_SCAN_JS) or []
+        self.scans += 1
+        self._fresh = True
+        self.entries = {it["text"]: {"group": it["group"], "path": it["path"]} for it in items}
+        # 只記有群組的選單項目與群組標題，其他零碎文字不存
+        groups = {e["group"] for e in self.entries.values() if e["group"]}
+        keep = {t: e for t, e in self.entries.items() if e["group"] or t in groups}
+        if any(self.known.get(t) != e for t, e in keep.items()):
+            self.known.update(keep)
+            _save(keep)
+        return list(self.entries)
+
+    def texts(self) -> List[str]:
+        """目前索引到的選單文字（還沒掃描過就是空的）。"""
+        return list(self.entries)
+
+    def tree(self) -> Dict[str, List[str]]:
+        """{群組: [子選單文字...]}"""
+        out: Dict[str, List[str]] = {}
+        for t, e in self.entries.items():
+            if e["group"]:
+                out.setdefault(e["group"], []).append(t)
+        return out
+
+    def _click(self, text: str) -> bool:
+        entry = self.entries.get(text) or self.known.get(text) or {}
+        result = self.driver.execute_script(_CLICK_JS, text, entry.get("path"))
+        if result == -1:
+            self._fresh = False
+        return result is True
+
+    def click(self, text: str) -> bool:
+        """點擊文字完全相符的選單；查表與上次路徑都失敗時，這次載入還沒掃過才掃一次。"""
+        text = " ".join(text.split())
+        if self._fresh and text not in self.entries:
+            return False  # 剛掃過就沒有這段文字：不用再碰頁面
+        if self._click(text):
+            return True
+        if self._fresh:
+            return False
+        self.scan()
+        return text in self.entries and self._click(text)
+
+    def expanded(self, group: str) -> Optional[bool]:
+        """群組是否已展開（子選單看得到）；看不出來回傳 None。這次載入還沒掃過且查不到時先掃一次。"""
+        group = " ".join(group.split())
+        entry = self.entries.get(group) or self.known.get(group) or {}
+        state = self.driver.execute_script(_EXPANDED_JS, group, entry.get("path"))
+        if state is None and not self._fresh:
+            self.scan()
+            entry = self.entries.get(group) or {}
+            state = self.driver.execute_script(_EXPANDED_JS, group, entry.get("path"))
+        return state
+
+    def click_containing(self, keywords: List[str]) -> Optional[str]:
+        """點擊第一個包含任一關鍵字（忽略空白）的選單，回傳點到的文字；這次載入沒掃過才掃一次。"""
+        if not self._fresh:
+            self.scan()
+        for kw in keywords:
+            kw = "".join(kw.split())
+            for t in self.entries:
+                if kw in t.replace(" ", "") and self._click(t):
+                    return t
+        return None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+等頁面「不再變動」：在頁面內掛 MutationObserver，取代「捲到底 → sleep 2 秒 → 比 scrollHeight」的盲等
+- 先捲到底一次觸發延遲載入；之後只有頁面真的長高（有新內容）才再捲
+- 連續 quiet_ms 沒有任何 DOM 變動就算載入完成；最多等 timeout 秒
+- observer 只掛一次（同步 execute_script），之後每 POLL_SECONDS 用一個很短的 script 問頁面「安靜了沒」，
+  中間的 sleep 在 Python 端 → session 模式下不會佔住 TabSession 的鎖，各分頁的等待可以重疊
+- 回傳實際等待時間、變動次數、捲動次數，呼叫端寫進日誌
+"""
+
+import os
+import time
+from typing import Any, Dict
+
+QUIET_MS = int(os.getenv("LAZY_QUIET_MS", "800"))
+TIMEOUT_SECONDS = float(os.getenv("LAZY_TIMEOUT_SECONDS", "10"))
+# 兩次詢問之間睡多久（秒）
+POLL_SECONDS = float(os.getenv("LAZY_POLL_SECONDS", "0.1"))
+
+_INSTALL_JS = r"""
+const scroll = arguments[0];
+const old = window.__pageQuiet;
+if (old) old.obs.disconnect();
+const body = document.body;
+const st = {t0: performance.now(), mutations: 0, scrolls: 0, height: body.scrollHeight, scroll: scroll};
+st.last = st.t0;
+st.obs = new MutationObserver(list => {
+  st.mutations += list.length;
+  st.last = performance.now();
+  const h = body.scrollHeight;
+  if (st.scroll && h > st.height) { st.height = h; window.scrollTo(0, h); st.scrolls++; }
+});
+st.obs.observe(body, {childList: true, subtree: true, characterData: true});
+if (scroll) { window.scrollTo(0, st.height); st.scrolls++; }
+window.__pageQuiet = st;
+"""
+
+_POLL_JS = r"""
+const quietMs = arguments[0], timeoutMs = arguments[1], force = arguments[2];
+const st = window.__pageQuiet;
+if (!st) return {gone: true};
+const now = performance.now();
+const quiet = now - st.last >= quietMs;
+if (!quiet && !force && now - st.t0 < timeoutMs) return null;
+st.obs.disconnect();
+delete window.__pageQuiet;
+if (st.scroll) window.scrollTo(0, 0);
+return {ms: Math.round(now - st.t0), mutations: st.mutations, scrolls: st.scrolls,
+        height: document.body.scrollHeight, timed_out: !quiet};
+"""
+
+
+def wait_until_quiet(driver, quiet_ms: int = QUIET_MS, timeout: float = TIMEOUT_SECONDS,
+                     scroll: bool = True) -> Dict[str, Any]:
+    """
+    等目前 frame 的 DOM 安靜 quiet_ms 毫秒（最多 timeout 秒）。
+    回傳 {"ms", "mutations", "scrolls", "height", "timed_out"}。
+    """
+    t0 = time.monotonic()
+    driver.execute_script(_INSTALL_JS, bool(scroll))
+    while True:
+        time.sleep(POLL_SECONDS)
+        force = time.monotonic() - t0 >= timeout
+        result = driver.execute_script(_POLL_JS, int(quiet_ms), int(timeout * 1000), force)
+        if not result:
+            continue
+        if result.get("gone"):
+            # 頁面整個換掉了（observer 跟著不見）：還有時間就在新頁面重新掛
+            if force:
+                return {"ms": int((time.monotonic() - t0) * 1000), "mutations": 0, "scrolls": 0,
+                        "height": 0, "timed_out": True}
+            driver.execute_script(_INSTALL_JS, bool(scroll))
+            continue
+        return result
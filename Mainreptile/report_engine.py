@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+報表引擎：四份報表（課表 / 成績 / 名次 / 缺勤）共用同一套流程，各爬蟲只寫一份 ReportSpec
+- 瀏覽器、進入學生教務系統、登入：這裡一份，各爬蟲不再各自複製
+- open_menu()：切 main frame → 等選單 → MenuIndex 一次掃描 → 點群組（成績作業 / 課務作業）
+  → 依 selector_registry 的成功紀錄試選單項目關鍵字 → 退回 CSS/XPath → 退回「文字包含」
+- fetch_report()：menu → query（選填）→ parse → clean / 欄位對應 → 筆數事件 → 快照輸出 → 輸出後 hook → 附加步驟
+  每一步都用 run_phase 包住（phase 事件、耗時、原地重試），等待 / 擷取 / 快取的改進只要改這裡
+- 新增報表（其他 SD / SC 代碼）= 新的 ReportSpec + 解析函數
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import events
+import debug_capture
+import selector_registry
+from menu_index import MenuIndex
+from snapshot import write_snapshot
+from page_wait import wait_until_quiet
+from runtime import BadCredentials, run_phase, run_scraper
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from webdriver_manager.chrome import ChromeDriverManager
+
+HOME_URL = "https://www.shu.edu.tw/"
+MAX_WAIT = 25
+
+
+class ReportSpec:
+    """
+    一份報表的宣告：
+    kind / title：類型代碼（runs/<kind>/、選擇器紀錄的前綴）與顯示名稱
+    menu_group：選單群組（「成績作業」「課務作業」）；group_fallbacks：點不到時的 (by, selector)
+    menu_items：選單項目關鍵字（依序嘗試，成功紀錄會調整順序）；item_fallbacks / menu_contains：再退回的方法
+    menu_settle：點完選單後等頁面開始載入的秒數
+    lazy_load：解析前在 main frame 等 DOM 安靜（捲動觸發延遲載入，見 page_wait），取代固定 sleep
+    query(driver)：選填，送出查詢表單（例如課表選學年學期、按搜尋）
+    parse(driver)：回傳 DataFrame、records，或多份時回傳 tuple（順序對應 outputs）
+    clean(parsed)：選填，parse 結果 → DataFrame（或 tuple）；columns：欄位改名對應
+    outputs：快照名稱（第一份是主要輸出）；counts：各份的筆數事件名稱
+    on_empty："warn"（送非 fatal 的 no_data）或 "raise"（當作失敗）
+    after_export：主要輸出非空時依序呼叫 hook(*dfs)（時段索引、成績統計…）
+    extras：[(phase 名稱, fn(driver, options))]，附加產物，失敗不影響本體
+    extra_files：除了 outputs 之外會寫出的檔案（session 模式搬檔用）
+    window_size：瀏覽器視窗大小
+    """
+
+    def __init__(self, kind: str, title: str, menu_group: str, menu_items: Sequence[str],
+                 parse: Callable[[Any], Any], outputs: Sequence[str], *,
+                 group_fallbacks: Sequence[Tuple[str, str]] = (),
+                 item_fallbacks: Sequence[Tuple[str, str]] = (),
+                 menu_contains: Sequence[str] = (),
+                 menu_settle: float = 3.0,
+                 lazy_load: bool = False,
+                 query: Optional[Callable[[Any], Any]] = None,
+                 clean: Optional[Callable[[Any], Any]] = None,
+                 columns: Optional[Dict[str, str]] = None,
+                 counts: Sequence[str] = ("records",),
+                 on_empty: str = "warn",
+                 after_export: Sequence[Callable[..., Any]] = (),
+                 extras: Sequence[Tuple[str, Callable[[Any, Dict[str, Any]], Any]]] = (),
+                 extra_files: Sequence[str] = (),
+                 window_size: str = "1440,900"):
+        self.kind = kind
+        self.title = title
+        self.menu_group = menu_group
+        self.menu_items = list(menu_items)
+        self.parse = parse
+        self.outputs = list(outputs)
+        self.group_fallbacks = list(group_fallbacks)
+        self.item_fallbacks = list(item_fallbacks)
+        self.menu_contains = list(menu_contains) or self.menu_items
+        self.menu_settle = menu_settle
+        self.lazy_load = lazy_load
+        self.query = query
+        self.clean = clean
+        self.columns = columns or {}
+        self.counts = list(counts)
+        self.on_empty = on_empty
+        self.after_export = list(after_export)
+        self.extras = list(extras)
+        self.extra_files = list(extra_files)
+        self.window_size = window_size
+
+    @property
+    def files(self) -> List[str]:
+        """這份報表會寫出的所有檔案。"""
+        return [f"{name}.csv" for name in self.outputs] + self.extra_files
+
+
+# ---------------- 瀏覽器 / 點擊 ----------------
+def build_driver(headless: bool = False, window_size: str = "1440,900"):
+    """建立 Chrome WebDriver"""
+    opt = webdriver.ChromeOptions()
+    if headless:
+        opt.add_argument("--headless=new")
+    opt.add_argument("--no-sandbox")
+    opt.add_argument("--disable-gpu")
+    opt.add_argument("--lang=zh-TW")
+    opt.add_argument("--disable-blink-features=AutomationControlled")
+    opt.add_argument(f"--window-size={window_size}")
+    opt.add_experimental_option("excludeSwitches", ["enable-automation"])
+    opt.add_experimental_option('useAutomationExtension', False)
+    
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    return driver
+
+def js_click(driver, el):
+    """JavaScript 點擊元素"""
+    driver.execute_script("""
+        const el = arguments[0];
+        el.scrollIntoView({block:'center'});
+        try{ el.dispatchEvent(new MouseEvent('mouseover',{bubbles:true})); }catch(e){}
+        try{ el.dispatchEvent(new MouseEvent('mousedown',{bubbles:true})); }catch(e){}
+        try{ el.dispatchEvent(new MouseEvent('mouseup',{bubbles:true})); }catch(e){}
+        try{ el.click(); }catch(e){}
+    """, el)
+
+def find_and_js_click(driver, selector: str, by="css") -> bool:
+    """尋找元素並點擊"""
+    try:
+        if by == "css":
+            el = driver.find_element(By.CSS_SELECTOR, selector)
+        else:
+            el = driver.find_element(By.XPATH, selector)
+        js_click(driver, el)
+        return True
+    except Exception as e:
+        print(f"點擊失敗 ({by}: {selector}): {e}")
+        return False
+
+def click_first_working(driver, selectors: List[Tuple[str, str]], step: Optional[str] = None) -> bool:
+    """嘗試多個選擇器，點擊第一個成功的；step 有給時依 selector_registry 的成功紀錄排序並記錄結果"""
+    if step:
+        hit = selector_registry.try_in_order(
+            step, selectors, lambda s: find_and_js_click(driver, s[1], by=s[0]), key=lambda s: f"{s[0]}={s[1]}"
+        )
+        if hit:
+            print(f"✅ 成功點擊: {hit[0]}={hit[1]}")
+        return hit is not None
+    for by, sel in selectors:
+        if find_and_js_click(driver, sel, by=by):
+            print(f"✅ 成功點擊: {by}={sel}")
+            return True
+    return False
+
+def die(driver, msg, png, html):
+    """錯誤處理：截圖並保存HTML（依 DEBUG_CAPTURE，寫在 run 目錄的 debug/）"""
+    debug_capture.capture_failure(driver, png, html)
+    print(f"❌ {msg}")
+    raise RuntimeError(f"{msg}；除錯檔：debug/{png}、debug/{html}.gz")
+
+# ---------------- 導覽函數 ----------------
+def goto_student_system_from_home(driver):
+    """從首頁進入學生教務系統（重試時先關掉上一次開的分頁、回到第一個視窗，再從首頁重來）"""
+    handles = driver.window_handles
+    if len(handles) > 1:
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+    print("🌐 正在進入世新大學首頁...")
+    driver.get(HOME_URL)
+    time.sleep(2)
+    
+    # 點擊校務系統
+    print("🔍 尋找校務系統連結...")
+    ok = click_first_working(driver, [
+        ("css", "body > div.logosearch-area > div.n2021-area > p > a:nth-child(4)"),
+        ("xpath", "//a[contains(@href,'System-info.aspx')]"),
+        ("xpath", "//a[contains(text(),'校務系統')]"),
+    ], step="portal.system_link")
+    if not ok:
+        die(driver, "找不到『校務系統』連結", "fail_sys_link.png", "fail_sys_link.html")
+    
+    time.sleep(3)
+    
+    # 點擊學生教務系統
+    print("🔍 尋找學生教務系統連結...")
+    ok = click_first_working(driver, [
+        ("css", "body > div:nth-child(10) > div > div.sm-page-all-area > div:nth-child(2) > div.ct-sub-sbox.ct-sub-nsbox.ct-sub-nsortbox > a:nth-child(9)"),
+        ("css", "body > div:nth-child(11) > div > div.sm-page-all-area > div:nth-child(2) > div.ct-sub-sbox.ct-sub-nsbox.ct-sub-nsortbox > a:nth-child(9)"),
+        ("xpath", "//a[contains(@href,'stulb.shu.edu.tw')]"),
+        ("xpath", "//a[normalize-space()='學生教務系統' or contains(normalize-space(.),'學生教務系統')]"),
+    ], step="portal.student_system")
+    
+    if not ok:
+        print("⚠️ 找不到學生教務系統連結，直接開啟網址...")
+        driver.execute_script("window.open('https://stulb.shu.edu.tw/','_blank');")
+    
+    # 切換到新分頁
+    driver.switch_to.window(driver.window_handles[-1])
+    time.sleep(2)
+
+def login_if_needed(driver, credentials: Dict[str, str]):
+    """如需要則進行登入"""
+    print("🔐 檢查是否需要登入...")
+    
+    try:
+        # 等待登入表單出現
+        username_field = WebDriverWait(driver, 12).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'],input[autocomplete='username']"))
+        )
+        password_field = WebDriverWait(driver, 12).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='password'],input[autocomplete='current-password']"))
+        )
+        
+        print("📝 輸入帳號密碼...")
+        username_field.clear()
+        username_field.send_keys(credentials["username"])
+        
+        password_field.clear()
+        password_field.send_keys(credentials["password"])
+        
+        # 提交登入表單
+        try:
+            submit_btn = driver.find_element(By.CSS_SELECTOR, "input[type='submit'],button[type='submit']")
+            js_click(driver, submit_btn)
+        except NoSuchElementException:
+            password_field.submit()
+        
+        print("⏳ 等待登入完成...")
+        time.sleep(0.8)
+        # 提交後短暫輪詢錯誤訊息，若偵測到立即結束
+        end = time.time() + 8
+        while time.time() < end:
+            try:
+                # 先看常見的訊息元素
+                try:
+                    msg = driver.find_element(By.ID, 'lblMessage').text
+                except Exception:
+                    msg = ''
+                low = (msg or '').lower()
+                if any(k in low for k in [
+                    '登入帳號或密碼錯誤', '輸入帳號或密碼錯誤', '帳號或密碼錯誤',
+                    'login failed', 'invalid password', 'authentication failed']):
+                    try:
+                        debug_capture.capture_failure(driver, 'login_error.png', 'login_error.html')
+                    except Exception:
+                        pass
+                    print('❌ 登入失敗：', msg)
+                    events.error("bad_credentials", "登入失敗：帳號或密碼錯誤")
+                    raise BadCredentials("登入失敗：帳號或密碼錯誤")
+
+                # 廣泛比對 body 文字
+                try:
+                    body_text = driver.find_element(By.TAG_NAME, 'body').text
+                except Exception:
+                    body_text = ''
+                lowb = (body_text or '').lower()
+                if any(k in lowb for k in [
+                    '登入帳號或密碼錯誤', '輸入帳號或密碼錯誤', '帳號或密碼錯誤',
+                    'login failed', 'invalid password', 'authentication failed']):
+                    try:
+                        debug_capture.capture_failure(driver, 'login_error.png', 'login_error.html')
+                    except Exception:
+                        pass
+                    print('❌ 登入失敗（body）：帳號或密碼錯誤')
+                    events.error("bad_credentials", "登入失敗：帳號或密碼錯誤")
+                    raise BadCredentials("登入失敗：帳號或密碼錯誤")
+            except (SystemExit, BadCredentials):
+                raise
+            except Exception:
+                pass
+            time.sleep(0.5)
+        
+    except TimeoutException:
+        print("ℹ️ 沒有找到登入表單，可能已經登入或頁面結構不同")
+
+
+# ---------------- 選單 ----------------
+def open_menu(driver, spec: ReportSpec):
+    """main frame 內：點選單群組 → 點報表項目（見 ReportSpec 的 menu_* 欄位）"""
+    driver.switch_to.default_content()
+    try:
+        driver.switch_to.frame("main")
+    except Exception:
+        die(driver, "找不到 main frame", "no_main_frame.png", "frameset_outer.html")
+
+    WebDriverWait(driver, 20).until(lambda d: d.execute_script("return document.readyState") == "complete")
+    try:
+        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".label")))
+    except TimeoutException:
+        die(driver, "main frame 內未出現 .label", "main_no_labels.png", "main_no_labels.html")
+
+    # 選單只掃一次，之後每次點擊都是查表（見 menu_index）
+    menu = MenuIndex(driver)
+    group = spec.menu_group
+    # 群組標題點一下是展開 / 收合切換：已經展開（例如這個階段在重試）就不要再點
+    if menu.expanded(group):
+        print(f"📂 『{group}』已展開")
+    else:
+        if not menu.click(group):
+            ok = click_first_working(driver, [
+                ("xpath", f"//span[@class='label' and normalize-space()='{group}']"),
+                *spec.group_fallbacks,
+            ], step=f"{spec.kind}.menu_group")
+            if not ok:
+                die(driver, f"點不到『{group}』", f"click_fail_{spec.kind}_group.png",
+                    f"click_fail_{spec.kind}_group.html")
+        time.sleep(0.6)
+        # 群組展開後選單可能多了項目：接下來的未命中允許再掃一次（之後都只查表）
+        menu.invalidate()
+
+    # 上次成功的關鍵字先試
+    hit = selector_registry.try_in_order(f"{spec.kind}.menu_item", spec.menu_items, menu.click)
+    success = hit is not None
+    if success:
+        print(f"✅ 成功點擊: {hit}")
+    if not success and spec.item_fallbacks:
+        success = click_first_working(driver, spec.item_fallbacks, step=f"{spec.kind}.menu_item_css")
+    if not success:
+        # 再找「文字包含」：用同一份索引，不重掃
+        text = menu.click_containing(spec.menu_contains)
+        if text:
+            print(f"🎯 找到可能的目標: {text}")
+            success = True
+    if not success:
+        die(driver, f"點不到『{spec.menu_items[0]}』選單", f"click_fail_{spec.kind}.png", f"click_fail_{spec.kind}.html")
+
+    time.sleep(spec.menu_settle)
+
+
+def wait_for_data(driver):
+    """main frame 內等資料載入完（DOM 安靜一段時間；延遲載入的清單會自動捲到底觸發）"""
+    driver.switch_to.default_content()
+    driver.switch_to.frame("main")
+    with events.phase("lazy_load"):
+        waited = wait_until_quiet(driver)
+    print(f"⏱️ 等待資料載入 {waited['ms']} ms（DOM 變動 {waited['mutations']} 次、捲動 {waited['scrolls']} 次"
+          f"{'、已達上限' if waited['timed_out'] else ''}）")
+
+
+# ---------------- 解析 → 輸出 ----------------
+def _frames(spec: ReportSpec, parsed: Any) -> List[pd.DataFrame]:
+    if spec.clean:
+        parsed = spec.clean(parsed)
+    frames = list(parsed) if isinstance(parsed, tuple) else [parsed]
+    frames = [f if isinstance(f, pd.DataFrame) else pd.DataFrame(f or []) for f in frames]
+    if spec.columns:
+        frames = [f.rename(columns=spec.columns) for f in frames]
+    return frames
+
+
+def fetch_report(spec: ReportSpec, driver, options: Dict[str, Any]) -> List[pd.DataFrame]:
+    """已登入的瀏覽器（目前分頁）→ 開啟報表頁面、解析、輸出快照；session 模式也直接呼叫這一段"""
+    run_phase("menu", open_menu, driver, spec)
+    print(f"✅ 已開啟{spec.title}頁面")
+    if spec.query:
+        run_phase("query", spec.query, driver)
+    if spec.lazy_load:
+        wait_for_data(driver)
+
+    frames = _frames(spec, run_phase("parse", spec.parse, driver))
+    for name, df in zip(spec.counts, frames):
+        events.count(name, len(df))
+
+    primary = frames[0]
+    if primary.empty:
+        message = f"沒有找到{spec.title}資料"
+        if spec.on_empty == "raise":
+            debug_capture.html(driver, f"{spec.kind}_empty.html", failure=True)
+            raise RuntimeError(f"{message}；除錯檔：debug/{spec.kind}_empty.html.gz")
+        print(f"⚠️ {message}")
+        events.error("no_data", message, fatal=False)
+
+    for name, df in zip(spec.outputs, frames):
+        if not df.empty:
+            run_phase("export", write_snapshot, df, name)
+    if not primary.empty:
+        for hook in spec.after_export:
+            run_phase("export", hook, *frames)
+        print(f"\n📊 {spec.title}資料預覽：")
+        print(primary.head(10).to_string(index=False, max_colwidth=20))
+
+    for name, fn in spec.extras:
+        try:
+            run_phase(name, fn, driver, options)
+        except Exception as e:
+            # 附加產物，失敗不影響本體
+            print(f"⚠️ {name} 發生錯誤：{e}")
+    return frames
+
+
+# ---------------- 主程式 ----------------
+def main(spec: ReportSpec, credentials: Dict[str, str], options: Dict[str, Any]):
+    driver = run_phase("driver", build_driver, options.get("headless", False), spec.window_size)
+    try:
+        print(f"🚀 開始執行{spec.title}爬蟲...")
+        run_phase("portal", goto_student_system_from_home, driver)
+        print("✅ 已進入學生教務系統")
+
+        run_phase("login", login_if_needed, driver, credentials)
+        print("✅ 登入完成")
+
+        fetch_report(spec, driver, options)
+        print("\n✅ 爬蟲執行完成！")
+
+    except BadCredentials:
+        raise
+    except Exception as e:
+        print(f"❌ 執行失敗: {e}")
+        events.error(events.classify_exception(e), e)
+        debug_capture.capture_failure(driver, f"error_{spec.kind}.png", f"error_{spec.kind}.html")
+        try:
+            if debug_capture.wanted(failure=True):
+                page_text = driver.find_element(By.TAG_NAME, "body").text
+                debug_capture.text(f"{spec.kind}_page_text.txt", page_text, failure=True)
+        except Exception:
+            pass
+        raise
+    finally:
+        time.sleep(0 if options.get("headless") else 2)
+        driver.quit()
+
+
+def run(spec: ReportSpec, credentials: Dict[str, str], work_dir: str = ".",
+        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """在 work_dir 內執行一份報表並輸出快照，回傳 {"code", "ok", "error"}（code 2 = 帳密錯誤）。"""
+    return run_scraper(lambda c, o: main(spec, c, o), credentials, work_dir, options)
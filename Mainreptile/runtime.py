@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+爬蟲共用的執行外殼
+- 各爬蟲提供 run(credentials, work_dir, options) -> result，可被 import 後直接呼叫（見 worker.py）
+- 帳密與選項由呼叫端傳入，import 時不讀環境變數、不會 exit
+- 直接以腳本執行時（python grade.py）才由 cli() 從 .env / 環境變數讀帳密
+- run_phase：各階段（driver、portal、login、menu、query、parse、export）失敗時在原地重試，
+  沿用已開好的瀏覽器、登入與導覽，不必整支重跑；每個階段有自己的重試次數（PHASE_RETRIES）
+"""
+
+import os
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union, TypeVar
+
+import events
+import debug_capture
+import selector_registry
+
+# 結束代碼：0 成功、1 失敗、2 帳密錯誤（app 依此顯示提示）
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BAD_CREDENTIALS = 2
+
+
+class BadCredentials(Exception):
+    """登入頁回報帳號或密碼錯誤。"""
+
+
+# 各階段預設可在原地重試幾次；環境變數 PHASE_RETRIES="menu=3,parse=1" 或 options["retries"] 可覆寫
+# 會重試的階段必須可以重跑：portal 先關掉上次開的分頁、回到第一個視窗；menu 已展開的群組不再點（見 report_engine）
+DEFAULT_PHASE_RETRIES = {"driver": 1, "portal": 2, "login": 1, "menu": 2, "query": 2, "parse": 1, "export": 1,
+                         "screenshot": 1}
+# 瀏覽器 session 已經不在，原地重試沒有意義
+_DEAD_SESSION = ("InvalidSessionIdException", "NoSuchWindowException")
+
+_phase_retries: Dict[str, int] = dict(DEFAULT_PHASE_RETRIES)
+
+T = TypeVar("T")
+
+
+def parse_retries(text: str) -> Dict[str, int]:
+    out = {}
+    for part in (text or "").split(","):
+        if "=" in part:
+            name, n = (x.strip() for x in part.split("=", 1))
+            out[name] = int(n)
+    return out
+
+
+def run_phase(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    執行一個階段（送 phase 事件）；失敗就在原地重跑同一個階段，直到用完該階段的重試次數。
+    帳密錯誤、瀏覽器 session 已失效時不重試。
+    """
+    budget = _phase_retries.get(name, 0)
+    attempt = 0
+    while True:
+        try:
+            with events.phase(name):
+                return fn(*args, **kwargs)
+        except BadCredentials:
+            raise
+        except Exception as e:
+            if attempt >= budget or type(e).__name__ in _DEAD_SESSION:
+                raise
+            attempt += 1
+            print(f"🔁 {name} 失敗，原地重試（{attempt}/{budget}）：{str(e)[:120]}")
+            events.emit("retry", phase=name, attempt=attempt, budget=budget, error=str(e)[:200])
+            time.sleep(min(2.0 * attempt, 6.0))
+
+
+def _truthy(value: Any) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def options_from_env(env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """從環境變數組出選項：HEADLESS；ATTENDANCE_DETAIL / ATTENDANCE_DETAIL_TABS（缺勤明細、同時開幾個分頁）。"""
+    env = os.environ if env is None else env
+    return {
+        "headless": _truthy(env.get("HEADLESS", "False")),
+        "attendance_detail": _truthy(env.get("ATTENDANCE_DETAIL", "False")),
+        "detail_tabs": int(env.get("ATTENDANCE_DETAIL_TABS", "4")),
+    }
+
+
+def mask(username: str) -> str:
+    return f"{username[:3]}***{username[-3:] if len(username) > 6 else '***'}"
+
+
+@contextmanager
+def working_dir(path: Union[str, Path]):
+    """暫時切換工作目錄（爬蟲的除錯檔、快照都寫在相對路徑）。"""
+    prev = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+
+def run_scraper(main: Callable[[Dict[str, str], Dict[str, Any]], None], credentials: Dict[str, str],
+                work_dir: Union[str, Path] = ".", options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    在 work_dir 內執行 main(credentials, options)，把例外轉成結束代碼：
+    {"code": 0/1/2, "ok": bool, "error": 錯誤訊息或 None}
+    """
+    options = {**options_from_env({}), **(options or {})}
+    _phase_retries.clear()
+    _phase_retries.update(DEFAULT_PHASE_RETRIES)
+    _phase_retries.update(parse_retries(os.getenv("PHASE_RETRIES", "")))
+    _phase_retries.update(options.get("retries") or {})
+    if not credentials.get("username") or not credentials.get("password"):
+        print("❌ 錯誤：缺少 SHU_USERNAME / SHU_PASSWORD")
+        events.error("bad_credentials", "缺少帳號或密碼")
+        return {"code": EXIT_BAD_CREDENTIALS, "ok": False, "error": "缺少帳號或密碼"}
+
+    events.reset()
+    selector_registry.reset()
+    debug_capture.begin(work_dir, options)
+    print(f"🔐 使用帳號：{mask(credentials['username'])}")
+    try:
+        with working_dir(work_dir), events.guard():
+            main(credentials, options)
+    except BadCredentials as e:
+        return {"code": EXIT_BAD_CREDENTIALS, "ok": False, "error": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        return {"code": EXIT_FAILED, "ok": False, "error": str(e)}
+    finally:
+        try:
+            selector_registry.flush()
+        except OSError as e:
+            print(f"⚠️ 選擇器紀錄寫入失敗：{e}")
+        debug_capture.finish()
+    return {"code": EXIT_OK, "ok": True, "error": None}
+
+
+def cli(run: Callable[..., Dict[str, Any]]) -> None:
+    """腳本模式：從 .env / 環境變數讀帳密，執行後以結束代碼離開。"""
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        print("✅ 已載入 .env 檔案")
+    except ImportError:
+        print("⚠️ 未安裝 python-dotenv，請執行: pip install python-dotenv")
+    credentials = {"username": os.getenv("SHU_USERNAME", ""), "password": os.getenv("SHU_PASSWORD", "")}
+    result = run(credentials, ".", options_from_env())
+    sys.exit(result["code"])
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+選擇器成功紀錄（跨次執行保存）
+- 每個步驟（例如 "portal.system_link"、"ranking.menu_item"）有一串候選選擇器／關鍵字
+- try_in_order()：上次成功的候選排最前面，其餘依成功率，再依原本順序；
+  記錄用到第幾個候選（depth）、成功與否與耗時
+- 紀錄存在 data/.selector_registry.json（SELECTOR_REGISTRY 可改），每次 run 結束 flush() 合併寫回
+- stats() 給 app 的 /status：depth > 0 的比例變高代表網站版面變了
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+try:
+    import fcntl  # 多個爬蟲行程同時 flush 時排隊（Windows 沒有，就不鎖）
+except ImportError:
+    fcntl = None
+
+REGISTRY_PATH = Path(os.getenv(
+    "SELECTOR_REGISTRY",
+    str(Path(__file__).resolve().parent.parent / "data" / ".selector_registry.json"),
+))
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_cache: Optional[Dict[str, Any]] = None
+# 本次執行新增的紀錄（flush 時加到檔案裡最新的內容上，不會蓋掉其他行程的紀錄）
+_pending: List[Dict[str, Any]] = []
+
+
+def _load() -> Dict[str, Any]:
+    global _cache
+    if _cache is None:
+        try:
+            _cache = json.loads(REGISTRY_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def reset() -> None:
+    """新的一次 run 開始：下次使用時重新讀檔（拿到其他行程剛學到的紀錄）。"""
+    global _cache
+    with _lock:
+        _cache = None
+        _pending.clear()
+
+
+def _apply(data: Dict[str, Any], rec: Dict[str, Any]) -> None:
+    step = data.setdefault(rec["step"], {"candidates": {}, "depths": {}, "misses": 0})
+    if rec["key"] is None:
+        step["misses"] += 1
+    else:
+        c = step["candidates"].setdefault(rec["key"], {"ok": 0, "fail": 0, "ms": None, "last_ok": 0})
+        c["ok"] += 1
+        c["last_ok"] = rec["ts"]
+        c["ms"] = rec["ms"] if c["ms"] is None else round(c["ms"] * 0.8 + rec["ms"] * 0.2, 1)
+        depth = str(rec["depth"])
+        step["depths"][depth] = step["depths"].get(depth, 0) + 1
+    for key in rec["failed"]:
+        c = step["candidates"].setdefault(key, {"ok": 0, "fail": 0, "ms": None, "last_ok": 0})
+        c["fail"] += 1
+
+
+def ordered(step: str, candidates: List[T], key: Callable[[T], str] = str) -> List[T]:
+    """上次成功的排第一，其餘依成功率高低；沒有紀錄的照原順序。"""
+    with _lock:
+        stats = _load().get(step, {}).get("candidates", {})
+
+    def rank(item):
+        i, c = item
+        s = stats.get(key(c))
+        if not s:
+            return (0, 0.0, i)
+        rate = s["ok"] / max(1, s["ok"] + s["fail"])
+        return (-s["last_ok"], -rate, i)
+
+    return [c for _, c in sorted(enumerate(candidates), key=rank)]
+
+
+def try_in_order(step: str, candidates: List[T], attempt: Callable[[T], bool],
+                 key: Callable[[T], str] = str) -> Optional[T]:
+    """依紀錄排序後逐一呼叫 attempt(候選)，回傳第一個成功的候選（都失敗回傳 None）。"""
+    t0 = time.perf_counter()
+    failed = []
+    hit = None
+    depth = 0
+    for depth, c in enumerate(ordered(step, candidates, key)):
+        try:
+            ok = attempt(c)
+        except Exception:
+            ok = False
+        if ok:
+            hit = c
+            break
+        failed.append(key(c))
+    rec = {
+        "step": step,
+        "key": key(hit) if hit is not None else None,
+        "depth": depth,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+        "failed": failed,
+        "ts": int(time.time()),
+    }
+    with _lock:
+        _pending.append(rec)
+        _apply(_load(), rec)
+    return hit
+
+
+def flush() -> None:
+    """把本次的紀錄合併進檔案（先重讀最新內容再套用，暫存檔 + rename）。"""
+    with _lock:
+        if not _pending:
+            return
+        REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = REGISTRY_PATH.with_name(REGISTRY_PATH.name + ".lock")
+        with open(lock_path, "w") as lf:
+            if fcntl:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                data = json.loads(REGISTRY_PATH.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            for rec in _pending:
+                _apply(data, rec)
+            tmp = REGISTRY_PATH.with_name(REGISTRY_PATH.name + ".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp, REGISTRY_PATH)
+        _pending.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """各步驟：目前最好的候選、平均耗時、用到備援（depth > 0）的比例、全部失敗次數。"""
+    try:
+        data = json.loads(REGISTRY_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    out = {}
+    for step, s in sorted(data.items()):
+        depths = {int(k): v for k, v in s.get("depths", {}).items()}
+        hits = sum(depths.values())
+        best = max(s["candidates"].items(), key=lambda kv: (kv[1]["last_ok"], kv[1]["ok"]), default=(None, {}))
+        out[step] = {
+            "best": best[0],
+            "best_ms": best[1].get("ms"),
+            "runs": hits + s.get("misses", 0),
+            "fallback_rate": round(sum(v for d, v in depths.items() if d > 0) / hits, 3) if hits else None,
+            "misses": s.get("misses", 0),
+            "depths": depths,
+        }
+    return out
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+快照存取 + 匯出格式
+- 爬蟲只寫一份「正本」快照：<name>.csv（UTF-8-SIG、不做任何 Excel 特殊處理），以暫存檔 + rename 原子寫入
+- XLSX / Excel 安全 CSV / JSON 由 app 的 /download 需要時才從正本產生（見 export_bytes）
+- 每次執行寫在自己的 runs/<kind>/<run_id>/ 底下，結束後寫 manifest.json，
+  成功才原子替換 runs/<kind>/current.json（current 指標 = 已發佈 run 的 manifest）
+- 換 current 前先和上一個 current 逐列比對（snapshot_diff），變動追加到 runs/<kind>/changes.jsonl
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+import pandas as pd
+
+import events
+import snapshot_diff
+
+EXPORT_FORMATS = ("csv", "json", "xlsx")
+
+EXPORT_MIMETYPES = {
+    "csv":  "text/csv",
+    "json": "application/json",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# 各快照的匯出設定（以檔名主幹為 key）
+# - dtype：讀正本時要保留成字串的欄位（str 代表全部欄位）
+# - text_columns：會被 Excel 誤判成日期的欄位 → CSV 包成 ="..."、XLSX 整欄鎖文字
+# - widths：XLSX 欄寬
+# - keys：前後兩次快照逐列比對時的自然鍵
+EXPORT_SPECS: Dict[str, Dict[str, Any]] = {
+    "timetable_list1": {
+        "sheet": "清單一",
+        "dtype": str,
+        "keys": ["課程簡碼"],
+        "widths": {
+            "選別": 6, "課程簡碼": 18, "課程名稱(教材下載)": 28, "開課系級": 16,
+            "學分": 6, "年別": 6, "授課老師": 12, "星期節次週別": 20, "教室": 18,
+            "座位序號(行-列)": 14, "備註": 36,
+        },
+    },
+    "grades_courses_fixed": {
+        "sheet": "歷年成績",
+        "dtype": {"學年": str, "選別": str, "科目": str, "上學期_成績": str, "下學期_成績": str},
+        "keys": ["學年", "科目"],
+    },
+    "grades_summary_fixed": {
+        "sheet": "彙總",
+        "dtype": {"學年": str, "學期": str, "操行成績": str},
+        "keys": ["學年", "學期"],
+    },
+    "ranking_records": {
+        "sheet": "歷年名次",
+        "dtype": {"學年": str, "學期": str, "學分": str, "名次": str, "人數": str},
+        "text_columns": ["名次", "人數"],
+        "text_width": 16,
+        "keys": ["學年", "學期"],
+    },
+    "attendance_records": {
+        "sheet": "出缺勤記錄",
+        "dtype": str,
+        "keys": ["學年", "學期", "課程代碼"],
+    },
+    "attendance_details": {
+        "sheet": "缺勤明細",
+        "dtype": str,
+        "keys": ["學年學期", "課程代碼", "日期"],
+    },
+}
+
+
+RUNS_DIRNAME = "runs"
+CURRENT_FILE = "current.json"
+MANIFEST_FILE = "manifest.json"
+# 每種類型保留最近幾次 run 目錄（current 指向的那次一定保留）
+KEEP_RUNS = int(os.getenv("SNAPSHOT_KEEP_RUNS", "5"))
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """先寫 <path>.tmp 再 os.replace，讀者不會看到寫一半的檔案。"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_snapshot(df: pd.DataFrame, name: str, work_dir: Union[str, Path] = ".") -> Path:
+    """把 DataFrame 原子寫成正本快照 <work_dir>/<name>.csv，回傳路徑。"""
+    path = Path(work_dir) / f"{name}.csv"
+    data = df.to_csv(index=False).encode("utf-8-sig")
+    _atomic_write_bytes(path, data)
+    print(f"✅ 快照已保存：{path}（{len(df)} 筆）")
+    events.output(path, len(df))
+    return path
+
+
+def read_snapshot(path: Union[str, Path]) -> pd.DataFrame:
+    """依 EXPORT_SPECS 的 dtype 讀回正本（保留學年、名次等字串欄位原貌）。"""
+    path = Path(path)
+    spec = EXPORT_SPECS.get(path.stem, {})
+    return pd.read_csv(path, encoding="utf-8-sig", dtype=spec.get("dtype"), keep_default_na=False,
+                       na_values=[""])
+
+
+def _excel_safe_csv(df: pd.DataFrame, spec: Dict[str, Any]) -> bytes:
+    df_csv = df.copy()
+    for col in spec.get("text_columns", []):
+        if col in df_csv.columns:
+            s = df_csv[col].astype(str).str.replace('/', '／', regex=False)
+            df_csv[col] = '="' + s.str.replace('"', '""') + '"'
+    return df_csv.to_csv(index=False).encode("utf-8-sig")
+
+
+def _xlsx(df: pd.DataFrame, spec: Dict[str, Any], sheet: str) -> bytes:
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet)
+        ws = writer.sheets[sheet]
+        for col, w in spec.get("widths", {}).items():
+            if col in df.columns:
+                ci = df.columns.get_loc(col)
+                ws.set_column(ci, ci, w)
+        text_cols = [c for c in spec.get("text_columns", []) if c in df.columns]
+        if text_cols:
+            text_fmt = writer.book.add_format({'num_format': '@'})  # 文字格式
+            for col in text_cols:
+                ci = df.columns.get_loc(col)
+                ws.set_column(ci, ci, spec.get("text_width", 16), text_fmt)
+    return buf.getvalue()
+
+
+def export_bytes(path: Union[str, Path], fmt: str, df: Optional[pd.DataFrame] = None) -> bytes:
+    """
+    由正本快照產生指定格式的內容：
+    - csv：UTF-8-SIG，text_columns 以 ="..." 包裹（Excel 不會轉成日期）
+    - json：records、indent=2
+    - xlsx：text_columns 整欄鎖文字，並套用欄寬
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支援的格式：{fmt}")
+    path = Path(path)
+    spec = EXPORT_SPECS.get(path.stem, {})
+    if df is None:
+        df = read_snapshot(path)
+    if fmt == "csv":
+        return _excel_safe_csv(df, spec)
+    if fmt == "json":
+        records = json.loads(df.to_json(orient="records", force_ascii=False))
+        return json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")
+    return _xlsx(df, spec, spec.get("sheet", path.stem[:31]))
+
+
+# ---------------- run 目錄 + manifest ----------------
+def new_run_dir(work_dir: Union[str, Path], kind: str) -> Path:
+    """建立本次執行專用的輸出目錄 <work_dir>/runs/<kind>/<run_id>/。"""
+    now = time.time()
+    run_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}-" + uuid.uuid4().hex[:6]
+    run_dir = Path(work_dir) / RUNS_DIRNAME / kind / run_id
+    run_dir.mkdir(parents=True, exist_ok=False)
+    return run_dir
+
+
+def _write_json_atomic(path: Path, obj: Dict[str, Any]) -> None:
+    _atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def _records(path: Path) -> List[Dict[str, Any]]:
+    return json.loads(read_snapshot(path).to_json(orient="records", force_ascii=False))
+
+
+def diff_runs(kind_dir: Union[str, Path], previous: Dict[str, Any],
+              manifest: Dict[str, Any]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    上一個 current 與這次 run 的逐列差異（{檔名主幹: diff}）。
+    只比兩邊都有、雜湊不同的檔案；這次沒產生的檔案（例如沒開缺勤明細）不當成整份刪除。
+    """
+    kind_dir = Path(kind_dir)
+    diffs = {}
+    for stem, info in manifest["files"].items():
+        prev = previous.get("files", {}).get(stem)
+        if not prev or prev.get("sha256") == info["sha256"]:
+            continue
+        old_path = kind_dir / previous["run_id"] / prev["path"]
+        if not old_path.exists():
+            continue
+        keys = EXPORT_SPECS.get(stem, {}).get("keys", [])
+        diffs[stem] = snapshot_diff.diff_records(_records(old_path),
+                                                 _records(kind_dir / manifest["run_id"] / info["path"]), keys)
+    return diffs
+
+
+def publish_run(run_dir: Union[str, Path], kind: str, outputs: List[str],
+                started_at: float, ended_at: float, exit_code: int) -> Dict[str, Any]:
+    """
+    寫入 run 的 manifest（類型、起訖時間、各檔筆數與雜湊、exit code）。
+    exit code 為 0 且主要輸出（outputs[0]）存在時才把 current 指標換成這次的 manifest；
+    換之前先和上一個 current 比對，manifest["changes"] 記各檔新增 / 刪除 / 變動筆數（沒有上一版時為 None），
+    有變動就追加到 runs/<kind>/changes.jsonl。
+    """
+    run_dir = Path(run_dir)
+    files = {}
+    for name in outputs:
+        path = run_dir / name
+        if not path.exists():
+            continue
+        data = path.read_bytes()
+        files[Path(name).stem] = {
+            "path": name,
+            "rows": len(read_snapshot(path)),
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+    primary = Path(outputs[0]).stem if outputs else None
+    manifest = {
+        "kind": kind,
+        "run_id": run_dir.name,
+        "started_at": round(started_at, 3),
+        "ended_at": round(ended_at, 3),
+        "exit_code": exit_code,
+        "ok": exit_code == 0 and primary in files,
+        "files": files,
+    }
+    if not manifest["ok"]:
+        _write_json_atomic(run_dir / MANIFEST_FILE, manifest)
+    else:
+        # 讀上一版 current → 比對 → 記變動 → 換 current 整段上鎖，同類型同時發佈時不會比到同一個上一版
+        with snapshot_diff.changes_lock(run_dir.parent):
+            previous = current_manifest(run_dir.parent.parent.parent, kind)
+            manifest["changes"] = None
+            if previous and previous.get("run_id") != run_dir.name:
+                try:
+                    diffs = diff_runs(run_dir.parent, previous, manifest)
+                    manifest["changes"] = snapshot_diff.summarize(diffs)
+                    snapshot_diff.append_changes(run_dir.parent, kind, run_dir.name, previous["run_id"], diffs)
+                except Exception as e:
+                    # 比對失敗不影響發佈
+                    print(f"⚠️ 快照比對失敗：{e}")
+            _write_json_atomic(run_dir / MANIFEST_FILE, manifest)
+            _write_json_atomic(run_dir.parent / CURRENT_FILE, manifest)
+    prune_runs(run_dir.parent)
+    return manifest
+
+
+def current_manifest(work_dir: Union[str, Path], kind: str) -> Optional[Dict[str, Any]]:
+    """讀 current 指標（一次檔案讀取）；尚未有成功的 run 時回傳 None。"""
+    path = Path(work_dir) / RUNS_DIRNAME / kind / CURRENT_FILE
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_files(work_dir: Union[str, Path], manifest: Dict[str, Any]) -> List[Path]:
+    """manifest 內各快照檔的實際路徑（依 manifest 記錄順序）。"""
+    run_dir = Path(work_dir) / RUNS_DIRNAME / manifest["kind"] / manifest["run_id"]
+    return [run_dir / info["path"] for info in manifest.get("files", {}).values()]
+
+
+def prune_runs(kind_dir: Union[str, Path], keep: int = KEEP_RUNS) -> None:
+    """只保留最近 keep 個 run 目錄；current 指向的 run 永不刪除。"""
+    kind_dir = Path(kind_dir)
+    current = current_manifest(kind_dir.parent.parent, kind_dir.name)
+    current_id = current.get("run_id") if current else None
+    # run_id 以時間開頭，字串排序即時間排序
+    run_dirs = sorted((d for d in kind_dir.iterdir() if d.is_dir()), key=lambda d: d.name, reverse=True)
+    for d in run_dirs[keep:]:
+        if d.name != current_id:
+            shutil.rmtree(d, ignore_errors=True)
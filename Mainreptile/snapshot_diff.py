@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+前後兩次快照的逐列差異（發佈新的 current 時由 snapshot.publish_run 計算）
+- 以自然鍵對齊兩份快照（學年 / 學期 / 科目、課程簡碼…，見 snapshot.EXPORT_SPECS 的 keys）：
+  新增的列整列記下、消失的列只記鍵、同一鍵欄位有變的只記變動的欄位 [舊值, 新值]
+- 同一個鍵出現多次（例如同一門課多個時段）時依出現順序編號（"#": 1, 2, …）再對齊
+- 設定的鍵欄位不在快照裡時退回整列比對（只會有新增 / 刪除）
+- 有變動才在 runs/<kind>/changes.jsonl 追加一行（每行一次發佈，seq 遞增），只保留最近 CHANGES_KEEP 筆；
+  用戶端的 since 比保留的最舊一筆還舊時 is_truncated() 為真（中間的紀錄已刪掉）
+- 讀最後的 seq → 追加 / 重寫 整段在 changes_lock() 內（旁邊的 .lock 檔 flock + 行程內的鎖），
+  同一類型同時發佈（排程 + 手動、session 模式多執行緒）也不會有重複的 seq 或被重寫吃掉的紀錄
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import fcntl  # 多個行程同時發佈時排隊（Windows 沒有，就只靠行程內的鎖）
+except ImportError:
+    fcntl = None
+
+CHANGES_FILE = "changes.jsonl"
+CHANGES_KEEP = int(os.getenv("SNAPSHOT_CHANGES_KEEP", "200"))
+
+Row = Dict[str, Any]
+
+_locks: Dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+@contextmanager
+def changes_lock(kind_dir: Union[str, Path]):
+    """
+    鎖住 <kind_dir> 的變動紀錄（也給 publish_run 包住「讀上一版 current → 比對 → 換 current」）。
+    同一個執行緒可重入：外層已經拿到鎖時，內層直接通過。
+    """
+    key = str(Path(kind_dir).resolve())
+    held = _held.__dict__.setdefault("paths", set())
+    if key in held:
+        yield
+        return
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.RLock())
+    with lock:
+        Path(key).mkdir(parents=True, exist_ok=True)
+        with open(Path(key) / (CHANGES_FILE + ".lock"), "w") as lf:
+            if fcntl:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            held.add(key)
+            try:
+                yield
+            finally:
+                held.discard(key)
+
+
+def _index(rows: List[Row], keys: Sequence[str]) -> Dict[Tuple, Row]:
+    """鍵 → 列；重複的鍵在後面加上出現序號。"""
+    seen: Dict[Tuple, int] = {}
+    out: Dict[Tuple, Row] = {}
+    for row in rows:
+        base = tuple(row.get(c) for c in keys) if keys else tuple(sorted(row.items(), key=lambda kv: kv[0]))
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        out[base + (n,)] = row
+    return out
+
+
+def _key_dict(key: Tuple, keys: Sequence[str], row: Row) -> Row:
+    """鍵 tuple → 給人看的 {鍵欄位: 值}（整列比對時就是整列）。"""
+    out = dict(zip(keys, key)) if keys else dict(row)
+    if key[-1]:
+        out["#"] = key[-1]
+    return out
+
+
+def diff_records(old: List[Row], new: List[Row], keys: Sequence[str] = ()) -> Dict[str, List[Row]]:
+    """
+    兩份 records（list of dict）的差異：
+    {"added": [新列, ...], "removed": [{鍵}, ...], "changed": [{"key": {鍵}, "fields": {欄位: [舊, 新]}}, ...]}
+    """
+    cols = set().union(*(r.keys() for r in old[:1] + new[:1]))
+    keys = list(keys) if all(k in cols for k in keys) else []
+    before, after = _index(old, keys), _index(new, keys)
+    added = [row for k, row in after.items() if k not in before]
+    removed = [_key_dict(k, keys, row) for k, row in before.items() if k not in after]
+    changed = []
+    for k, row in after.items():
+        prev = before.get(k)
+        if prev is None or prev == row:
+            continue
+        fields = {c: [prev.get(c), row.get(c)] for c in dict.fromkeys([*prev, *row])
+                  if prev.get(c) != row.get(c)}
+        changed.append({"key": _key_dict(k, keys, row), "fields": fields})
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def summarize(diffs: Dict[str, Dict[str, List[Row]]]) -> Dict[str, Dict[str, int]]:
+    """各檔的新增 / 刪除 / 變動筆數（寫進 manifest）。"""
+    return {name: {t: len(d[t]) for t in ("added", "removed", "changed")} for name, d in diffs.items()}
+
+
+def _read_lines(path: Path) -> List[str]:
+    try:
+        return [ln for ln in path.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    except OSError:
+        return []
+
+
+def append_changes(kind_dir: Union[str, Path], kind: str, run_id: str, prev_run_id: Optional[str],
+                   diffs: Dict[str, Dict[str, List[Row]]]) -> Optional[Dict[str, Any]]:
+    """有任何變動才追加一筆到 <kind_dir>/changes.jsonl；回傳寫入的紀錄（沒變動回傳 None）。"""
+    files = {name: {t: v for t, v in d.items() if v} for name, d in diffs.items()}
+    files = {name: d for name, d in files.items() if d}
+    if not files:
+        return None
+    path = Path(kind_dir) / CHANGES_FILE
+    with changes_lock(kind_dir):
+        lines = _read_lines(path)
+        seq = latest_seq(kind_dir, lines) + 1
+        record = {"seq": seq, "ts": round(time.time(), 3), "kind": kind, "run_id": run_id,
+                  "prev_run_id": prev_run_id, "files": files}
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        if len(lines) >= CHANGES_KEEP * 2:
+            # 偶爾整份重寫一次只留最近 CHANGES_KEEP 筆，平常只做追加
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text("\n".join(lines[-(CHANGES_KEEP - 1):] + [line]) + "\n", encoding="utf-8")
+            os.replace(tmp, path)
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    return record
+
+
+def read_changes(kind_dir: Union[str, Path], since: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+    """seq 大於 since 的紀錄（由舊到新，最多 limit 筆）。"""
+    out = []
+    for ln in _read_lines(Path(kind_dir) / CHANGES_FILE):
+        try:
+            rec = json.loads(ln)
+        except ValueError:
+            continue
+        if rec.get("seq", 0) > since:
+            out.append(rec)
+    return out[:limit]
+
+
+def latest_seq(kind_dir: Union[str, Path], lines: Optional[List[str]] = None) -> int:
+    if lines is None:
+        lines = _read_lines(Path(kind_dir) / CHANGES_FILE)
+    try:
+        return json.loads(lines[-1]).get("seq", 0) if lines else 0
+    except ValueError:
+        return 0
+
+
+def oldest_seq(kind_dir: Union[str, Path], lines: Optional[List[str]] = None) -> int:
+    """還保留著的最舊一筆 seq（沒有紀錄回傳 0）。"""
+    if lines is None:
+        lines = _read_lines(Path(kind_dir) / CHANGES_FILE)
+    try:
+        return json.loads(lines[0]).get("seq", 0) if lines else 0
+    except ValueError:
+        return 0
+
+
+def is_truncated(kind_dir: Union[str, Path], since: int) -> bool:
+    """
+    since 之後的紀錄是否已有一部分被刪掉（只保留最近 CHANGES_KEEP 筆）：
+    是的話增量不完整，用戶端要重新抓整份快照，再從最新的 seq 接著拉。
+    """
+    return oldest_seq(kind_dir) > since + 1
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+一次登入、多份報表分頁平行執行（session 模式）
+- 登入一次後，每份報表（課表 / 成績 / 名次 / 缺勤）各用一個分頁（同一個瀏覽器、共用 cookie），
+  各自在一個執行緒跑該爬蟲的 fetch_report()
+- WebDriver 一次只能處理一個指令：TabSession 把 driver.execute 換成加鎖的版本，每個執行緒綁定自己的分頁，
+  輪到它下指令前先切回它的分頁與 frame（WebElement 的指令也走 driver.execute，一樣會先切過去）；
+  爬蟲裡的 sleep、等頁面載入都不佔鎖 → 各分頁的載入與等待互相重疊，總時間接近最慢的那一份報表
+- 輸出都寫在目前目錄（各報表的檔名不重複）；options["session_dirs"]（或 SESSION_DIRS，JSON）有給時，
+  結束後把各報表的檔案搬到各自的目錄（app 的 run_session 用它發佈成各類型的 run）
+- 各報表的結果（ok、秒數、錯誤）寫成 session.json；全部失敗才算這次 run 失敗
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import events
+import debug_capture
+import report_engine
+import grade
+import ranking_scraper
+import schedule_scraper
+import attendance_scraper
+from runtime import run_phase, run_scraper, cli
+
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.support.ui import WebDriverWait
+
+REPORTS = {
+    "timetable": schedule_scraper,
+    "grades": grade,
+    "ranking": ranking_scraper,
+    "attendance": attendance_scraper,
+}
+RESULTS_FILE = "session.json"
+# 新分頁最多等幾秒載入完成
+TAB_LOAD_WAIT = 30
+
+_SWITCH_COMMANDS = {Command.SWITCH_TO_WINDOW, Command.SWITCH_TO_FRAME, Command.SWITCH_TO_PARENT_FRAME}
+
+
+class _Tab:
+    def __init__(self, handle: str):
+        self.handle = handle
+        self.frames: List[Dict[str, Any]] = []  # 從頂層切進目前 frame 的 switchToFrame 參數
+
+
+class TabSession:
+    """同一個 WebDriver 給多個執行緒用：每個執行緒綁一個分頁，指令用鎖串起來，換人時先切回該分頁與 frame"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._raw = driver.execute
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._active: Optional[_Tab] = None
+        driver.execute = self._execute
+
+    def detach(self) -> None:
+        """還原 driver.execute。"""
+        self.driver.__dict__.pop("execute", None)
+
+    def open(self, url: str) -> str:
+        """開一個新分頁（不等載入），回傳 window handle。"""
+        before = set(self.driver.window_handles)
+        self.driver.execute_script("window.open(arguments[0], '_blank');", url)
+        return next(h for h in self.driver.window_handles if h not in before)
+
+    def run_in(self, handle: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """在目前執行緒綁定分頁 handle，等它載入完成後執行 fn(*args)。"""
+        self._local.tab = _Tab(handle)
+        try:
+            WebDriverWait(self.driver, TAB_LOAD_WAIT).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+            return fn(*args)
+        finally:
+            self._local.tab = None
+
+    def _execute(self, command: str, params: Optional[Dict[str, Any]] = None):
+        tab: Optional[_Tab] = getattr(self._local, "tab", None)
+        with self._lock:
+            if tab is None:
+                if command in _SWITCH_COMMANDS:
+                    self._active = None
+                return self._raw(command, params)
+            if self._active is not tab:
+                self._raw(Command.SWITCH_TO_WINDOW, {"handle": tab.handle})
+                try:
+                    for p in tab.frames:
+                        self._raw(Command.SWITCH_TO_FRAME, p)
+                except Exception:
+                    # frame 已不存在（頁面換掉了）：停在頂層，由爬蟲自己重新切
+                    self._raw(Command.SWITCH_TO_FRAME, {"id": None})
+                    tab.frames = []
+                self._active = tab
+            result = self._raw(command, params)
+            if command == Command.SWITCH_TO_FRAME:
+                tab.frames = [] if (params or {}).get("id") is None else tab.frames + [params]
+            elif command == Command.SWITCH_TO_PARENT_FRAME:
+                tab.frames = tab.frames[:-1]
+            elif command == Command.SWITCH_TO_WINDOW:
+                tab.handle, tab.frames = params["handle"], []
+            return result
+
+
+def _report(kind: str, driver, options: Dict[str, Any]) -> Dict[str, Any]:
+    """跑一份報表；失敗只記在這份報表的結果裡（非 fatal），不影響其他分頁。"""
+    t0 = time.perf_counter()
+    try:
+        REPORTS[kind].fetch_report(driver, options)
+        ok, error = True, None
+        print(f"✅ {kind} 完成")
+    except Exception as e:
+        ok, error = False, str(e)
+        print(f"❌ {kind} 失敗：{e}")
+        events.error(events.classify_exception(e), f"{kind}：{e}", fatal=False)
+        debug_capture.capture_failure(driver, f"error_{kind}.png", f"error_{kind}.html")
+    return {"ok": ok, "seconds": round(time.perf_counter() - t0, 1), "error": error}
+
+
+def _move_outputs(kind: str, dest: str) -> None:
+    Path(dest).mkdir(parents=True, exist_ok=True)
+    for name in REPORTS[kind].SPEC.files:
+        if os.path.exists(name):
+            os.replace(name, Path(dest) / name)
+
+
+def main(credentials: Dict[str, str], options: Dict[str, Any]):
+    kinds = [k for k in (options.get("kinds") or list(REPORTS)) if k in REPORTS]
+    if not kinds:
+        raise ValueError("沒有要執行的報表")
+    # 視窗取各報表要求中最大的
+    sizes = [tuple(int(v) for v in REPORTS[k].SPEC.window_size.split(",")) for k in kinds]
+    window_size = "{},{}".format(max(w for w, _ in sizes), max(h for _, h in sizes))
+    driver = run_phase("driver", report_engine.build_driver, options.get("headless", False), window_size)
+    session = None
+    try:
+        print(f"🚀 session 模式：登入一次，平行執行 {', '.join(kinds)}")
+        run_phase("portal", report_engine.goto_student_system_from_home, driver)
+        run_phase("login", report_engine.login_if_needed, driver, credentials)
+        print("✅ 登入完成")
+
+        driver.switch_to.default_content()
+        url = driver.current_url
+        session = TabSession(driver)
+        # 第一份報表沿用登入的分頁，其他各開一個新分頁（同時開始載入）
+        tabs = {kinds[0]: driver.current_window_handle}
+        tabs.update({kind: session.open(url) for kind in kinds[1:]})
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(kinds), thread_name_prefix="report") as pool:
+            futures = {kind: pool.submit(session.run_in, tabs[kind], _report, kind, driver, options)
+                       for kind in kinds}
+            results = {kind: f.result() for kind, f in futures.items()}
+        wall = round(time.perf_counter() - t0, 1)
+
+        for kind, dest in (options.get("session_dirs") or {}).items():
+            if kind in results:
+                _move_outputs(kind, dest)
+        Path(RESULTS_FILE).write_text(
+            json.dumps({"kinds": kinds, "seconds": wall, "reports": results}, ensure_ascii=False, indent=2),
+            encoding="utf-8")
+
+        total = sum(r["seconds"] for r in results.values())
+        print(f"⏱️ {len(kinds)} 份報表平行耗時 {wall} 秒（逐一執行合計約 {round(total, 1)} 秒）")
+        for kind, r in results.items():
+            print(f"   {'✅' if r['ok'] else '❌'} {kind}：{r['seconds']} 秒{'' if r['ok'] else '，' + (r['error'] or '')[:120]}")
+        if not any(r["ok"] for r in results.values()):
+            raise RuntimeError("所有報表都失敗")
+    finally:
+        if session:
+            session.detach()
+        driver.quit()
+
+
+def load_results(work_dir: str = ".") -> Dict[str, Any]:
+    path = Path(work_dir) / RESULTS_FILE
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def run(credentials: Dict[str, str], work_dir: str = ".", options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    options：{"headless", "kinds"（預設全部）, "session_dirs"（{類型: 目錄}）}；
+    沒給的 kinds / session_dirs 從 SESSION_KINDS（逗號分隔）/ SESSION_DIRS（JSON）讀。
+    回傳 {"code", "ok", "error", "reports": {類型: {"ok", "seconds", "error"}}}。
+    """
+    options = dict(options or {})
+    if not options.get("kinds") and os.getenv("SESSION_KINDS"):
+        options["kinds"] = [k.strip() for k in os.environ["SESSION_KINDS"].split(",") if k.strip()]
+    if not options.get("session_dirs") and os.getenv("SESSION_DIRS"):
+        options["session_dirs"] = json.loads(os.environ["SESSION_DIRS"])
+    result = run_scraper(main, credentials, work_dir, options)
+    return {**result, "reports": load_results(work_dir).get("reports", {})}
+
+
+if __name__ == "__main__":
+    cli(run)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+課表時段索引（由清單一的「星期節次週別」欄建立）
+- parse_slots()：把「二3-4」「(三)5,6 單週」「星期四 第7~8節」「一 3 4」「二34」之類的文字拆成
+  (星期 1-7, 節次, 週別 all/odd/even) 的時段
+- build_index()：整份清單一 → 預先算好的格子索引
+    cells：「星期-節次」→ [[課程序號, 週別], ...]
+    busy ：單週 / 雙週 各一組，每天一個 bitmask（第 i 節有課 = 第 i 位元為 1）
+    conflicts：同一格、週別重疊的課程
+  存成 timetable_index.json，放在 timetable_list1.csv 旁邊（同一個 run 目錄）
+- TimetableIndex：查某一格有什麼課、哪些節次空堂、衝堂清單都是查表 / 位元運算；grid() 給網頁畫週課表
+"""
+
+import os
+import re
+import json
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+INDEX_FILE = "timetable_index.json"
+INDEX_VERSION = 1
+
+WEEKDAYS = "一二三四五六日"
+WEEKDAY_NAMES = ["星期" + d for d in WEEKDAYS]
+# 節次代碼的順序（數字節次之後是英文字母節次，例如中午 / 夜間）
+PERIODS = [str(i) for i in range(1, 15)] + list("ABCDE")
+_PERIOD_POS = {p: i for i, p in enumerate(PERIODS)}
+WEEK_KINDS = ("all", "odd", "even")
+
+# 星期字元把文字切成一段一段：二3-4、(三)5,6、星期四 第7~8節、五A-B、一 3 4、二34
+_DAY_RE = re.compile(r"[一二三四五六日]")
+# 段內的節次：一串連寫的節次代碼，或「起-訖」範圍（空白、逗號等都只是分隔）
+_TOKEN_RE = re.compile(r"([0-9A-E]+)(?:\s*[-~]\s*([0-9A-E]+))?")
+
+COLUMN_CODE = "課程簡碼"
+COLUMN_NAME = "課程名稱(教材下載)"
+COLUMN_TEACHER = "授課老師"
+COLUMN_ROOM = "教室"
+COLUMN_SLOTS = "星期節次週別"
+
+
+def period_code(token: str) -> Optional[str]:
+    """節次代碼正規化（「03」→「3」、「a」→「A」）；不是有效節次回傳 None。"""
+    token = token.strip().upper()
+    if token.isdigit():
+        token = str(int(token))
+    return token if token in _PERIOD_POS else None
+
+
+def _increasing(codes: List[Optional[str]]) -> bool:
+    if not codes or None in codes:
+        return False
+    pos = [_PERIOD_POS[c] for c in codes]
+    return all(b > a for a, b in zip(pos, pos[1:]))
+
+
+def _split_run(run: str) -> List[str]:
+    """
+    連寫的節次拆開，規則固定：
+    1. 先當成每個字元一節（「12」→ 1、2，「34」→ 3、4，「AB」→ A、B），節次遞增就採用
+    2. 否則兩個字元一節（只有 10-14 會出現這種寫法：「10」→ 10，「1011」→ 10、11，「1213」→ 12、13）
+    3. 都不成立（例如「910」）才在所有遞增的切法裡選每節相連、段數最多的（→ 9、10）
+    """
+    singles = [period_code(c) for c in run]
+    if _increasing(singles):
+        return singles
+    if len(run) % 2 == 0:
+        pairs = [period_code(run[i:i + 2]) for i in range(0, len(run), 2)]
+        if _increasing(pairs) and all(run[i:i + 2] == c for i, c in zip(range(0, len(run), 2), pairs)):
+            return pairs
+
+    def splits(rest: str) -> List[List[str]]:
+        if not rest:
+            return [[]]
+        out = []
+        for n in (1, 2):
+            code = period_code(rest[:n]) if len(rest) >= n else None
+            if code is not None and rest[:n] == code:
+                out.extend([code] + tail for tail in splits(rest[n:]))
+        return out
+
+    best = None
+    for cand in splits(run):
+        if not _increasing(cand):
+            continue
+        pos = [_PERIOD_POS[c] for c in cand]
+        score = (any(b != a + 1 for a, b in zip(pos, pos[1:])), -len(cand))
+        if best is None or score < best[0]:
+            best = (score, cand)
+    return best[1] if best else []
+
+
+def _periods_of(segment: str) -> List[str]:
+    """一個星期後面那段文字裡的所有節次。"""
+    periods: List[str] = []
+    for a, b in _TOKEN_RE.findall(segment.upper()):
+        if not b:
+            periods.extend(_split_run(a))
+            continue
+        # 範圍的兩端先當成一整個節次（10-12），不是合法節次才拆開（123-5 → 1、2、3~5）
+        left = [a] if period_code(a) == a else _split_run(a)
+        right = [b] if period_code(b) == b else _split_run(b)
+        if not left or not right:
+            periods.extend(left + right)
+            continue
+        lo, hi = sorted((_PERIOD_POS[left[-1]], _PERIOD_POS[right[0]]))
+        periods.extend(left[:-1] + PERIODS[lo:hi + 1] + right[1:])
+    return periods
+
+
+def _weeks_of(text: str) -> str:
+    if "單" in text:
+        return "odd"
+    if "雙" in text:
+        return "even"
+    return "all"
+
+
+def parse_slots(text: str) -> List[Dict[str, Any]]:
+    """「星期節次週別」→ [{"day": 2, "periods": ["3", "4"], "weeks": "all"}, ...]（看不懂的部分略過）"""
+    text = unicodedata.normalize("NFKC", str(text or "")).replace("天", "日")
+    matches = list(_DAY_RE.finditer(text))
+    # 寫在最前面（第一個星期之前）的週別套用到每一段
+    default_weeks = _weeks_of(text[:matches[0].start()]) if matches else "all"
+    slots = []
+    for i, m in enumerate(matches):
+        # 這個星期之後、下一個星期之前的整段：節次（空白分開或連寫都可以）與這一段的週別
+        tail = text[m.end(): matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+        periods = _periods_of(tail)
+        if not periods:
+            continue
+        weeks = _weeks_of(tail) if ("單" in tail or "雙" in tail) else default_weeks
+        slots.append({"day": WEEKDAYS.index(m.group()) + 1,
+                      "periods": sorted(set(periods), key=_PERIOD_POS.get), "weeks": weeks})
+    return slots
+
+
+def _overlap(a: str, b: str) -> bool:
+    return a == "all" or b == "all" or a == b
+
+
+def build_index(df: pd.DataFrame) -> Dict[str, Any]:
+    """清單一 DataFrame → 可直接序列化的索引。"""
+    courses = []
+    cells: Dict[str, List[List[Any]]] = {}
+    busy = {"odd": [0] * 7, "even": [0] * 7}
+    unparsed = []
+    for i, row in enumerate(df.fillna("").to_dict("records")):
+        raw = str(row.get(COLUMN_SLOTS, ""))
+        courses.append({
+            "code": str(row.get(COLUMN_CODE, "")),
+            "name": str(row.get(COLUMN_NAME, "")),
+            "teacher": str(row.get(COLUMN_TEACHER, "")),
+            "room": str(row.get(COLUMN_ROOM, "")),
+            "slots_text": raw,
+        })
+        slots = parse_slots(raw)
+        if raw.strip() and not slots:
+            unparsed.append(i)
+        for s in slots:
+            for p in s["periods"]:
+                cells.setdefault(f"{s['day']}-{p}", []).append([i, s["weeks"]])
+                bit = 1 << _PERIOD_POS[p]
+                if s["weeks"] in ("all", "odd"):
+                    busy["odd"][s["day"] - 1] |= bit
+                if s["weeks"] in ("all", "even"):
+                    busy["even"][s["day"] - 1] |= bit
+
+    conflicts = []
+    for key, entries in cells.items():
+        clash = sorted({c for a in range(len(entries)) for b in range(a + 1, len(entries))
+                        if entries[a][0] != entries[b][0] and _overlap(entries[a][1], entries[b][1])
+                        for c in (entries[a][0], entries[b][0])})
+        if clash:
+            day, period = key.split("-")
+            conflicts.append({"day": int(day), "period": period, "courses": clash})
+
+    return {
+        "version": INDEX_VERSION,
+        "periods": PERIODS,
+        "courses": courses,
+        "cells": cells,
+        "busy": busy,
+        "conflicts": conflicts,
+        "unparsed": unparsed,
+    }
+
+
+def write_index(df: pd.DataFrame, work_dir: Union[str, Path] = ".") -> Path:
+    """建立索引並原子寫成 <work_dir>/timetable_index.json。"""
+    path = Path(work_dir) / INDEX_FILE
+    data = json.dumps(build_index(df), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    print(f"✅ 課表時段索引已保存：{path}")
+    return path
+
+
+class TimetableIndex:
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.courses: List[Dict[str, Any]] = data["courses"]
+        self.cells: Dict[str, List[List[Any]]] = data["cells"]
+        self.busy: Dict[str, List[int]] = data["busy"]
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "TimetableIndex":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "TimetableIndex":
+        return cls(build_index(df))
+
+    def at(self, day: int, period: str, weeks: str = "all") -> List[Dict[str, Any]]:
+        """某一格（星期幾、第幾節）的課；weeks=odd/even 只看單 / 雙週。"""
+        period = period_code(str(period)) or str(period)
+        return [{**self.courses[i], "weeks": w} for i, w in self.cells.get(f"{day}-{period}", [])
+                if _overlap(w, weeks)]
+
+    def _mask(self, day: int, weeks: str) -> int:
+        if weeks == "all":
+            return self.busy["odd"][day - 1] | self.busy["even"][day - 1]
+        return self.busy[weeks][day - 1]
+
+    def is_free(self, day: int, period: str, weeks: str = "all") -> bool:
+        pos = _PERIOD_POS.get(period_code(str(period)) or "")
+        return pos is not None and not (self._mask(day, weeks) >> pos) & 1
+
+    def free(self, day: Optional[int] = None, weeks: str = "all",
+             periods: Optional[List[str]] = None) -> Dict[int, List[str]]:
+        """空堂：{星期: [節次...]}（預設看星期一到五、第 1-10 節）。"""
+        days = [day] if day else range(1, 6)
+        periods = periods or PERIODS[:10]
+        out = {}
+        for d in days:
+            mask = self._mask(d, weeks)
+            out[d] = [p for p in periods if not (mask >> _PERIOD_POS[p]) & 1]
+        return out
+
+    def conflicts(self) -> List[Dict[str, Any]]:
+        return [{**c, "courses": [self.courses[i] for i in c["courses"]]} for c in self.data["conflicts"]]
+
+    def grid(self) -> Dict[str, Any]:
+        """週課表：用到的星期（至少一到五）× 用到的節次範圍，每格是 [(課名, 教室, 週別), ...]。"""
+        used = [tuple(k.split("-")) for k in self.cells]
+        days = sorted({int(d) for d, _ in used} | {1, 2, 3, 4, 5})
+        positions = [_PERIOD_POS[p] for _, p in used] or [0]
+        periods = PERIODS[min(positions): max(positions) + 1]
+        rows = []
+        for p in periods:
+            rows.append([[(self.courses[i]["name"], self.courses[i]["room"], w)
+                          for i, w in self.cells.get(f"{d}-{p}", [])] for d in days])
+        return {"days": [WEEKDAY_NAMES[d - 1] for d in days], "periods": periods, "rows": rows}
@@ -2,18 +2,36 @@
 import os
 import sys
 import time
-import glob
-import subprocess
+import asyncio
+import gzip
+import json
+import hashlib
+import zipfile
+import tempfile
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 import pandas as pd
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, send_file, redirect, url_for, flash, jsonify
 from dotenv import load_dotenv
 from dotenv import set_key
 
 load_dotenv()
 
+# 爬蟲共用模組（snapshot 等）放在 Mainreptile/，爬蟲以腳本執行時也是從該資料夾 import
+sys.path.insert(0, str((Path(__file__).parent / "Mainreptile").resolve()))
+import events  # noqa: E402
+import snapshot  # noqa: E402
+import snapshot_diff  # noqa: E402
+import runtime  # noqa: E402
+import selector_registry  # noqa: E402
+import timetable_index  # noqa: E402
+import grade_analytics  # noqa: E402
+from logstore import LogStore  # noqa: E402
+from runner import (Job, RunMonitor, RUNNER_MODE, RUN_SLOTS, CANCELLED_CODE, run_process, async_runner,  # noqa: E402
+                    worker_pool, fork_server, start_job, start_async_job, get_job)
+
 app = Flask(__name__)
 app.secret_key = os.getenv("APP_SECRET", "dev-secret")  # for flash()
 
@@ -23,7 +41,7 @@ app.secret_key = os.getenv("APP_SECRET", "dev-secret")  # for flash()
 # - 課表（清單一）：Main reptile/schedule_scraper.py → 產出 timetable_list1.csv
 # - 歷年成績：      Main reptile/grade.py        → 產出 grades_courses_fixed.csv / grades_summary_fixed.csv
 # - 歷年名次：      Main reptile/ranking_scraper.py → 產出 ranking_records.csv
-# - 出缺勤記錄：    Main reptile/attendance_scraper.py → 產出 attendance_records.csv
+# - 出缺勤記錄：    Main reptile/attendance_scraper.py → 產出 attendance_records.csv（ATTENDANCE_DETAIL=1 另有 attendance_details.csv）
 BASE_DIR = Path(__file__).parent.resolve()
 SCRIPTS = {
     "timetable": str((BASE_DIR / "Mainreptile" / "schedule_scraper.py").resolve()),
@@ -31,13 +49,15 @@ SCRIPTS = {
     "ranking":   str((BASE_DIR / "Mainreptile" / "ranking_scraper.py").resolve()),
     "attendance":str((BASE_DIR / "Mainreptile" / "attendance_scraper.py").resolve()),
 }
+# session 模式：登入一次，多份報表各開一個分頁平行執行
+SESSION_SCRIPT = str((BASE_DIR / "Mainreptile" / "tab_session.py").resolve())
 
 # 各腳本跑完後**預期**會產生的檔案（用來找最新一份）
 OUTPUTS = {
     "timetable": ["timetable_list1.csv"],
     "grades":    ["grades_courses_fixed.csv", "grades_summary_fixed.csv"],
     "ranking":   ["ranking_records.csv"],
-    "attendance":["attendance_records.csv"],
+    "attendance":["attendance_records.csv", "attendance_details.csv"],
 }
 
 # CSV 顯示時的預設欄位（有就秀；沒有就自動顯示全部）
@@ -64,12 +84,84 @@ SCRIPT_TIMEOUTS = {
     "attendance":int(os.getenv("TIMEOUT_ATTENDANCE", "300")),
 }
 
-
-def run_script(kind: str, env_override: Dict[str, Any], work_dir: Optional[Path] = None) -> Dict[str, Any]:
+# /api 回應超過此大小（bytes）且用戶端接受 gzip 時才壓縮
+API_GZIP_MIN_BYTES = int(os.getenv("API_GZIP_MIN_BYTES", "1024"))
+
+
+def _launch(kind: str, script: str, env: Dict[str, str], run_dir: Path, timeout: int,
+            on_line, on_cancel=None) -> Tuple[int, str, str]:
+    """依 RUNNER_MODE 啟動一次爬蟲；回傳 (returncode, stdout, stderr)。worker 模式不支援取消。"""
+    if RUNNER_MODE == "forkserver":
+        print(f"[RUN] forkserver {kind} (cwd={run_dir})")
+        return fork_server(PYTHON_BIN).run(kind, env, str(run_dir), timeout=timeout, on_line=on_line,
+                                           on_cancel=on_cancel)
+    if RUNNER_MODE == "worker":
+        print(f"[RUN] worker {kind} (cwd={run_dir})")
+        credentials = {"username": env.get("SHU_USERNAME", ""), "password": env.get("SHU_PASSWORD", "")}
+        options = runtime.options_from_env(env)
+        return worker_pool(PYTHON_BIN).run(kind, credentials, str(run_dir), options,
+                                           timeout=timeout, on_line=on_line)
+    if RUNNER_MODE == "asyncio":
+        print(f"[RUN] asyncio {PYTHON_BIN} {script} (cwd={run_dir})")
+        return async_runner().run([PYTHON_BIN, script], env=env, cwd=str(run_dir), timeout=timeout,
+                                  on_line=on_line, on_cancel=on_cancel)
+    print(f"[RUN] {PYTHON_BIN} {script} (cwd={run_dir})")
+    return run_process([PYTHON_BIN, script], env=env, cwd=str(run_dir), timeout=timeout, on_line=on_line,
+                       on_cancel=on_cancel)
+
+
+def run_script(kind: str, env_override: Dict[str, Any], work_dir: Optional[Path] = None,
+               job: Optional[Job] = None) -> Dict[str, Any]:
     """
-    呼叫對應的爬蟲腳本。回傳 process returncode。
+    呼叫對應的爬蟲腳本。回傳 process returncode 與本次 run 的 manifest。
     會把 SHU_USERNAME / SHU_PASSWORD / HEADLESS 等環境變數覆寫進去（不落地存檔）。
+    爬蟲在 <work_dir>/runs/<kind>/<run_id>/ 內執行，成功才會更新 current 指標。
+    有傳 job 時，子行程的每一行輸出會即時送到 job（給 SSE 進度用）。
+    RUNNER_MODE=worker 時不開新直譯器，改交給預先啟動的 worker 呼叫爬蟲模組的 run()；
+    RUNNER_MODE=forkserver 時由預先 import 好的 zygote fork 出本次的行程；
+    RUNNER_MODE=asyncio 時子行程由共用的 event loop 監看（呼叫端只等結果，不再各開兩條 reader thread）。
+    job 被取消（/jobs/<id>/cancel）時中止子行程，回傳碼 CANCELLED_CODE，不會更新 current 指標。
+    startup_ms（啟動到爬蟲送出第一個事件）會記進日誌索引，用來比較各模式的啟動延遲。
+    失敗原因以爬蟲送出的結構化事件判斷（RunMonitor）；收到 fatal error 會提早結束子行程。
+    """
+    script, env, run_cwd, run_dir, timeout = _prepare_script(kind, env_override, work_dir)
+    monitor = RunMonitor()
+    # 全域同時執行數：網頁查詢、批次、排程共用，依校務系統的回應狀況自動調整（AIMD）
+    with RUN_SLOTS.slot() as report:
+        started_at = time.time()
+        if job and job.cancelled:
+            # 排隊等名額時就被取消了：不用開瀏覽器
+            ret_code, stdout, stderr = CANCELLED_CODE, "", ""
+        else:
+            ret_code, stdout, stderr = _launch(kind, script, env, run_dir, timeout, _line_handler(monitor, job),
+                                               job.on_cancel if job else None)
+        report(_error_code(monitor, ret_code), monitor.phases, monitor.error_phase)
+    return _finish_script(kind, run_cwd, run_dir, monitor, ret_code, stdout, stderr, started_at)
+
+
+async def run_script_async(kind: str, env_override: Dict[str, Any], work_dir: Path, job: Job) -> Dict[str, Any]:
+    """
+    RUNNER_MODE=asyncio 的 /query/start：和 run_script 同一套流程，但整段跑在 AsyncRunner 的 event loop 上
+    （排隊等名額、監看子行程都不佔 thread）；最後發佈 run、寫日誌是檔案 I/O，交給 loop 的 executor。
     """
+    script, env, run_cwd, run_dir, timeout = _prepare_script(kind, env_override, work_dir)
+    monitor = RunMonitor()
+    async with RUN_SLOTS.slot_async() as report:
+        started_at = time.time()
+        if job.cancelled:
+            ret_code, stdout, stderr = CANCELLED_CODE, "", ""
+        else:
+            print(f"[RUN] asyncio {PYTHON_BIN} {script} (cwd={run_dir})")
+            ret_code, stdout, stderr = await async_runner().supervise(
+                [PYTHON_BIN, script], env, str(run_dir), timeout, _line_handler(monitor, job), job.on_cancel)
+        report(_error_code(monitor, ret_code), monitor.phases, monitor.error_phase)
+    return await asyncio.get_running_loop().run_in_executor(
+        None, _finish_script, kind, run_cwd, run_dir, monitor, ret_code, stdout, stderr, started_at)
+
+
+def _prepare_script(kind: str, env_override: Dict[str, Any],
+                    work_dir: Optional[Path]) -> Tuple[str, Dict[str, str], Path, Path, int]:
+    """找腳本、組環境變數、建好本次的 run 目錄；回傳 (script, env, run_cwd, run_dir, timeout)。"""
     script = SCRIPTS.get(kind)
     if not script or not Path(script).exists():
         raise FileNotFoundError(f"找不到爬蟲腳本：{script}（請確認 SCRIPTS 設定與檔名）")
@@ -78,43 +170,128 @@ def run_script(kind: str, env_override: Dict[str, Any], work_dir: Optional[Path]
     env.update({k: str(v) for k, v in env_override.items() if v is not None})
     # 強制子行程以 UTF-8 輸出，避免 Windows cp950 解碼錯誤
     env["PYTHONIOENCODING"] = "utf-8"
+    # 輸出接到 pipe 時 Python 預設整塊緩衝，關掉才能逐行看到進度
+    env["PYTHONUNBUFFERED"] = "1"
 
     # 讓 selenium 在 server 上能跑
     if "HEADLESS" not in env:
         env["HEADLESS"] = os.getenv("HEADLESS", "True")
 
-    # 執行
     run_cwd = Path(work_dir) if work_dir else Path.cwd()
-    print(f"[RUN] {PYTHON_BIN} {script} (cwd={run_cwd})")
-    try:
-        proc = subprocess.run(
-            [PYTHON_BIN, script],
-            env=env,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            cwd=str(run_cwd),
-            timeout=SCRIPT_TIMEOUTS.get(kind, 300)
-        )
-        ret_code = proc.returncode
-        stdout = proc.stdout or ""
-        stderr = proc.stderr or ""
-    except subprocess.TimeoutExpired as te:
-        ret_code = 124  # 常見的 timeout 代碼
-        stdout = (te.stdout or "") if hasattr(te, "stdout") else ""
-        stderr = (te.stderr or "") if hasattr(te, "stderr") else ""
-        stderr += "\n[ERROR] 子行程執行逾時，已中止。"
-    # 把標準輸出／錯誤留檔方便除錯（存到使用者資料夾下的 logs/）
-    ts = int(time.time())
-    logs_dir = run_cwd/"logs"
-    logs_dir.mkdir(parents=True, exist_ok=True)
-    out_path = logs_dir/f"{kind}_{ts}.out.txt"
-    err_path = logs_dir/f"{kind}_{ts}.err.txt"
-    out_path.write_text(stdout, encoding="utf-8")
-    err_path.write_text(stderr, encoding="utf-8")
-    print(f"[RET] code={ret_code}")
-    return {"code": ret_code, "out": str(out_path), "err": str(err_path)}
+    run_dir = snapshot.new_run_dir(run_cwd, kind)
+    return script, env, run_cwd, run_dir, SCRIPT_TIMEOUTS.get(kind, 300)
+
+
+def _line_handler(monitor: RunMonitor, job: Optional[Job]):
+    def _on_line(stream: str, line: str) -> bool:
+        if job:
+            job.on_line(stream, line)
+        return monitor.feed(stream, line)
+    return _on_line
+
+
+def _error_code(monitor: RunMonitor, ret_code: int) -> Optional[str]:
+    return monitor.error_code or {0: None, 124: "timeout", CANCELLED_CODE: "cancelled"}.get(ret_code, "unknown")
+
+
+def _finish_script(kind: str, run_cwd: Path, run_dir: Path, monitor: RunMonitor, ret_code: int,
+                   stdout: str, stderr: str, started_at: float) -> Dict[str, Any]:
+    """發佈 run（成功才換 current）、寫日誌，組成 run_script 的回傳值。"""
+    if monitor.error_code == "bad_credentials":
+        ret_code = 2
+    startup_ms = int((monitor.first_event_at - started_at) * 1000) if monitor.first_event_at else None
+    manifest = snapshot.publish_run(run_dir, kind, OUTPUTS.get(kind, []), started_at, time.time(), ret_code)
+    # 標準輸出／錯誤壓縮附加到使用者的日誌區段；診斷訊息趁文字還在記憶體裡先算好存進索引
+    message = None
+    if ret_code == CANCELLED_CODE:
+        message = "查詢已取消。"
+    elif ret_code != 0 or not manifest["ok"]:
+        # 有結構化錯誤就直接查表；整個 run 逾時被中止（爬蟲來不及送錯誤事件）用逾時的訊息；
+        # 都沒有（例如還沒 import 完就掛掉）才退回掃日誌文字
+        message = monitor.message() or (events.ERROR_MESSAGES["timeout"] if ret_code == 124
+                                          else _diagnose_message(stdout, stderr))
+    error_code = monitor.error_code or ("timeout" if ret_code == 124 else None)
+    entry = LogStore(run_cwd).append(run_dir.name, kind, ret_code, stdout, stderr, message=message,
+                                     error=error_code, phases=monitor.phases, counts=monitor.counts,
+                                     retries=monitor.retries,
+                                     mode=RUNNER_MODE, startup_ms=startup_ms)
+    print(f"[RET] code={ret_code} run={run_dir.name} ok={manifest['ok']} mode={RUNNER_MODE} startup={startup_ms}ms")
+    return {
+        "code": ret_code,
+        "ok": ret_code == 0 and manifest["ok"],
+        "run_id": run_dir.name,
+        "manifest": manifest,
+        "message": message,
+        "error": error_code,
+        "phases": monitor.phases,
+        "retries": monitor.retries,
+        "startup_ms": startup_ms,
+        "first_error": (monitor.error or {}).get("message") or entry["first_error"],
+    }
+
+
+def run_session(kinds: List[str], env_override: Dict[str, Any], work_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    同一個學生要好幾種資料時：一個行程、一次登入，各報表在同一個瀏覽器的分頁裡平行執行（tab_session.py）。
+    各類型先建好自己的 run 目錄，session 結束後把各自的輸出搬進去，再逐一發佈（成功才換 current）。
+    只佔一個同時執行名額（一個 Chrome）；逾時取各類型逾時的總和。固定以子行程執行
+    （RUNNER_MODE=asyncio 時一樣交給 event loop 監看，其他模式用 run_process）。
+    回傳 {類型: {"code", "ok", "run_id", "manifest", "message", "error", "seconds"}}。
+    """
+    env = os.environ.copy()
+    env.update({k: str(v) for k, v in env_override.items() if v is not None})
+    env["PYTHONIOENCODING"] = "utf-8"
+    env["PYTHONUNBUFFERED"] = "1"
+    if "HEADLESS" not in env:
+        env["HEADLESS"] = os.getenv("HEADLESS", "True")
+
+    run_dirs = {kind: snapshot.new_run_dir(work_dir, kind) for kind in kinds}
+    session_dir = snapshot.new_run_dir(work_dir, "session")
+    env["SESSION_KINDS"] = ",".join(kinds)
+    env["SESSION_DIRS"] = json.dumps({kind: str(d.resolve()) for kind, d in run_dirs.items()})
+    monitor = RunMonitor()
+    timeout = sum(SCRIPT_TIMEOUTS.get(kind, 300) for kind in kinds)
+    with RUN_SLOTS.slot() as report:
+        started_at = time.time()
+        print(f"[RUN] session {','.join(kinds)} (cwd={session_dir})")
+        launch = async_runner().run if RUNNER_MODE == "asyncio" else run_process
+        ret_code, stdout, stderr = launch([PYTHON_BIN, SESSION_SCRIPT], env=env, cwd=str(session_dir),
+                                          timeout=timeout, on_line=monitor.feed)
+        report(_error_code(monitor, ret_code), monitor.phases, monitor.error_phase)
+    ended_at = time.time()
+    if monitor.error_code == "bad_credentials":
+        ret_code = 2
+    reports = {}
+    results_path = session_dir / "session.json"
+    if results_path.exists():
+        reports = json.loads(results_path.read_text(encoding="utf-8")).get("reports", {})
+    message = None
+    if ret_code != 0:
+        message = monitor.message() or (events.ERROR_MESSAGES["timeout"] if ret_code == 124
+                                          else _diagnose_message(stdout, stderr))
+    error_code = monitor.error_code or ("timeout" if ret_code == 124 else None)
+    LogStore(work_dir).append(session_dir.name, "session", ret_code, stdout, stderr, message=message,
+                              error=error_code, phases=monitor.phases, counts=monitor.counts,
+                              retries=monitor.retries, mode="session")
+    snapshot.prune_runs(session_dir.parent)
+
+    results = {}
+    for kind, run_dir in run_dirs.items():
+        r = reports.get(kind) or {}
+        code = ret_code if ret_code == 2 or not r else (0 if r.get("ok") else 1)
+        manifest = snapshot.publish_run(run_dir, kind, OUTPUTS.get(kind, []), started_at, ended_at, code)
+        results[kind] = {
+            "code": code,
+            "ok": code == 0 and manifest["ok"],
+            "run_id": run_dir.name,
+            "manifest": manifest,
+            "message": r.get("error") if r else message,
+            "error": None if code == 0 else error_code,
+            "seconds": r.get("seconds"),
+        }
+    print(f"[RET] session code={ret_code} run={session_dir.name} "
+          + " ".join(f"{k}={'ok' if v['ok'] else 'fail'}" for k, v in results.items()))
+    return results
 
 
 def _log_contains_login_error(text: str) -> bool:
@@ -150,19 +327,6 @@ def _diagnose_message(out_text: str, err_text: str) -> Optional[str]:
     return None
 
 
-def latest_existing(path_patterns):
-    """
-    回傳符合任一 pattern 的**最新**檔案路徑（找不到回傳 None）
-    """
-    candidates = []
-    for pat in path_patterns:
-        candidates.extend(glob.glob(pat))
-    if not candidates:
-        return None
-    candidates.sort(key=lambda p: Path(p).stat().st_mtime, reverse=True)
-    return candidates[0]
-
-
 def load_csv_safely(path: str) -> pd.DataFrame:
     """
     嘗試用 UTF-8-SIG 讀，失敗就用 UTF-8。
@@ -186,13 +350,134 @@ def filter_df(df: pd.DataFrame, keyword: str) -> pd.DataFrame:
     return df[mask]
 
 
+def current_username() -> Optional[str]:
+    """
+    目前的使用者：優先用 .last_username（上一次查詢的學號），否則用環境中的 SHU_USERNAME。
+    """
+    if LAST_USER_FILE.exists():
+        try:
+            saved = LAST_USER_FILE.read_text(encoding="utf-8").strip()
+            if saved:
+                return saved
+        except Exception:
+            pass
+    return os.getenv("SHU_USERNAME") or None
+
+
+def snapshot_files(kind: str, work_dir: Path) -> List[Path]:
+    """
+    回傳某類型在使用者資料夾下目前的快照檔（讀一次 current 指標）。
+    還沒有 run 目錄的舊資料夾，退回直接放在使用者資料夾下的固定檔名。
+    """
+    manifest = snapshot.current_manifest(work_dir, kind)
+    if manifest:
+        return snapshot.manifest_files(work_dir, manifest)
+    return [work_dir / name for name in OUTPUTS.get(kind, []) if (work_dir / name).exists()]
+
+
+# (path, mtime_ns, size) -> sha256，避免每次輪詢都重算雜湊
+_HASH_CACHE: Dict[Tuple[str, int, int], str] = {}
+
+
+def _file_digest(path: Path) -> str:
+    st = path.stat()
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _HASH_CACHE.get(key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        if len(_HASH_CACHE) > 256:
+            _HASH_CACHE.clear()
+        _HASH_CACHE[key] = digest
+    return digest
+
+
+def snapshot_etag(files: List[Path]) -> str:
+    """以快照檔內容雜湊組出 ETag（內容不變就不變，與 mtime 無關）。"""
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode("utf-8"))
+        h.update(_file_digest(f).encode("ascii"))
+    return h.hexdigest()[:32]
+
+
+# (課表正本路徑, mtime_ns) -> TimetableIndex
+_TIMETABLE_CACHE: Dict[Tuple[str, int], timetable_index.TimetableIndex] = {}
+
+
+def load_timetable_index(work_dir: Path) -> Optional[timetable_index.TimetableIndex]:
+    """目前課表快照的時段索引：讀爬蟲寫好的 timetable_index.json；舊的 run 沒有索引就從 CSV 建一次。"""
+    files = snapshot_files("timetable", work_dir)
+    if not files:
+        return None
+    src = files[0]
+    key = (str(src), src.stat().st_mtime_ns)
+    ix = _TIMETABLE_CACHE.get(key)
+    if ix is None:
+        path = src.with_name(timetable_index.INDEX_FILE)
+        if path.exists():
+            ix = timetable_index.TimetableIndex.load(path)
+        else:
+            ix = timetable_index.TimetableIndex.from_df(snapshot.read_snapshot(src))
+        if len(_TIMETABLE_CACHE) > 64:
+            _TIMETABLE_CACHE.clear()
+        _TIMETABLE_CACHE[key] = ix
+    return ix
+
+
+# (成績正本路徑, mtime_ns) -> 統計結果
+_ANALYTICS_CACHE: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+
+def load_grade_analytics(work_dir: Path) -> Optional[Dict[str, Any]]:
+    """目前成績快照的統計：讀爬蟲算好的 grades_analytics.json；舊的 run 沒有就從兩份 CSV 算一次。"""
+    files = snapshot_files("grades", work_dir)
+    if not files:
+        return None
+    src = files[0]
+    key = (str(src), src.stat().st_mtime_ns)
+    result = _ANALYTICS_CACHE.get(key)
+    if result is None:
+        path = src.with_name(grade_analytics.ANALYTICS_FILE)
+        if path.exists():
+            result = grade_analytics.load_analytics(path)
+        else:
+            summary = snapshot.read_snapshot(files[1]) if len(files) > 1 else None
+            result = grade_analytics.compute(snapshot.read_snapshot(src), summary)
+        if len(_ANALYTICS_CACHE) > 64:
+            _ANALYTICS_CACHE.clear()
+        _ANALYTICS_CACHE[key] = result
+    return result
+
+
+def _not_modified(etag: str, last_modified: datetime) -> bool:
+    """依 If-None-Match / If-Modified-Since 判斷能否回 304（If-None-Match 優先）。"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    ims = request.if_modified_since
+    return bool(ims and last_modified.replace(microsecond=0) <= ims)
+
+
+def _flash_run_failure(res: Dict[str, Any], work_dir: Path, title: str) -> None:
+    """以 run_script 算好的診斷訊息／第一行錯誤提示使用者（不再回讀日誌檔）。"""
+    if res.get("message"):
+        flash(res["message"], "danger")
+        return
+    first_err = res.get("first_error")
+    hint = f"（{first_err}）" if first_err else ""
+    log_url = url_for("run_log", user=work_dir.name, run_id=res.get("run_id", ""))
+    flash(f"{title}，請查看日誌 {log_url} {hint}", "danger")
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("home.html")
 
 
-@app.route("/query", methods=["POST"])
-def query():
+def _prepare_query():
+    """
+    處理查詢表單：決定類型、帳密與使用者資料夾（必要時更新 .env）。
+    成功回傳 (kind, keyword, user, pwd, work_dir)；表單有問題時回傳要給前端的 redirect。
+    """
     kind = request.form.get("kind")  # timetable / grades / ranking / attendance
     keyword = request.form.get("keyword", "").strip()
 
@@ -229,13 +514,7 @@ def query():
     # 2) 沒填學號 -> 若存在上一次學號則沿用；否則用環境中的學號
     effective_user = user
     if not form_user:
-        if LAST_USER_FILE.exists():
-            try:
-                saved = LAST_USER_FILE.read_text(encoding="utf-8").strip()
-                if saved:
-                    effective_user = saved
-            except Exception:
-                pass
+        effective_user = current_username() or user
     else:
         try:
             LAST_USER_FILE.write_text(str(user), encoding="utf-8")
@@ -251,26 +530,16 @@ def query():
         flash("需要 SHU_USERNAME / SHU_PASSWORD 才能執行爬蟲")
         return redirect(url_for("index"))
 
-    res = run_script(kind, {"SHU_USERNAME": user, "SHU_PASSWORD": pwd}, work_dir=work_dir)
+    return kind, keyword, user, pwd, work_dir
+
+
+def _render_query_result(kind: str, keyword: str, work_dir: Path, res: Dict[str, Any]):
+    """依 run_script 的結果顯示表格，或帶著錯誤訊息回首頁。"""
     if res.get("code") != 0:
         if res.get("code") == 2:
             flash("學號或密碼錯誤，請重新輸入。", "danger")
             return redirect(url_for("index"))
-        # 嘗試讀取輸出來判斷是否為登入錯誤
-        try:
-            out_text = Path(res.get("out", "")).read_text(encoding="utf-8", errors="ignore") if res.get("out") else ""
-            err_text = Path(res.get("err", "")).read_text(encoding="utf-8", errors="ignore") if res.get("err") else ""
-        except Exception:
-            out_text = err_text = ""
-
-        msg = _diagnose_message(out_text, err_text)
-        if msg:
-            flash(msg, "danger")
-        else:
-            # 顯示錯誤檔首行協助判讀
-            first_err = (err_text or out_text or "").strip().splitlines()[:1]
-            hint = f"（{first_err[0]}）" if first_err else ""
-            flash(f"爬蟲執行失敗，請到 logs/ 夾查看 out/err 記錄 {hint}", "danger")
+        _flash_run_failure(res, work_dir, "爬蟲執行失敗")
         return redirect(url_for("index"))
 
     # 決定要讀哪個 CSV
@@ -280,29 +549,13 @@ def query():
         return redirect(url_for("index"))
 
     # 歷年成績有兩份 CSV：課程與彙總，優先顯示課程
-    # 在使用者工作目錄底下找最新輸出
-    user_patterns = [str((work_dir / Path(p)).as_posix()) for p in outputs]
-    csv_path = latest_existing(user_patterns)
+    # 只認這次 run 的 manifest：失敗的 run 不會拿舊檔冒充新結果
+    manifest = res.get("manifest") or {}
+    files = snapshot.manifest_files(work_dir, manifest) if manifest.get("ok") else []
+    csv_path = str(files[0]) if files else None
     if not csv_path:
         # 沒有產生 CSV，也檢查是否為登入錯誤
-        try:
-            out_text = Path(res.get("out", "")).read_text(encoding="utf-8", errors="ignore") if res.get("out") else ""
-            err_text = Path(res.get("err", "")).read_text(encoding="utf-8", errors="ignore") if res.get("err") else ""
-        except Exception:
-            out_text = err_text = ""
-
-        msg = _diagnose_message(out_text, err_text)
-        if msg:
-            flash(msg, "danger")
-        else:
-            # 顯示錯誤檔路徑，方便點開
-            err_hint = res.get("err") or res.get("out")
-            if err_hint:
-                first_err = (err_text or out_text or "").strip().splitlines()[:1]
-                hint = f"（{first_err[0]}）" if first_err else ""
-                flash(f"找不到對應的輸出 CSV；請查看日誌：{err_hint} {hint}", "danger")
-            else:
-                flash("找不到對應的輸出 CSV，請先執行一次爬蟲或確認檔名", "danger")
+        _flash_run_failure(res, work_dir, "找不到對應的輸出 CSV")
         return redirect(url_for("index"))
 
     df = load_csv_safely(csv_path)
@@ -313,18 +566,346 @@ def query():
     cols = [c for c in pref if c in df.columns]
     view_df = df[cols] if cols else df
 
+    # 課表另外畫一份週課表（由時段索引產生，不用截圖）
+    grid = None
+    if kind == "timetable":
+        ix = load_timetable_index(work_dir)
+        grid = ix.grid() if ix else None
+    # 成績另外顯示各學期 / 累計統計（爬蟲算好存著，不在這裡重算）
+    analytics = load_grade_analytics(work_dir) if kind == "grades" else None
+
     # 把目前顯示的 CSV 檔名也帶回前端（給下載）
     return render_template(
         "home.html",
         result_table=view_df.to_html(index=False, classes="table table-striped table-hover"),
         csv_path=csv_path,
         kind=kind,
-        keyword=keyword
+        keyword=keyword,
+        timetable_grid=grid,
+        analytics=analytics,
     )
 
 
+@app.route("/query", methods=["POST"])
+def query():
+    prepared = _prepare_query()
+    if not isinstance(prepared, tuple):
+        return prepared
+    kind, keyword, user, pwd, work_dir = prepared
+    res = run_script(kind, {"SHU_USERNAME": user, "SHU_PASSWORD": pwd}, work_dir=work_dir)
+    return _render_query_result(kind, keyword, work_dir, res)
+
+
+@app.route("/query/start", methods=["POST"])
+def query_start():
+    """背景執行爬蟲，立即回傳 job id；進度由 /jobs/<id>/events（SSE）推送。"""
+    prepared = _prepare_query()
+    if not isinstance(prepared, tuple):
+        return jsonify({"error": "表單資料不完整", "redirect": prepared.location}), 400
+    kind, keyword, user, pwd, work_dir = prepared
+    env_override = {"SHU_USERNAME": user, "SHU_PASSWORD": pwd}
+    if RUNNER_MODE == "asyncio":
+        # 整個 job 排進 event loop，結束時 done callback 收尾：排隊、執行中都不佔 thread
+        job = start_async_job(kind, work_dir.name, lambda j: run_script_async(kind, env_override, work_dir, j))
+    else:
+        job = start_job(kind, work_dir.name, lambda j: run_script(kind, env_override, work_dir=work_dir, job=j))
+    return jsonify({
+        "job_id": job.id,
+        "events": url_for("job_events", job_id=job.id),
+        "cancel": url_for("job_cancel", job_id=job.id),
+        "result": url_for("job_result", job_id=job.id, keyword=keyword),
+    })
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id: str):
+    """Server-Sent Events：log / phase / done；支援 Last-Event-ID 斷線續傳。"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "找不到這個工作"}), 404
+    try:
+        start = int(request.headers.get("Last-Event-ID", "-1")) + 1
+    except ValueError:
+        start = 0
+
+    def _stream():
+        yield "retry: 2000\n\n"
+        for idx, event, data in job.iter_events(start):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {idx}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    resp = Response(_stream(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # 反向代理（nginx）不要緩衝
+    return resp
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id: str):
+    """取消執行中的查詢：子行程會被中止，這次 run 不會成為正本。"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "找不到這個工作"}), 404
+    return jsonify({"cancelled": job.cancel()})
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        flash("查詢工作已過期，請重新查詢", "warning")
+        return redirect(url_for("index"))
+    res = job.wait()
+    return _render_query_result(job.kind, request.args.get("keyword", ""), DATA_ROOT / job.user, res)
+
+
+@app.route("/api/<kind>")
+def api_snapshot(kind: str):
+    """
+    以 JSON 回傳目前使用者某類型的快照。
+    帶 ETag（內容雜湊）與 Last-Modified，沒變就回 304；回應較大時依 Accept-Encoding 以 gzip 壓縮。
+    """
+    if kind not in OUTPUTS:
+        return jsonify({"error": f"未知的類型：{kind}"}), 404
+    user = current_username()
+    if not user:
+        return jsonify({"error": "尚未設定使用者（SHU_USERNAME）"}), 404
+    files = snapshot_files(kind, DATA_ROOT / user)
+    if not files:
+        return jsonify({"error": f"{user} 尚無 {kind} 的資料，請先查詢一次"}), 404
+
+    etag = snapshot_etag(files)
+    mtime = max(f.stat().st_mtime for f in files)
+    last_modified = datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+    if _not_modified(etag, last_modified):
+        resp = Response(status=304)
+    else:
+        data = {}
+        for f in files:
+            df = snapshot.read_snapshot(f)
+            data[f.stem] = json.loads(df.to_json(orient="records", force_ascii=False))
+        payload = {
+            "kind": kind,
+            "user": user,
+            "updated_at": last_modified.isoformat(),
+            "data": data,
+        }
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        resp = Response(body, mimetype="application/json")
+        if len(body) >= API_GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+            resp.set_data(gzip.compress(body, compresslevel=6))
+            resp.headers["Content-Encoding"] = "gzip"
+
+    # gzip 與否是同一份資料的不同表示，所以用 weak ETag
+    resp.set_etag(etag, weak=True)
+    resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def export_file(src: Path, fmt: str, work_dir: Path) -> Path:
+    """
+    取得正本快照 src 的 fmt 格式匯出檔。
+    以正本內容雜湊為快取 key 存在 <使用者資料夾>/.exports/，內容沒變就直接重用（跨 run 也一樣），不重算 XLSX。
+    """
+    digest = _file_digest(src)[:16]
+    cache_dir = work_dir / ".exports"
+    cache_dir.mkdir(exist_ok=True)
+    target = cache_dir / f"{src.stem}.{digest}.{fmt}"
+    if not target.exists():
+        data = snapshot.export_bytes(src, fmt)
+        # 每個請求各寫自己的暫存檔再換上去：同時下載同一份不會互相覆寫到一半的檔案
+        with tempfile.NamedTemporaryFile(dir=cache_dir, prefix=target.name + ".", suffix=".tmp",
+                                         delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, target)
+        except OSError:
+            os.unlink(f.name)
+            raise
+        # 同一份快照的舊版本匯出檔已無用，順手清掉
+        for old in cache_dir.glob(f"{src.stem}.*.{fmt}"):
+            if old != target:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+    return target
+
+
+class _ZipStream:
+    """給 zipfile 寫入的不可 seek 串流；每寫完一個檔就把累積的 bytes 交給 generator 送出。"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_bundle(user: str, work_dir: Path):
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for kind in OUTPUTS:
+            for src in snapshot_files(kind, work_dir):
+                for fmt in snapshot.EXPORT_FORMATS:
+                    zf.write(export_file(src, fmt, work_dir), arcname=f"{user}/{kind}/{src.stem}.{fmt}")
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _timetable_for_request():
+    """(TimetableIndex, weeks, None) 或 (None, None, 錯誤回應)。"""
+    user = current_username()
+    if not user:
+        return None, None, (jsonify({"error": "尚未設定使用者（SHU_USERNAME）"}), 404)
+    ix = load_timetable_index(DATA_ROOT / user)
+    if ix is None:
+        return None, None, (jsonify({"error": f"{user} 尚無課表資料，請先查詢一次"}), 404)
+    weeks = request.args.get("weeks", "all")
+    if weeks not in timetable_index.WEEK_KINDS:
+        return None, None, (jsonify({"error": "weeks 只能是 all / odd / even"}), 400)
+    return ix, weeks, None
+
+
+@app.route("/changes")
+def changes():
+    """
+    快照的變動紀錄（每次發佈新的正本時與上一版逐列比對，見 snapshot_diff）。
+    ?kind=grades&since=<seq>&limit=50 → 該類型 seq 大於 since 的紀錄；用戶端記住最後的 seq，之後只拉增量。
+    只保留最近 CHANGES_KEEP 筆：since 比 oldest（保留的最舊 seq）還舊時 truncated=true，
+    表示中間有紀錄已經刪掉，用戶端要重新抓整份快照（/api/<kind>），再從 latest 接著拉。
+    不帶 kind → 各類型目前最新的 seq，用來判斷哪些類型需要拉。
+    """
+    user = current_username()
+    if not user:
+        return jsonify({"error": "尚未設定使用者（SHU_USERNAME）"}), 404
+    runs_dir = DATA_ROOT / user / snapshot.RUNS_DIRNAME
+    kind = request.args.get("kind")
+    if not kind:
+        return jsonify({"user": user, "latest": {k: snapshot_diff.latest_seq(runs_dir / k) for k in OUTPUTS}})
+    if kind not in OUTPUTS:
+        return jsonify({"error": f"未知的類型：{kind}"}), 404
+    since = request.args.get("since", 0, type=int)
+    limit = max(1, min(request.args.get("limit", 50, type=int), snapshot_diff.CHANGES_KEEP))
+    records = snapshot_diff.read_changes(runs_dir / kind, since, limit)
+    return jsonify({
+        "user": user,
+        "kind": kind,
+        "latest": snapshot_diff.latest_seq(runs_dir / kind),
+        "oldest": snapshot_diff.oldest_seq(runs_dir / kind),
+        "truncated": snapshot_diff.is_truncated(runs_dir / kind, since),
+        "changes": records,
+    })
+
+
+@app.route("/api/grades/analytics")
+def api_grade_analytics():
+    """各學期 / 累計加權平均、GPA、依選別的學分統計。"""
+    user = current_username()
+    if not user:
+        return jsonify({"error": "尚未設定使用者（SHU_USERNAME）"}), 404
+    result = load_grade_analytics(DATA_ROOT / user)
+    if result is None:
+        return jsonify({"error": f"{user} 尚無成績資料，請先查詢一次"}), 404
+    return jsonify({"user": user, **result})
+
+
+@app.route("/api/timetable/slots")
+def api_timetable_slots():
+    """某一格的課：?day=2&period=3[&weeks=odd]"""
+    ix, weeks, err = _timetable_for_request()
+    if err:
+        return err
+    day = request.args.get("day", type=int)
+    period = timetable_index.period_code(request.args.get("period", ""))
+    if not day or not 1 <= day <= 7 or not period:
+        return jsonify({"error": "需要 day（1-7）與 period（1-14 或 A-E）"}), 400
+    return jsonify({"day": day, "period": period, "weeks": weeks, "free": ix.is_free(day, period, weeks),
+                    "courses": ix.at(day, period, weeks)})
+
+
+@app.route("/api/timetable/free")
+def api_timetable_free():
+    """空堂：?day=3（省略 = 星期一到五）[&weeks=even]"""
+    ix, weeks, err = _timetable_for_request()
+    if err:
+        return err
+    day = request.args.get("day", type=int)
+    if day is not None and not 1 <= day <= 7:
+        return jsonify({"error": "day 需為 1-7"}), 400
+    return jsonify({"weeks": weeks, "free": ix.free(day, weeks)})
+
+
+@app.route("/api/timetable/conflicts")
+def api_timetable_conflicts():
+    """衝堂（同一格、週別重疊的課程）。"""
+    ix, _, err = _timetable_for_request()
+    if err:
+        return err
+    return jsonify({"conflicts": ix.conflicts()})
+
+
+@app.route("/timetable/grid")
+def timetable_grid():
+    """週課表（由時段索引畫成表格）。"""
+    user = current_username()
+    ix = load_timetable_index(DATA_ROOT / user) if user else None
+    if ix is None:
+        flash("尚無課表資料，請先查詢一次", "warning")
+        return redirect(url_for("index"))
+    return render_template("home.html", kind="timetable", timetable_grid=ix.grid())
+
+
+@app.route("/status")
+def status():
+    """執行狀態：目前的執行模式、同時執行數控制（AIMD）與各步驟選擇器的命中情況。"""
+    return jsonify({"runner_mode": RUNNER_MODE, "limiter": RUN_SLOTS.stats(),
+                    "async": async_runner().stats() if RUNNER_MODE == "asyncio" else None,
+                    "selectors": selector_registry.stats()})
+
+
+@app.route("/logs/<user>/<run_id>")
+def run_log(user: str, run_id: str):
+    """顯示單次 run 的 stdout/stderr（只解壓該 run 的那一段）。"""
+    got = LogStore(DATA_ROOT / Path(user).name).read(run_id)
+    if got is None:
+        return "找不到這次執行的日誌", 404
+    out_text, err_text = got
+    body = f"===== stdout =====\n{out_text}\n===== stderr =====\n{err_text}"
+    return Response(body, mimetype="text/plain; charset=utf-8")
+
+
 @app.route("/download")
 def download():
+    # 新版：?kind=ranking&fmt=xlsx → 從目前使用者的正本快照產生（有快取）
+    kind = request.args.get("kind")
+    if kind:
+        fmt = request.args.get("fmt", "csv")
+        user = current_username()
+        files = snapshot_files(kind, DATA_ROOT / user) if user else []
+        if fmt not in snapshot.EXPORT_FORMATS or not files:
+            flash("檔案不存在")
+            return redirect(url_for("index"))
+        # 成績有兩份快照，可用 ?name=grades_summary_fixed 指定
+        name = request.args.get("name")
+        src = next((f for f in files if f.stem == name), files[0])
+        return send_file(export_file(src, fmt, DATA_ROOT / user), as_attachment=True,
+                         download_name=f"{src.stem}.{fmt}", mimetype=snapshot.EXPORT_MIMETYPES[fmt])
+
     path = request.args.get("path")
     if not path or not Path(path).exists():
         flash("檔案不存在")
@@ -333,6 +914,43 @@ def download():
     return send_file(path, as_attachment=True)
 
 
+@app.route("/download/bundle")
+def download_bundle():
+    """把目前使用者所有類型、所有格式打包成 zip，邊產生邊串流送出。"""
+    user = current_username()
+    if not user or not (DATA_ROOT / user).exists():
+        flash("檔案不存在")
+        return redirect(url_for("index"))
+    resp = Response(_zip_bundle(user, DATA_ROOT / user), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f"attachment; filename={user}_snapshots.zip"
+    return resp
+
+
+_BACKGROUND_STARTED = False
+
+
+def start_background() -> None:
+    """
+    在實際服務請求的行程裡預先啟動 worker / forkserver，並在 SCHEDULER_ENABLED=1 時啟動排程。
+    排程跑在同一個行程，才會和網頁查詢共用 RUN_SLOTS。
+    python app.py 由 reloader 的子行程呼叫；gunicorn 由 gunicorn.conf.py 的 post_worker_init 呼叫。
+    """
+    global _BACKGROUND_STARTED
+    if _BACKGROUND_STARTED:
+        return
+    _BACKGROUND_STARTED = True
+    if RUNNER_MODE == "worker":
+        worker_pool(PYTHON_BIN)
+    elif RUNNER_MODE == "forkserver":
+        fork_server(PYTHON_BIN)
+    if os.getenv("SCHEDULER_ENABLED") == "1":
+        from scheduler import Scheduler
+        Scheduler(run_script, DATA_ROOT).start()
+
+
 if __name__ == "__main__":
     # python app.py
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # debug 的 reloader 會多一個監看行程；只在實際服務的行程啟動
+        start_background()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=True)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+多帳號批次更新（命令列）
+    python batch.py roster.csv [--workers N] [--kinds ranking,grades] [--state 檔案] [--fresh] [--session]
+
+- roster.csv：username,password,kinds（kinds 可留空 = 全部類型，多個以 ; 分隔；# 開頭的行略過）
+- 每個 (帳號, 類型) 是一個 job，透過 app.run_script 執行 → 結果寫進既有的 data/<帳號>/runs/... 與日誌
+- 同時執行的 job 數依 CPU 核心數與可用記憶體估算（每個 job 都會開一個 Chrome），可用 --workers 覆寫
+- --session：同一個帳號的所有類型合成一個 job，透過 app.run_session 一次登入、各報表分頁平行執行
+- 每完成一個 job 就附加一行到狀態檔（預設 <roster>.state.jsonl，不含密碼）；
+  中斷後再執行同一份 roster 會跳過已成功的 job（--fresh 從頭來）
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+# 每個 job（爬蟲行程 + Chrome）大約要用的記憶體
+JOB_MEMORY_MB = int(os.getenv("BATCH_JOB_MEMORY_MB", "600"))
+
+
+def _available_memory_mb() -> Optional[int]:
+    """可用記憶體（MB）；讀不到時回傳 None。"""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_workers() -> int:
+    """同時執行數 = min(CPU 核心數, 可用記憶體 / JOB_MEMORY_MB)，至少 1。"""
+    cores = os.cpu_count() or 1
+    mem = _available_memory_mb()
+    by_mem = mem // JOB_MEMORY_MB if mem else cores
+    return max(1, min(cores, by_mem))
+
+
+def read_roster(path: Path, all_kinds: List[str], only: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """讀名單，展開成 job 清單：[{"username", "password", "kind"}, ...]。"""
+    jobs = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = csv.DictReader(line for line in f if line.strip() and not line.lstrip().startswith("#"))
+        for row in rows:
+            user = (row.get("username") or "").strip()
+            pwd = (row.get("password") or "").strip()
+            if not user or not pwd:
+                print(f"⚠️ 名單缺少帳號或密碼，略過：{user or row}")
+                continue
+            kinds = [k.strip() for k in (row.get("kinds") or "").split(";") if k.strip()] or list(all_kinds)
+            for kind in kinds:
+                if kind not in all_kinds:
+                    print(f"⚠️ 不支援的類型 {kind}（{user}），略過")
+                    continue
+                if only and kind not in only:
+                    continue
+                jobs.append({"username": user, "password": pwd, "kind": kind})
+    return jobs
+
+
+def load_done(state_path: Path) -> Set[Tuple[str, str]]:
+    """狀態檔中已成功的 (帳號, 類型)。"""
+    done = set()
+    if not state_path.exists():
+        return done
+    with open(state_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("ok"):
+                done.add((rec["username"], rec["kind"]))
+    return done
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="多帳號批次更新快照")
+    parser.add_argument("roster", type=Path, help="名單 CSV：username,password,kinds")
+    parser.add_argument("--workers", type=int, default=0, help="同時執行數（預設依 CPU 與記憶體估算）")
+    parser.add_argument("--kinds", default="", help="只跑這些類型，以逗號分隔")
+    parser.add_argument("--state", type=Path, default=None, help="狀態檔（預設 <roster>.state.jsonl）")
+    parser.add_argument("--fresh", action="store_true", help="忽略狀態檔，全部重跑")
+    parser.add_argument("--session", action="store_true", help="同一帳號的類型一次登入、分頁平行執行")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or default_workers()
+    # 全域名額與 worker 模式的 pool 大小跟批次的同時執行數一致（要在 import app/runner 之前設定）
+    os.environ.setdefault("MAX_CONCURRENT_RUNS", str(workers))
+    os.environ.setdefault("RUNNER_WORKERS", str(workers))
+    from app import SCRIPTS, DATA_ROOT, run_script, run_session
+
+    only = {k.strip() for k in args.kinds.split(",") if k.strip()} or None
+    jobs = read_roster(args.roster, list(SCRIPTS), only)
+    state_path = args.state or args.roster.with_name(args.roster.name + ".state.jsonl")
+    if args.fresh and state_path.exists():
+        state_path.unlink()
+    done = load_done(state_path)
+    pending = [j for j in jobs if (j["username"], j["kind"]) not in done]
+    print(f"📋 名單 {len(jobs)} 個 job，已完成 {len(jobs) - len(pending)}，本次執行 {len(pending)}（同時 {workers} 個）")
+
+    state_lock = threading.Lock()
+    per_user: Dict[str, Dict[str, str]] = {}
+
+    def _record(job: Dict[str, Any], res: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+        return {
+            "username": job["username"],
+            "kind": job["kind"],
+            "ok": bool(res.get("ok")),
+            "code": res.get("code"),
+            "run_id": res.get("run_id"),
+            "error": res.get("error"),
+            "message": res.get("message"),
+            "seconds": round(seconds, 1),
+            "ts": int(time.time()),
+        }
+
+    def _run(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        work_dir = DATA_ROOT / job["username"]
+        work_dir.mkdir(parents=True, exist_ok=True)
+        env = {"SHU_USERNAME": job["username"], "SHU_PASSWORD": job["password"]}
+        t0 = time.time()
+        if "kinds" in job:
+            try:
+                results = run_session(job["kinds"], env, work_dir)
+            except Exception as e:
+                results = {k: {"code": 1, "ok": False, "message": f"執行失敗：{e}"} for k in job["kinds"]}
+            seconds = time.time() - t0
+            return [_record({**job, "kind": k}, res, seconds) for k, res in results.items()]
+        try:
+            res = run_script(job["kind"], env, work_dir=work_dir)
+        except Exception as e:
+            res = {"code": 1, "ok": False, "message": f"執行失敗：{e}"}
+        return [_record(job, res, time.time() - t0)]
+
+    if args.session:
+        # 同一帳號的待跑類型合成一個 job（保持名單順序）
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for j in pending:
+            grouped.setdefault(j["username"], {"username": j["username"], "password": j["password"],
+                                               "kinds": []})["kinds"].append(j["kind"])
+        units: List[Dict[str, Any]] = list(grouped.values())
+    else:
+        units = pending
+
+    started = time.time()
+    ok_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run, u) for u in units]
+        for fut in as_completed(futures):
+            for rec in fut.result():
+                with state_lock:
+                    with open(state_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                per_user.setdefault(rec["username"], {})[rec["kind"]] = "✅" if rec["ok"] else "❌"
+                ok_count += rec["ok"]
+                mark = "✅" if rec["ok"] else "❌"
+                if rec["ok"]:
+                    detail = ""
+                elif rec["message"] or rec["error"]:
+                    detail = f"：{rec['message'] or rec['error']}"
+                else:
+                    detail = "：未產生快照" if rec["code"] == 0 else f"：exit code {rec['code']}"
+                print(f"{mark} {rec['username']} {rec['kind']}（{rec['seconds']} 秒）{detail}")
+
+    elapsed = time.time() - started
+    print("\n📊 各帳號結果：")
+    for user in sorted(per_user):
+        print(f"   {user}: " + "  ".join(f"{k}{m}" for k, m in sorted(per_user[user].items())))
+    rate = len(pending) / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"\n⏱️ 完成 {len(pending)} 個 job（成功 {ok_count}、失敗 {len(pending) - ok_count}），"
+          f"耗時 {elapsed:.1f} 秒，吞吐量 {rate:.1f} job/分鐘")
+    return 0 if ok_count == len(pending) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 設定（render.yaml / Dockerfile 的啟動指令都用這份）
+- 查詢工作（JOBS）、同時執行數控制（RUN_SLOTS）、event loop 都在行程記憶體裡 → 只開一個 worker 行程，
+  SSE 與 /jobs/<id>/result 才會找到同一個 job
+- gthread：每個請求一條 thread；爬蟲交給 RUNNER_MODE=asyncio 的 event loop 監看，
+  慢的查詢不會卡住其他使用者看快取結果
+- thread 上限：/query/start 的 job 本身不佔請求 thread（asyncio 模式排在 event loop 上，其他模式是 job 自己的 thread），
+  但每個開著進度的瀏覽器都有一條 SSE（/jobs/<id>/events）從排隊到結束一直佔著，同步的 /query 則整段執行都佔著；
+  所以同時「排隊 + 執行中」的查詢最多約 WEB_THREADS - WEB_RESERVED_THREADS 個，再多的請求要等 thread 空出來。
+  預設依 MAX_CONCURRENT_RUNS 算：執行中的加上最多三倍在排隊的，另外留 WEB_RESERVED_THREADS 條給一般頁面與 API
+- post_worker_init：worker 行程起來後啟動 worker pool / forkserver 與排程（SCHEDULER_ENABLED=1），
+  排程和網頁查詢在同一個行程、共用同一個 RUN_SLOTS；workers 要維持 1，否則排程會跑好幾份
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from runner import MAX_CONCURRENT_RUNS  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = 1
+worker_class = "gthread"
+WEB_RESERVED_THREADS = int(os.getenv("WEB_RESERVED_THREADS", "16"))
+threads = int(os.getenv("WEB_THREADS", str(MAX_CONCURRENT_RUNS * 4 + WEB_RESERVED_THREADS)))
+# gthread 的 timeout 是 worker 心跳，不是單一請求的時限（同步的 /query 可能跑好幾分鐘）
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    from app import start_background
+    start_background()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+每位使用者的執行日誌
+- 每次 run 的 stdout/stderr 以一個 gzip member 附加到 logs/runs-NNNN.log.gz（gzip 允許多個 member 串接）
+- 區段超過 LOG_SEGMENT_BYTES 就換下一個檔（rotate）
+- logs/index.jsonl 一行一筆 run：run_id、區段、位移、長度、exit code、第一行錯誤…
+  → 失敗時的提示直接查索引，不必再把整份日誌讀回來
+- 依 LOG_MAX_AGE_DAYS / LOG_MAX_BYTES 刪掉最舊的區段，索引同步移除
+"""
+
+import os
+import gzip
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl  # 多個行程（app、batch、排程）同時寫同一個使用者的日誌時排隊（Windows 沒有，就只靠行程內的鎖）
+except ImportError:
+    fcntl = None
+
+LOG_SEGMENT_BYTES = int(os.getenv("LOG_SEGMENT_BYTES", str(1024 * 1024)))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_MAX_AGE_DAYS = float(os.getenv("LOG_MAX_AGE_DAYS", "30"))
+
+INDEX_FILE = "index.jsonl"
+
+# 同一個 logs/ 目錄的寫入要排隊（位移計算與 rotate 不能交錯）：行程內的鎖 + 旁邊的 .lock 檔 flock
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+@contextmanager
+def _locked(log_dir: Path):
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(str(log_dir.absolute()), threading.Lock())
+    with lock:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        with open(log_dir / (INDEX_FILE + ".lock"), "w") as lf:
+            if fcntl:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            yield
+
+
+def first_line(*texts: str) -> str:
+    """第一個非空白行（先看 stderr 再看 stdout）。"""
+    for text in texts:
+        for line in (text or "").splitlines():
+            if line.strip():
+                return line.strip()[:300]
+    return ""
+
+
+class LogStore:
+    def __init__(self, user_dir: Path):
+        self.dir = Path(user_dir) / "logs"
+        self.index_path = self.dir / INDEX_FILE
+
+    # ---------- 寫入 ----------
+    def _segments(self) -> List[Path]:
+        return sorted(self.dir.glob("runs-*.log.gz"))
+
+    def _active_segment(self) -> Path:
+        segments = self._segments()
+        if segments and segments[-1].stat().st_size < LOG_SEGMENT_BYTES:
+            return segments[-1]
+        seq = int(segments[-1].name[5:9]) + 1 if segments else 1
+        return self.dir / f"runs-{seq:04d}.log.gz"
+
+    def append(self, run_id: str, kind: str, code: int, stdout: str, stderr: str,
+               **extra: Any) -> Dict[str, Any]:
+        """把一次 run 的輸出壓縮附加到目前區段，並寫一筆索引；回傳索引內容。"""
+        payload = json.dumps({"out": stdout or "", "err": stderr or ""}, ensure_ascii=False).encode("utf-8")
+        blob = gzip.compress(payload, compresslevel=6)
+        with _locked(self.dir):
+            segment = self._active_segment()
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                f.write(blob)
+            entry = {
+                "run_id": run_id,
+                "kind": kind,
+                "ts": int(time.time()),
+                "code": code,
+                "segment": segment.name,
+                "offset": offset,
+                "length": len(blob),
+                "first_error": first_line(stderr, stdout),
+                **extra,
+            }
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._enforce_retention()
+        return entry
+
+    # ---------- 查詢 ----------
+    def entries(self) -> List[Dict[str, Any]]:
+        if not self.index_path.exists():
+            return []
+        out = []
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue
+        return out
+
+    def entry(self, run_id: str) -> Optional[Dict[str, Any]]:
+        for e in reversed(self.entries()):
+            if e.get("run_id") == run_id:
+                return e
+        return None
+
+    def first_error(self, run_id: str) -> str:
+        e = self.entry(run_id)
+        return e.get("first_error", "") if e else ""
+
+    def read(self, run_id: str) -> Optional[Tuple[str, str]]:
+        """只讀該 run 自己的 gzip member（seek 到位移），回傳 (stdout, stderr)。"""
+        e = self.entry(run_id)
+        if not e:
+            return None
+        try:
+            with open(self.dir / e["segment"], "rb") as f:
+                f.seek(e["offset"])
+                blob = f.read(e["length"])
+        except OSError:
+            return None
+        payload = json.loads(gzip.decompress(blob).decode("utf-8"))
+        return payload.get("out", ""), payload.get("err", "")
+
+    # ---------- 保留策略 ----------
+    def _enforce_retention(self) -> None:
+        segments = self._segments()
+        if len(segments) <= 1:
+            return
+        # 最新的區段（正在寫的）一律保留
+        cutoff = time.time() - LOG_MAX_AGE_DAYS * 86400
+        total = sum(p.stat().st_size for p in segments)
+        removed = set()
+        for seg in segments[:-1]:
+            st = seg.stat()
+            if st.st_mtime < cutoff or total > LOG_MAX_BYTES:
+                try:
+                    seg.unlink()
+                except OSError:
+                    continue
+                total -= st.st_size
+                removed.add(seg.name)
+        if removed:
+            kept = [e for e in self.entries() if e.get("segment") not in removed]
+            tmp = self.index_path.with_name(INDEX_FILE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in kept:
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.index_path)
@@ -0,0 +1,911 @@
+# -*- coding: utf-8 -*-
+"""
+子行程執行 + 即時進度
+- run_process：以 Popen 啟動爬蟲，兩條 reader thread 逐行讀 stdout/stderr，每行即時丟給 on_line
+- AdaptiveLimiter：所有爬蟲共用的同時執行數（AIMD），校務系統逾時／變慢就減半並 backoff
+- RunMonitor：解析爬蟲送出的結構化事件（Mainreptile/events.py），遇到 fatal error 就請 run_process 提早收掉子行程
+- AsyncRunner：RUNNER_MODE=asyncio 時所有子行程由同一條 event loop thread 監看（asyncio.create_subprocess_exec），
+  不再每個 job 兩條 reader thread；逾時、fatal error、取消都在 loop 裡處理，一個行程可同時盯很多個爬蟲
+- WorkerPool：RUNNER_MODE=worker 時預先啟動的 worker.py 行程（已 import 好 pandas / selenium），
+  每個 job 直接在 worker 裡呼叫爬蟲的 run()，省掉每次開新直譯器與 import 的時間
+- ForkServer：RUNNER_MODE=forkserver 時的 zygote.py，每個 job 從已 import 好的行程 fork 出來
+- Job：一次查詢的進度事件序列；網頁透過 SSE（/jobs/<id>/events）邊跑邊收，
+  爬蟲本身在背景 thread 執行，不會卡住處理請求的 worker
+"""
+
+import os
+import sys
+import json
+import asyncio
+import uuid
+import queue
+import signal
+import socket
+import time
+import threading
+import subprocess
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+sys.path.insert(0, str((Path(__file__).parent / "Mainreptile").resolve()))
+import events  # noqa: E402
+
+# 各階段在進度條上的說明
+PHASE_LABELS = {
+    "driver": "啟動瀏覽器",
+    "portal": "進入學生教務系統",
+    "login":  "登入",
+    "menu":   "開啟查詢頁面",
+    "query":  "送出查詢",
+    "parse":  "解析資料",
+    "lazy_load": "等待資料載入",
+    "export": "保存資料",
+    "detail": "查詢缺勤明細",
+    "screenshot": "截圖課表",
+}
+
+# 收到 fatal error 後給子行程自己收尾（關瀏覽器）的秒數，逾時才強制結束
+FATAL_GRACE_SECONDS = float(os.getenv("FATAL_GRACE_SECONDS", "5"))
+
+# subprocess：每次查詢開新的 python 執行爬蟲腳本；worker：交給預先啟動的 worker 行程；
+# forkserver：由預先 import 好的 zygote 為每個 job fork 一個行程（需要 os.fork）；
+# asyncio：一樣開新的 python，但輸出讀取與逾時由共用的 event loop 處理（AsyncRunner）
+RUNNER_MODE = os.getenv("RUNNER_MODE", "subprocess")
+if RUNNER_MODE == "forkserver" and not hasattr(os, "fork"):
+    print("⚠️ 此平台沒有 os.fork，RUNNER_MODE=forkserver 改用 subprocess")
+    RUNNER_MODE = "subprocess"
+WORKER_SCRIPT = str((Path(__file__).parent / "worker.py").resolve())
+ZYGOTE_SCRIPT = str((Path(__file__).parent / "zygote.py").resolve())
+
+# 全域同時執行的爬蟲數上限（網頁查詢、批次、排程共用；每個都會開一個 Chrome）
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", str(max(1, (os.cpu_count() or 2) // 2))))
+# worker 數預設等於同時執行上限：拿到名額的 job 一定有閒置的 worker，不會佔著名額排隊
+# （否則 AIMD 會把排隊時間當成校務系統變慢）
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", str(MAX_CONCURRENT_RUNS)))
+if RUNNER_MODE == "worker" and RUNNER_WORKERS < MAX_CONCURRENT_RUNS:
+    print(f"⚠️ RUNNER_WORKERS={RUNNER_WORKERS} 小於 MAX_CONCURRENT_RUNS={MAX_CONCURRENT_RUNS}，"
+          f"同時執行數改以 worker 數為上限")
+    MAX_CONCURRENT_RUNS = RUNNER_WORKERS
+# 校務系統壅塞的判斷：這些錯誤型別，或面向校務系統的階段耗時超過平常的 PORTAL_SLOW_RATIO 倍
+CONGESTION_ERRORS = ("timeout", "network")
+PORTAL_PHASES = ("portal", "login", "menu", "query")
+PORTAL_SLOW_RATIO = float(os.getenv("PORTAL_SLOW_RATIO", "2.0"))
+# 壅塞後延後下一個 job 的秒數（連續壅塞加倍，恢復就歸零）
+BACKOFF_BASE_SECONDS = float(os.getenv("BACKOFF_BASE_SECONDS", "5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", "120"))
+
+# 完成後保留多久（秒）讓頁面拿結果
+JOB_TTL = int(os.getenv("JOB_TTL", "900"))
+
+# 使用者取消時子行程的結束代碼（同 Ctrl-C）
+CANCELLED_CODE = 130
+# asyncio 讀子行程輸出時單行的長度上限（bytes；預設 64 KiB 太小，爬蟲偶爾會印整頁文字）
+STREAM_LIMIT = 1 << 20
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 同時執行數控制（所有爬蟲共用一個）：
+    - 成功且校務系統回應正常：limit 每累積 limit 次成功 +1（加法增加），最多 max_limit
+    - 在 PORTAL_PHASES（面向校務系統的階段）逾時 / 網路錯誤，或這些階段明顯變慢：limit 減半（乘法減少）並 backoff，
+      下一個 job 延後開始；其他階段（開瀏覽器、解析、等延遲載入、存檔…）逾時是爬蟲自己的問題，只算一般失敗
+    回應快慢以 PORTAL_PHASES 的總耗時和 EWMA 基準比較。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.active = 0
+        self.backoff = 0.0
+        self.not_before = 0.0
+        self.baseline_ms: Optional[float] = None
+        self.stats_counts = {"ok": 0, "congested": 0, "failed": 0}
+        self._cond = threading.Condition()
+        # acquire_async 排隊中的 (loop, future)：release() 時叫醒
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future"]] = []
+
+    def _try_acquire(self) -> Tuple[bool, Optional[float]]:
+        """（持有 _cond 時呼叫）有名額就佔用；否則回傳最多要等幾秒（None = 等到有人釋放）。"""
+        wait = self.not_before - time.monotonic()
+        if self.active < int(self.limit) and wait <= 0:
+            self.active += 1
+            # 同一輪 backoff 內的 job 也錯開，不要在 not_before 一到就全部湧進去
+            if self.backoff:
+                self.not_before = time.monotonic() + self.backoff / 2
+            return True, None
+        return False, (wait if wait > 0 else None)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                ok, wait = self._try_acquire()
+                if ok:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def acquire_async(self) -> None:
+        """在 event loop 上排隊等名額，不佔 thread（AsyncRunner 的 job 用）。"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                ok, wait = self._try_acquire()
+                if ok:
+                    return
+                fut = loop.create_future()
+                self._waiters = [w for w in self._waiters if not w[1].done()] + [(loop, fut)]
+            try:
+                await asyncio.wait_for(fut, wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, error_code: Optional[str] = None, phases: Optional[Dict[str, int]] = None,
+                phase: Optional[str] = None) -> None:
+        """phase：出錯時所在的階段（RunMonitor.error_phase）；不在 PORTAL_PHASES 的錯誤不算壅塞。"""
+        latency = sum((phases or {}).get(p, 0) for p in PORTAL_PHASES)
+        with self._cond:
+            self.active -= 1
+            slow = bool(latency and self.baseline_ms and latency > self.baseline_ms * PORTAL_SLOW_RATIO)
+            before = int(self.limit)
+            if (error_code in CONGESTION_ERRORS and phase in PORTAL_PHASES) or slow:
+                self.stats_counts["congested"] += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.backoff = min(BACKOFF_MAX_SECONDS, self.backoff * 2 if self.backoff else BACKOFF_BASE_SECONDS)
+                self.not_before = time.monotonic() + self.backoff
+            else:
+                self.stats_counts["ok" if not error_code else "failed"] += 1
+                if not error_code:
+                    self.limit = min(self.max_limit, self.limit + 1 / max(1.0, self.limit))
+                    self.backoff = 0.0
+            if latency and not slow:
+                self.baseline_ms = latency if self.baseline_ms is None else self.baseline_ms * 0.8 + latency * 0.2
+            if int(self.limit) != before:
+                print(f"[AIMD] 同時執行數 {before} → {int(self.limit)}（backoff {self.backoff:.1f}s）")
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    @contextmanager
+    def slot(self):
+        """with limiter.slot() as report: ... report(error_code, phases, phase)"""
+        outcome: Dict[str, Any] = {}
+        self.acquire()
+        try:
+            yield lambda error_code=None, phases=None, phase=None: outcome.update(
+                error_code=error_code, phases=phases, phase=phase)
+        finally:
+            if not outcome:
+                outcome["error_code"] = "unknown"  # 執行途中丟例外
+            self.release(outcome.get("error_code"), outcome.get("phases"), outcome.get("phase"))
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """async with limiter.slot_async() as report: ...（同 slot()，排隊時不佔 thread）"""
+        outcome: Dict[str, Any] = {}
+        await self.acquire_async()
+        try:
+            yield lambda error_code=None, phases=None, phase=None: outcome.update(
+                error_code=error_code, phases=phases, phase=phase)
+        finally:
+            if not outcome:
+                outcome["error_code"] = "unknown"
+            self.release(outcome.get("error_code"), outcome.get("phases"), outcome.get("phase"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "max_limit": self.max_limit,
+                "active": self.active,
+                "backoff_seconds": self.backoff,
+                "portal_baseline_ms": round(self.baseline_ms) if self.baseline_ms else None,
+                **self.stats_counts,
+            }
+
+
+def _wake(fut: "asyncio.Future") -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+RUN_SLOTS = AdaptiveLimiter(MAX_CONCURRENT_RUNS)
+
+
+class RunMonitor:
+    """邊讀邊整理事件：各階段耗時、筆數、輸出檔，以及第一個錯誤。"""
+
+    def __init__(self):
+        self.phases: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+        self.outputs: List[Dict[str, Any]] = []
+        self.error: Optional[Dict[str, Any]] = None
+        self.fatal = False
+        self.first_event_at: Optional[float] = None
+        self.retries: Dict[str, int] = {}
+        self.running: List[str] = []  # 已開始還沒結束的階段（由外到內）
+        self.failed_phase: Optional[str] = None  # 第一個失敗的階段（最內層）
+
+    def feed(self, stream: str, line: str) -> bool:
+        """處理一行輸出；回傳 True 代表出現 fatal error，應該結束子行程。"""
+        ev = events.parse_line(line)
+        if not ev:
+            return False
+        if self.first_event_at is None:
+            # 爬蟲送出第一個事件 = import 完、開始做事；用來比較各 RUNNER_MODE 的啟動延遲
+            self.first_event_at = ev.get("ts")
+        t = ev.get("type")
+        if t == "phase" and ev.get("status") == "start":
+            self.running.append(ev.get("name", ""))
+        elif t == "phase" and ev.get("status") in ("end", "fail"):
+            name = ev.get("name", "")
+            self.phases[name] = ev.get("ms", 0)
+            if name in self.running:
+                del self.running[len(self.running) - 1 - self.running[::-1].index(name)]
+            if ev.get("status") == "fail" and self.failed_phase is None:
+                self.failed_phase = name
+        elif t == "count":
+            self.counts[ev.get("name", "")] = ev.get("n", 0)
+        elif t == "retry":
+            name = ev.get("phase", "")
+            self.retries[name] = self.retries.get(name, 0) + 1
+        elif t == "output":
+            self.outputs.append({"path": ev.get("path"), "rows": ev.get("rows")})
+        elif t == "error":
+            if self.error is None or (ev.get("fatal") and not self.fatal):
+                self.error = ev
+            if ev.get("fatal"):
+                self.fatal = True
+                return True
+        return False
+
+    @property
+    def error_code(self) -> Optional[str]:
+        return self.error.get("code") if self.error else None
+
+    @property
+    def error_phase(self) -> Optional[str]:
+        """出錯時所在的階段：被中止（逾時、取消）時還沒結束的最內層階段，否則第一個失敗的階段。"""
+        return self.running[-1] if self.running else self.failed_phase
+
+    def message(self) -> Optional[str]:
+        """錯誤型別直接查表得到提示訊息。"""
+        code = self.error_code
+        return events.ERROR_MESSAGES.get(code) if code else None
+
+
+def run_process(cmd: List[str], env: Dict[str, str], cwd: str, timeout: int,
+                on_line: Optional[Callable[[str, str], Any]] = None,
+                on_cancel: Optional[Callable[[Callable[[], None]], None]] = None) -> Tuple[int, str, str]:
+    """
+    執行子行程並逐行讀取輸出；回傳 (returncode, stdout, stderr)。
+    on_line 回傳 True 時（例如收到 fatal error 事件）給子行程 FATAL_GRACE_SECONDS 收尾，之後強制結束。
+    逾時會強制結束子行程並回傳 124。
+    on_cancel（例如 Job.on_cancel）會拿到一個取消函式；呼叫它就強制結束子行程並回傳 CANCELLED_CODE。
+    """
+    proc = subprocess.Popen(
+        cmd,
+        env=env,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1,
+    )
+    return collect_output(proc, timeout, on_line, on_cancel)
+
+
+def collect_output(proc, timeout: int,
+                   on_line: Optional[Callable[[str, str], Any]] = None,
+                   on_cancel: Optional[Callable[[Callable[[], None]], None]] = None) -> Tuple[int, str, str]:
+    """
+    逐行讀取已啟動行程的 stdout/stderr 直到結束（逾時、fatal error、取消的處理見 run_process）。
+    proc 只需要 Popen 的 stdout / stderr / wait(timeout) / kill()。
+    """
+    buffers: Dict[str, List[str]] = {"out": [], "err": []}
+    stop = threading.Event()
+    cancelled = threading.Event()
+    if on_cancel:
+        on_cancel(cancelled.set)
+
+    def _reader(stream_name: str, pipe) -> None:
+        for line in iter(pipe.readline, ""):
+            buffers[stream_name].append(line)
+            if on_line:
+                try:
+                    if on_line(stream_name, line.rstrip("\n")):
+                        stop.set()
+                except Exception:
+                    pass
+        pipe.close()
+
+    readers = [
+        threading.Thread(target=_reader, args=("out", proc.stdout), daemon=True),
+        threading.Thread(target=_reader, args=("err", proc.stderr), daemon=True),
+    ]
+    for t in readers:
+        t.start()
+
+    deadline = time.monotonic() + timeout
+    stopping = False
+    code: Optional[int] = None
+    while code is None:
+        try:
+            code = proc.wait(timeout=0.2)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        now = time.monotonic()
+        if cancelled.is_set():
+            proc.kill()
+            proc.wait()
+            code = CANCELLED_CODE
+            buffers["err"].append("\n[ERROR] 使用者取消，已中止子行程。")
+            break
+        if stop.is_set() and not stopping:
+            stopping = True
+            deadline = min(deadline, now + FATAL_GRACE_SECONDS)
+        if now >= deadline:
+            proc.kill()
+            proc.wait()
+            if stopping:
+                code = 1
+                buffers["err"].append("\n[ERROR] 爬蟲回報致命錯誤，已中止子行程。")
+            else:
+                code = 124  # 常見的 timeout 代碼
+                buffers["err"].append("\n[ERROR] 子行程執行逾時，已中止。")
+    for t in readers:
+        t.join(timeout=5)
+    return code, "".join(buffers["out"]), "".join(buffers["err"])
+
+
+async def run_process_async(cmd: List[str], env: Dict[str, str], cwd: str, timeout: int,
+                            on_line: Optional[Callable[[str, str], Any]] = None,
+                            cancelled: Optional[asyncio.Event] = None) -> Tuple[int, str, str]:
+    """
+    run_process 的 asyncio 版：回傳值、逾時（124）、fatal error 收尾與取消（CANCELLED_CODE）的規則都相同。
+    on_line 在 event loop 裡呼叫，不可以做會卡住的事。
+    這個 coroutine 本身被 cancel（例如 loop 關閉）時也會先砍掉子行程再往外丟。
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, env=env, cwd=cwd,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, limit=STREAM_LIMIT,
+    )
+    buffers: Dict[str, List[str]] = {"out": [], "err": []}
+    fatal = asyncio.Event()
+
+    async def _reader(stream_name: str, stream: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:  # 單行超過 STREAM_LIMIT：先收下已讀到的部分
+                raw = await stream.read(STREAM_LIMIT)
+            if not raw:
+                return
+            line = raw.decode("utf-8", errors="replace")
+            buffers[stream_name].append(line)
+            if on_line:
+                try:
+                    if on_line(stream_name, line.rstrip("\n")):
+                        fatal.set()
+                except Exception:
+                    pass
+
+    loop = asyncio.get_running_loop()
+    readers = [asyncio.ensure_future(_reader("out", proc.stdout)),
+               asyncio.ensure_future(_reader("err", proc.stderr))]
+    exited = asyncio.ensure_future(proc.wait())
+    on_fatal = asyncio.ensure_future(fatal.wait())
+    on_cancel = asyncio.ensure_future(cancelled.wait()) if cancelled else None
+    waiting = {exited, on_fatal} | ({on_cancel} if on_cancel else set())
+
+    deadline = loop.time() + timeout
+    stopping = False
+    code: Optional[int] = None
+    try:
+        while code is None:
+            done, _ = await asyncio.wait(waiting, timeout=max(0.0, deadline - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if exited in done:
+                code = exited.result()
+            elif on_cancel in done:
+                proc.kill()
+                await exited
+                code = CANCELLED_CODE
+                buffers["err"].append("\n[ERROR] 使用者取消，已中止子行程。")
+            elif on_fatal in done:
+                waiting.discard(on_fatal)
+                stopping = True
+                deadline = min(deadline, loop.time() + FATAL_GRACE_SECONDS)
+            elif loop.time() >= deadline:
+                proc.kill()
+                await exited
+                if stopping:
+                    code = 1
+                    buffers["err"].append("\n[ERROR] 爬蟲回報致命錯誤，已中止子行程。")
+                else:
+                    code = 124  # 常見的 timeout 代碼
+                    buffers["err"].append("\n[ERROR] 子行程執行逾時，已中止。")
+        # 子行程結束後把 pipe 剩下的讀完（孫行程還握著 pipe 時最多等 5 秒）
+        await asyncio.wait(readers, timeout=5)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        for task in [*readers, exited, on_fatal, on_cancel]:
+            if task and not task.done():
+                task.cancel()
+    return code, "".join(buffers["out"]), "".join(buffers["err"])
+
+
+class AsyncRunner:
+    """
+    一條背景 thread 跑 asyncio event loop，所有 RUNNER_MODE=asyncio 的子行程都在這裡監看。
+    run() 給原本的同步程式碼用（介面與 run_process 相同，呼叫端只等結果，不再開 reader thread）；
+    submit() 直接回傳 concurrent.futures.Future，不想佔住 thread 的呼叫端可以掛 callback；
+    supervise() 是同一件事的 coroutine，給整段流程都跑在 loop 上的 job（start_async_job）await。
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.active = 0
+        self.started = 0
+        threading.Thread(target=self.loop.run_forever, name="runner-loop", daemon=True).start()
+
+    async def supervise(self, cmd: List[str], env: Dict[str, str], cwd: str, timeout: int,
+                        on_line: Optional[Callable[[str, str], Any]] = None,
+                        on_cancel: Optional[Callable[[Callable[[], None]], None]] = None) -> Tuple[int, str, str]:
+        cancelled = asyncio.Event()
+        if on_cancel:
+            on_cancel(lambda: self.loop.call_soon_threadsafe(cancelled.set))
+        self.active += 1
+        self.started += 1
+        try:
+            return await run_process_async(cmd, env, cwd, timeout, on_line, cancelled)
+        finally:
+            self.active -= 1
+
+    def submit(self, cmd: List[str], env: Dict[str, str], cwd: str, timeout: int,
+               on_line: Optional[Callable[[str, str], Any]] = None,
+               on_cancel: Optional[Callable[[Callable[[], None]], None]] = None):
+        return asyncio.run_coroutine_threadsafe(
+            self.supervise(cmd, env, cwd, timeout, on_line, on_cancel), self.loop)
+
+    def run(self, cmd: List[str], env: Dict[str, str], cwd: str, timeout: int,
+            on_line: Optional[Callable[[str, str], Any]] = None,
+            on_cancel: Optional[Callable[[Callable[[], None]], None]] = None) -> Tuple[int, str, str]:
+        return self.submit(cmd, env, cwd, timeout, on_line, on_cancel).result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self.active, "started": self.started}
+
+
+_ASYNC_RUNNER: Optional[AsyncRunner] = None
+_ASYNC_RUNNER_LOCK = threading.Lock()
+
+
+def async_runner() -> AsyncRunner:
+    """第一次呼叫時啟動 event loop thread（每個 app 行程一條）。"""
+    global _ASYNC_RUNNER
+    with _ASYNC_RUNNER_LOCK:
+        if _ASYNC_RUNNER is None:
+            _ASYNC_RUNNER = AsyncRunner()
+        return _ASYNC_RUNNER
+
+
+class _ForkedProcess:
+    """forkserver fork 出來的 job 行程，提供 collect_output 需要的 Popen 介面。"""
+
+    def __init__(self, server: "ForkServer", pid: int, out_fd: int, err_fd: int):
+        self.pid = pid
+        self.stdout = open(out_fd, "r", encoding="utf-8", errors="replace")
+        self.stderr = open(err_fd, "r", encoding="utf-8", errors="replace")
+        self._server = server
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        return self._server.wait_exit(self.pid, timeout)
+
+    def kill(self) -> None:
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class ForkServer:
+    """
+    zygote.py 的 app 端：開機時啟動一次（預先 import 好爬蟲相依套件），之後每個 job 請它 fork。
+    job 的 stdout/stderr 是 app 這邊建立的 pipe，寫端透過 Unix socket 傳給 zygote 交給子行程。
+    """
+
+    def __init__(self, python_bin: str, env: Optional[Dict[str, str]] = None):
+        env = dict(env or os.environ)
+        env["PYTHONIOENCODING"] = "utf-8"
+        env["PYTHONUNBUFFERED"] = "1"
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.proc = subprocess.Popen([python_bin, ZYGOTE_SCRIPT, str(theirs.fileno())],
+                                     env=env, pass_fds=(theirs.fileno(),))
+        theirs.close()
+        self.sock = ours
+        self.startup_ms: Optional[int] = None
+        self._started: Dict[str, int] = {}
+        self._exits: Dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True).start()
+        with self._cond:
+            self._cond.wait_for(lambda: self.startup_ms is not None or not self.alive, timeout=120)
+        print(f"[FORKSERVER] pid={self.proc.pid} ready in {self.startup_ms} ms")
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _read(self) -> None:
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                return
+            try:
+                msg = json.loads(data)
+            except ValueError:
+                continue
+            with self._cond:
+                t = msg.get("type")
+                if t == "ready":
+                    self.startup_ms = msg.get("startup_ms")
+                elif t == "started":
+                    self._started[msg["id"]] = msg["pid"]
+                elif t == "exit":
+                    self._exits[msg["pid"]] = msg["code"]
+                self._cond.notify_all()
+
+    def spawn(self, kind: str, env: Dict[str, str], cwd: str) -> _ForkedProcess:
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        job_id = uuid.uuid4().hex
+        payload = json.dumps({"id": job_id, "kind": kind, "env": env, "cwd": str(Path(cwd).resolve())},
+                             ensure_ascii=False).encode("utf-8")
+        try:
+            with self._send_lock:
+                socket.send_fds(self.sock, [payload], [out_w, err_w])
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        with self._cond:
+            if not self._cond.wait_for(lambda: job_id in self._started or not self.alive, timeout=30):
+                os.close(out_r)
+                os.close(err_r)
+                raise RuntimeError("forkserver 沒有回應")
+            if job_id not in self._started:
+                os.close(out_r)
+                os.close(err_r)
+                raise RuntimeError("forkserver 已結束")
+            pid = self._started.pop(job_id)
+        return _ForkedProcess(self, pid, out_r, err_r)
+
+    def wait_exit(self, pid: int, timeout: Optional[float] = None) -> int:
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while pid not in self._exits:
+                if not self.alive:
+                    return -signal.SIGKILL  # zygote 不在了，子行程的結束代碼拿不到
+                left = 0.5 if end is None else min(0.5, end - time.monotonic())
+                if left <= 0:
+                    raise subprocess.TimeoutExpired(f"pid {pid}", timeout)
+                self._cond.wait(timeout=left)
+            return self._exits.pop(pid)
+
+    def run(self, kind: str, env: Dict[str, str], cwd: str, timeout: int,
+            on_line: Optional[Callable[[str, str], Any]] = None,
+            on_cancel: Optional[Callable[[Callable[[], None]], None]] = None) -> Tuple[int, str, str]:
+        """介面與 run_process 相同，只是行程由 zygote fork 而來。"""
+        return collect_output(self.spawn(kind, env, cwd), timeout, on_line, on_cancel)
+
+
+_FORK_SERVER: Optional[ForkServer] = None
+_FORK_SERVER_LOCK = threading.Lock()
+
+
+def fork_server(python_bin: str) -> ForkServer:
+    """第一次呼叫時啟動 forkserver；若它意外結束就重新啟動一個。"""
+    global _FORK_SERVER
+    with _FORK_SERVER_LOCK:
+        if _FORK_SERVER is None or not _FORK_SERVER.alive:
+            _FORK_SERVER = ForkServer(python_bin)
+        return _FORK_SERVER
+
+
+class _Worker:
+    """一個 worker.py 行程；協定訊息由 reader thread 放進 queue。"""
+
+    def __init__(self, python_bin: str, env: Dict[str, str]):
+        self.proc = subprocess.Popen(
+            [python_bin, WORKER_SCRIPT],
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self.messages: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.startup_ms: Optional[int] = None
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        for raw in iter(self.proc.stdout.readline, ""):
+            try:
+                self.messages.put(json.loads(raw))
+            except ValueError:
+                continue
+        self.messages.put(None)  # 行程結束
+
+    def wait_ready(self, timeout: float) -> bool:
+        try:
+            msg = self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        if msg and msg.get("type") == "ready":
+            self.startup_ms = msg.get("startup_ms")
+            return True
+        return False
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.wait()
+        except Exception:
+            pass
+
+
+class WorkerPool:
+    """
+    固定數量的 worker；run() 借一個閒置的 worker 跑 job，介面與 run_process 相同。
+    job 逾時或回報 fatal error 時直接砍掉那個 worker 再補一個新的（隔離性不輸子行程）。
+    """
+
+    def __init__(self, size: int, python_bin: str, env: Optional[Dict[str, str]] = None):
+        self.python_bin = python_bin
+        self.env = dict(env or os.environ)
+        self.env["PYTHONIOENCODING"] = "utf-8"
+        self.env["PYTHONUNBUFFERED"] = "1"
+        self.idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(max(1, size)):
+            self.idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        w = _Worker(self.python_bin, self.env)
+        if w.wait_ready(timeout=120):
+            print(f"[WORKER] pid={w.proc.pid} ready in {w.startup_ms} ms")
+        return w
+
+    def run(self, kind: str, credentials: Dict[str, str], work_dir: str, options: Dict[str, Any],
+            timeout: int, on_line: Optional[Callable[[str, str], Any]] = None) -> Tuple[int, str, str]:
+        worker = self.idle.get()
+        if not worker.alive:
+            worker = self._spawn()
+        job_id = uuid.uuid4().hex
+        buffers: Dict[str, List[str]] = {"out": [], "err": []}
+        worker.proc.stdin.write(json.dumps({
+            "id": job_id, "kind": kind, "credentials": credentials,
+            "work_dir": str(Path(work_dir).resolve()), "options": options,
+        }, ensure_ascii=False) + "\n")
+        worker.proc.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        stopping = False
+        code: Optional[int] = None
+        while code is None:
+            try:
+                msg = worker.messages.get(timeout=max(0.0, min(0.2, deadline - time.monotonic())))
+            except queue.Empty:
+                msg = False
+            if msg is None:
+                code = 1
+                buffers["err"].append("\n[ERROR] worker 行程意外結束。")
+                break
+            if msg and msg.get("job") == job_id:
+                if msg.get("type") == "line":
+                    stream, line = msg.get("stream", "out"), msg.get("line", "")
+                    buffers[stream].append(line + "\n")
+                    if on_line:
+                        try:
+                            if on_line(stream, line) and not stopping:
+                                stopping = True
+                                deadline = min(deadline, time.monotonic() + FATAL_GRACE_SECONDS)
+                        except Exception:
+                            pass
+                elif msg.get("type") == "done":
+                    code = int((msg.get("result") or {}).get("code", 1))
+                    break
+            if time.monotonic() >= deadline:
+                worker.kill()
+                if stopping:
+                    code = 1
+                    buffers["err"].append("\n[ERROR] 爬蟲回報致命錯誤，已中止 worker。")
+                else:
+                    code = 124
+                    buffers["err"].append("\n[ERROR] worker 執行逾時，已中止。")
+        if not worker.alive:
+            worker = self._spawn()
+        self.idle.put(worker)
+        return code, "".join(buffers["out"]), "".join(buffers["err"])
+
+
+_POOL: Optional[WorkerPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def worker_pool(python_bin: str) -> WorkerPool:
+    """第一次呼叫時建立 worker pool（app 開機時先叫一次，讓 worker 提早 import 完）。"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = WorkerPool(RUNNER_WORKERS, python_bin)
+        return _POOL
+
+
+class Job:
+    """一次背景查詢：依序累積事件（log / phase / done），供 SSE 從任意位置續讀。"""
+
+    def __init__(self, kind: str, user: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user = user
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Tuple[str, Dict[str, Any]]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancelled = False
+        self._cancel_hooks: List[Callable[[], None]] = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        with self._cond:
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def on_line(self, stream: str, line: str) -> None:
+        """給 run_process 的 callback：一般輸出送 log，結構化事件轉成 phase / error。"""
+        if not line.strip():
+            return
+        ev = events.parse_line(line)
+        if ev is None:
+            self.emit("log", {"stream": stream, "line": line})
+            return
+        t = ev.get("type")
+        if t == "phase" and ev.get("status") == "start":
+            name = ev.get("name", "")
+            self.emit("phase", {"phase": name, "label": PHASE_LABELS.get(name, name)})
+        elif t == "count":
+            self.emit("phase", {"phase": "parse", "label": f"解析完成：{ev.get('n', 0)} 筆"})
+        elif t == "retry":
+            name = ev.get("phase", "")
+            label = f"重試{PHASE_LABELS.get(name, name)}（{ev.get('attempt')}/{ev.get('budget')}）"
+            self.emit("phase", {"phase": name, "label": label})
+        elif t == "error":
+            self.emit("error", {"code": ev.get("code"), "message": events.ERROR_MESSAGES.get(ev.get("code"), "")})
+
+    def on_cancel(self, hook: Callable[[], None]) -> None:
+        """給 run_process 等註冊「怎麼中止這個 job」；已經取消過就立刻呼叫。"""
+        with self._cond:
+            if not self.cancelled:
+                self._cancel_hooks.append(hook)
+                return
+        hook()
+
+    def cancel(self) -> bool:
+        """使用者取消；已結束或已取消過回傳 False。"""
+        with self._cond:
+            if self.done or self.cancelled:
+                return False
+            self.cancelled = True
+            hooks, self._cancel_hooks = self._cancel_hooks, []
+        self.emit("phase", {"phase": "cancel", "label": "取消中"})
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+        return True
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        with self._cond:
+            self.result = result
+            self.finished_at = time.time()
+            self.events.append(("done", {"code": result.get("code"), "ok": bool(result.get("ok"))}))
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self.done, timeout=timeout)
+            return self.result
+
+    def iter_events(self, start: int = 0, keepalive: float = 15.0):
+        """
+        從第 start 筆事件開始逐筆產出 (index, event, data)；
+        沒有新事件時每 keepalive 秒產出一次 (index, None, None) 讓 SSE 送心跳。
+        """
+        i = start
+        while True:
+            with self._cond:
+                if i >= len(self.events) and not self.done:
+                    self._cond.wait(timeout=keepalive)
+                batch = self.events[i:]
+                finished = self.done
+            if not batch:
+                if finished:
+                    return
+                yield i, None, None
+                continue
+            for event, data in batch:
+                yield i, event, data
+                i += 1
+                if event == "done":
+                    return
+
+
+JOBS: Dict[str, Job] = {}
+_JOBS_LOCK = threading.Lock()
+
+
+def _register_job(kind: str, user: str) -> Job:
+    """建立 Job 放進 JOBS（順便清掉過期的）。"""
+    job = Job(kind, user)
+    with _JOBS_LOCK:
+        now = time.time()
+        for jid in [j.id for j in JOBS.values() if j.done and now - j.finished_at > JOB_TTL]:
+            JOBS.pop(jid, None)
+        JOBS[job.id] = job
+    return job
+
+
+def start_job(kind: str, user: str, target: Callable[[Job], Dict[str, Any]]) -> Job:
+    """建立 Job 並在背景 thread 執行 target(job)；target 的回傳值即為 job.result。"""
+    job = _register_job(kind, user)
+
+    def _run():
+        try:
+            result = target(job)
+        except Exception as e:
+            result = {"code": 1, "ok": False, "message": f"執行失敗：{e}"}
+        job.finish(result)
+
+    threading.Thread(target=_run, name=f"job-{kind}-{job.id[:6]}", daemon=True).start()
+    return job
+
+
+def start_async_job(kind: str, user: str, target: Callable[[Job], Any]) -> Job:
+    """
+    同 start_job，但 target(job) 是 coroutine，直接排進 AsyncRunner 的 event loop：
+    排隊等名額、監看子行程都不佔 thread，結束時由 done callback 呼叫 job.finish。
+    """
+    job = _register_job(kind, user)
+
+    def _done(fut) -> None:
+        try:
+            result = fut.result()
+        except Exception as e:
+            result = {"code": 1, "ok": False, "message": f"執行失敗：{e}"}
+        job.finish(result)
+
+    asyncio.run_coroutine_threadsafe(target(job), async_runner().loop).add_done_callback(_done)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _JOBS_LOCK:
+        return JOBS.get(job_id)
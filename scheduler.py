@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+背景定期更新快照
+- 名單沿用 batch.py 的 roster CSV（SCHEDULE_ROSTER），每個 (帳號, 類型) 依 SCHEDULE_INTERVALS 定期重抓
+- 只在離峰時段（SCHEDULE_WINDOWS，例如 "01:00-06:00,13:00-14:00"）送出；
+  到期的 job 在時段內隨機分散（jitter），不會整點一起打到校務系統
+- 是否到期看 current 指標的 ended_at → 使用者自己在網頁查過的也算數，不會重抓
+- 透過 app.run_script 執行，佔用與網頁查詢相同的全域名額（MAX_CONCURRENT_RUNS）；
+  排程自己最多同時 SCHEDULE_MAX_PARALLEL 個，保留名額給互動查詢
+- 啟動方式：設 SCHEDULER_ENABLED=1，python app.py 或 gunicorn（gunicorn.conf.py 的 post_worker_init）都會在
+  服務行程裡啟動排程；單獨執行 python scheduler.py 只適合沒有開網頁服務時（名額不和網頁共用）
+"""
+
+import os
+import sys
+import random
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.insert(0, str((Path(__file__).parent / "Mainreptile").resolve()))
+import snapshot  # noqa: E402
+from batch import read_roster  # noqa: E402
+
+SCHEDULE_ROSTER = os.getenv("SCHEDULE_ROSTER", "roster.csv")
+# 各類型多久更新一次（h / m 結尾）
+SCHEDULE_INTERVALS = os.getenv("SCHEDULE_INTERVALS", "timetable=24h,grades=6h,ranking=24h,attendance=12h")
+SCHEDULE_WINDOWS = os.getenv("SCHEDULE_WINDOWS", "01:00-06:00")
+# 到期 job 最多往後分散幾秒（實際不超過時段剩餘時間）
+SCHEDULE_SPREAD_SECONDS = int(os.getenv("SCHEDULE_SPREAD_SECONDS", "3600"))
+SCHEDULE_MAX_PARALLEL = int(os.getenv("SCHEDULE_MAX_PARALLEL", "1"))
+SCHEDULE_TICK_SECONDS = int(os.getenv("SCHEDULE_TICK_SECONDS", "30"))
+# 失敗（沒有更新 current）的 job 至少隔多久才重試
+SCHEDULE_RETRY_SECONDS = int(os.getenv("SCHEDULE_RETRY_SECONDS", "3600"))
+
+Window = Tuple[int, int]  # (開始分鐘, 結束分鐘)，可跨午夜
+
+
+def parse_intervals(text: str) -> Dict[str, int]:
+    """"grades=6h,ranking=30m" → {"grades": 21600, "ranking": 1800}"""
+    out = {}
+    for part in text.split(","):
+        if "=" not in part:
+            continue
+        kind, val = (x.strip() for x in part.split("=", 1))
+        unit = val[-1:].lower()
+        num = float(val[:-1]) if unit in ("h", "m") else float(val)
+        out[kind] = int(num * (3600 if unit == "h" else 60 if unit == "m" else 1))
+    return out
+
+
+def parse_windows(text: str) -> List[Window]:
+    windows = []
+    for part in text.split(","):
+        if "-" not in part:
+            continue
+        a, b = (x.strip() for x in part.split("-", 1))
+        ha, ma = (int(x) for x in a.split(":"))
+        hb, mb = (int(x) for x in b.split(":"))
+        windows.append((ha * 60 + ma, hb * 60 + mb))
+    return windows
+
+
+def window_remaining(now: datetime, windows: List[Window]) -> Optional[float]:
+    """現在在離峰時段內就回傳時段剩餘秒數，不在時段內回傳 None。"""
+    minute = now.hour * 60 + now.minute + now.second / 60
+    for start, end in windows:
+        if start <= end:
+            inside, left = start <= minute < end, end - minute
+        else:  # 跨午夜，例如 23:00-05:00
+            inside = minute >= start or minute < end
+            left = (end + 1440 - minute) % 1440
+        if inside:
+            return left * 60
+    return None
+
+
+class Scheduler:
+    def __init__(self, run_script, data_root: Path, roster: Path = Path(SCHEDULE_ROSTER),
+                 intervals: Optional[Dict[str, int]] = None, windows: Optional[List[Window]] = None):
+        self.run_script = run_script
+        self.data_root = Path(data_root)
+        self.roster = Path(roster)
+        self.intervals = intervals or parse_intervals(SCHEDULE_INTERVALS)
+        self.windows = windows if windows is not None else parse_windows(SCHEDULE_WINDOWS)
+        # (帳號, 類型) → 預定送出時間（已分散過）
+        self.planned: Dict[Tuple[str, str], float] = {}
+        self.running: set = set()
+        self.last_attempt: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, SCHEDULE_MAX_PARALLEL), thread_name_prefix="sched")
+
+    def _due(self, user: str, kind: str, now: float) -> bool:
+        interval = self.intervals.get(kind)
+        if not interval:
+            return False
+        if now - self.last_attempt.get((user, kind), 0) < min(interval, SCHEDULE_RETRY_SECONDS):
+            return False
+        manifest = snapshot.current_manifest(self.data_root / user, kind)
+        return manifest is None or now - manifest.get("ended_at", 0) >= interval
+
+    def tick(self, now: Optional[datetime] = None) -> None:
+        now = now or datetime.now()
+        ts = now.timestamp()
+        left = window_remaining(now, self.windows)
+        if left is None:
+            self.planned.clear()  # 離開時段，沒送出的等下一個時段重新分散
+            return
+        try:
+            jobs = read_roster(self.roster, list(self.intervals))
+        except OSError:
+            return
+        accounts = {}
+        for j in jobs:
+            key = (j["username"], j["kind"])
+            accounts[key] = j
+            if key in self.planned or key in self.running or not self._due(*key, ts):
+                continue
+            self.planned[key] = ts + random.uniform(0, max(0.0, min(SCHEDULE_SPREAD_SECONDS, left - 60)))
+        for key, at in list(self.planned.items()):
+            if at <= ts and key in accounts:
+                del self.planned[key]
+                with self._lock:
+                    self.running.add(key)
+                self.last_attempt[key] = ts
+                self._pool.submit(self._run, accounts[key])
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        key = (job["username"], job["kind"])
+        try:
+            work_dir = self.data_root / job["username"]
+            work_dir.mkdir(parents=True, exist_ok=True)
+            res = self.run_script(job["kind"], {"SHU_USERNAME": job["username"], "SHU_PASSWORD": job["password"]},
+                                  work_dir=work_dir)
+            mark = "✅" if res.get("ok") else "❌"
+            print(f"[SCHED] {mark} {job['username']} {job['kind']} run={res.get('run_id')}")
+        except Exception as e:
+            print(f"[SCHED] ❌ {job['username']} {job['kind']}：{e}")
+        finally:
+            with self._lock:
+                self.running.discard(key)
+
+    def loop(self) -> None:
+        print(f"[SCHED] 啟動：名單 {self.roster}，時段 {SCHEDULE_WINDOWS}，間隔 {self.intervals}")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[SCHED] tick 失敗：{e}")
+            self._stop.wait(SCHEDULE_TICK_SECONDS)
+
+    def start(self) -> "Scheduler":
+        threading.Thread(target=self.loop, name="scheduler", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    from app import DATA_ROOT, run_script
+    print("⚠️ 單獨執行的排程有自己的同時執行名額，不和網頁服務共用；網頁服務開著時請改設 SCHEDULER_ENABLED=1")
+    sched = Scheduler(run_script, DATA_ROOT, Path(sys.argv[1]) if len(sys.argv) > 1 else Path(SCHEDULE_ROSTER))
+    try:
+        sched.loop()
+    except KeyboardInterrupt:
+        sched.stop()
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# 爬蟲模組以檔名直接 import（app.py 也是這樣加進 sys.path）
+sys.path.insert(0, str(ROOT / "Mainreptile"))
+sys.path.insert(0, str(ROOT))
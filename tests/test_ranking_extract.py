@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""名次頁 HTML → 名次列：用實際抓下來的 ranking_debug.html 驗證巢狀表格不會重複收列。"""
+
+from pathlib import Path
+
+import pytest
+
+from ranking_scraper import extract_ranking_records
+
+FIXTURE = Path(__file__).resolve().parent.parent / "data" / "A111223022" / "ranking_debug.html"
+
+
+@pytest.fixture(scope="module")
+def records():
+    return extract_ranking_records(FIXTURE.read_text(encoding="utf-8"))
+
+
+def test_one_row_per_semester(records):
+    keys = [(r["學年度"], r["學期"]) for r in records]
+    # 舊版逐層走巢狀表格會把同一列收三次（18 列）
+    assert len(records) == 6
+    assert len(set(keys)) == len(keys)
+    assert sorted(keys) == [(y, t) for y in ("111", "112", "113") for t in ("1", "2")]
+
+
+def test_row_fields(records):
+    first = next(r for r in records if (r["學年度"], r["學期"]) == ("111", "1"))
+    assert first == {"學年度": "111", "學期": "1", "學分": "23", "平均": "91.3",
+                     "名次": "3 / 3 / 9", "人數": "38 / 38 / 154"}
+
+
+@pytest.mark.parametrize("html", [
+    "",
+    "<html><body><p>查無資料</p></body></html>",
+    "<table><tr><td>公告</td><td>系統維護</td></tr></table>",
+    "<table><tr><th>學年度</th><th>學期</th><th>學分</th><th>平均</th><th>名次</th><th>人數</th></tr></table>",
+])
+def test_no_ranking_rows(html):
+    assert extract_ranking_records(html) == []
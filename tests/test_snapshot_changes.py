@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""變動紀錄：逐列比對，以及同時發佈時 seq 不重複、不掉紀錄。"""
+
+import json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import snapshot_diff
+from snapshot_diff import append_changes, diff_records, read_changes
+
+DIFF = {"t": {"added": [{"a": 1}], "removed": [], "changed": []}}
+
+
+def test_diff_records_by_key():
+    old = [{"學年": "112", "科目": "英文", "成績": "70"}, {"學年": "112", "科目": "國文", "成績": "80"}]
+    new = [{"學年": "112", "科目": "英文", "成績": "75"}, {"學年": "113", "科目": "程式", "成績": "90"}]
+    d = diff_records(old, new, ["學年", "科目"])
+    assert d["added"] == [new[1]]
+    assert d["removed"] == [{"學年": "112", "科目": "國文"}]
+    assert d["changed"] == [{"key": {"學年": "112", "科目": "英文"}, "fields": {"成績": ["70", "75"]}}]
+
+
+def _append_many(args):
+    kind_dir, n = args
+    for i in range(n):
+        append_changes(kind_dir, "grades", f"r{i}", None, DIFF)
+
+
+def _seqs(kind_dir):
+    return [json.loads(ln)["seq"] for ln in (kind_dir / snapshot_diff.CHANGES_FILE).read_text().splitlines()]
+
+
+def test_concurrent_threads_unique_seq(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_diff, "CHANGES_KEEP", 5)  # 逼出好幾次重寫
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(_append_many, [(tmp_path, 10)] * 8))
+    seqs = _seqs(tmp_path)
+    # 最新的紀錄必定是第 80 筆，且保留下來的 seq 連續不重複
+    assert seqs[-1] == 80
+    assert seqs == list(range(seqs[0], 81))
+    assert [r["seq"] for r in read_changes(tmp_path, since=78)] == [79, 80]
+
+
+def test_concurrent_processes_unique_seq(tmp_path):
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        pool.map(_append_many, [(tmp_path, 15)] * 4)
+    assert _seqs(tmp_path) == list(range(1, 61))
+
+
+def test_since_older_than_retained_is_truncated(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_diff, "CHANGES_KEEP", 3)
+    _append_many((tmp_path, 7))  # 第 7 筆時重寫，只留 5、6、7
+    assert snapshot_diff.oldest_seq(tmp_path) == 5
+    assert snapshot_diff.is_truncated(tmp_path, since=2)
+    assert not snapshot_diff.is_truncated(tmp_path, since=4)
+    assert not snapshot_diff.is_truncated(tmp_path / "none", since=0)
+    assert [r["seq"] for r in read_changes(tmp_path, since=4)] == [5, 6, 7]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""「星期節次週別」解析與時段查詢。"""
+
+import pandas as pd
+import pytest
+
+import timetable_index
+from timetable_index import TimetableIndex, parse_slots
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("二3-4", [(2, ["3", "4"], "all")]),
+    ("(三)5,6 單週", [(3, ["5", "6"], "odd")]),
+    ("星期四 第7~8節", [(4, ["7", "8"], "all")]),
+    ("五A-B", [(5, ["A", "B"], "all")]),
+    ("三10-12", [(3, ["10", "11", "12"], "all")]),
+    # 空白分開的節次
+    ("一 3 4", [(1, ["3", "4"], "all")]),
+    ("一3 4 二5", [(1, ["3", "4"], "all"), (2, ["5"], "all")]),
+    ("一 3、4節", [(1, ["3", "4"], "all")]),
+    # 連寫的節次
+    ("二34", [(2, ["3", "4"], "all")]),
+    ("三567 單週", [(3, ["5", "6", "7"], "odd")]),
+    ("二1011", [(2, ["10", "11"], "all")]),
+    ("四1213", [(4, ["12", "13"], "all")]),
+    # 連寫的兩個字元先當成兩節；只有單節讀法不成立才讀成 10-14
+    ("一12", [(1, ["1", "2"], "all")]),
+    ("一13", [(1, ["1", "3"], "all")]),
+    ("一123", [(1, ["1", "2", "3"], "all")]),
+    ("一1213", [(1, ["12", "13"], "all")]),
+    ("一10", [(1, ["10"], "all")]),
+    ("一910", [(1, ["9", "10"], "all")]),
+    ("日AB", [(7, ["A", "B"], "all")]),
+    ("", []),
+    ("未排課", []),
+])
+def test_parse_slots(text, expected):
+    assert [(s["day"], s["periods"], s["weeks"]) for s in parse_slots(text)] == expected
+
+
+def _index():
+    return TimetableIndex.from_df(pd.DataFrame([
+        {"課程簡碼": "A01", "課程名稱(教材下載)": "微積分", "星期節次週別": "一 3 4"},
+        {"課程簡碼": "B02", "課程名稱(教材下載)": "英文", "星期節次週別": "一34"},
+    ]))
+
+
+def test_spaced_and_packed_periods_conflict():
+    ix = _index()
+    assert not ix.is_free(1, "4")
+    assert [c["code"] for c in ix.at(1, "4")] == ["A01", "B02"]
+    assert ix.conflicts()
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    import app
+    monkeypatch.setattr(app, "current_username", lambda: "u1")
+    monkeypatch.setattr(app, "load_timetable_index", lambda work_dir: _index())
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("period", ["x", "0", "15", "F", ""])
+def test_slots_rejects_bad_period(client, period):
+    assert client.get(f"/api/timetable/slots?day=1&period={period}").status_code == 400
+
+
+def test_slots_normalizes_period(client):
+    res = client.get("/api/timetable/slots?day=1&period=03").get_json()
+    assert res["period"] == "3" and res["free"] is False
+    assert timetable_index.period_code("a") == "A"
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+預先啟動的爬蟲 worker（RUNNER_MODE=worker 時由 app 啟動，見 runner.WorkerPool）
+- 開機時就 import pandas / selenium / webdriver_manager 與各爬蟲模組，之後每個 job 直接呼叫 <模組>.run()
+- stdin：一行一個 job（JSON：id, kind, credentials, work_dir, options）
+- stdout：只給協定用，一行一個 JSON：
+    {"type": "ready", "startup_ms": ...}
+    {"type": "line", "job": id, "stream": "out"/"err", "line": ...}
+    {"type": "done", "job": id, "result": {...}}
+  爬蟲的 print 會被轉成 line 訊息；chromedriver 等子行程直接寫 fd 1 的輸出改導到 stderr，不會混進協定
+- 一個 worker 同時只跑一個 job（工作目錄是整個行程共用的）
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import importlib
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+
+_T0 = time.perf_counter()
+
+sys.path.insert(0, str((Path(__file__).parent / "Mainreptile").resolve()))
+
+# 類型 → 爬蟲模組
+SCRAPER_MODULES = {
+    "timetable":  "schedule_scraper",
+    "grades":     "grade",
+    "ranking":    "ranking_scraper",
+    "attendance": "attendance_scraper",
+}
+
+
+class _LineRelay:
+    """假的 stdout/stderr：湊滿一行就包成協定訊息送出。"""
+
+    def __init__(self, send, job_id: str, stream: str):
+        self._send = send
+        self._job = job_id
+        self._stream = stream
+        self._buf = ""
+
+    def write(self, text: str) -> int:
+        self._buf += text
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            self._send({"type": "line", "job": self._job, "stream": self._stream, "line": line})
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._buf:
+            self._send({"type": "line", "job": self._job, "stream": self._stream, "line": self._buf})
+            self._buf = ""
+
+    def isatty(self) -> bool:
+        return False
+
+
+def main() -> None:
+    # 協定專用 fd：複製一份原本的 stdout，再把 fd 1 指到 stderr
+    proto = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    lock = threading.Lock()
+
+    def send(msg) -> None:
+        with lock:
+            proto.write(json.dumps(msg, ensure_ascii=False) + "\n")
+            proto.flush()
+
+    modules = {kind: importlib.import_module(name) for kind, name in SCRAPER_MODULES.items()}
+    send({"type": "ready", "pid": os.getpid(), "startup_ms": int((time.perf_counter() - _T0) * 1000)})
+
+    for raw in sys.stdin:
+        if not raw.strip():
+            continue
+        job = json.loads(raw)
+        out = _LineRelay(send, job["id"], "out")
+        err = _LineRelay(send, job["id"], "err")
+        try:
+            with redirect_stdout(out), redirect_stderr(err):
+                result = modules[job["kind"]].run(job["credentials"], job["work_dir"], job.get("options"))
+        except BaseException as e:  # run() 已經把例外轉成結束代碼，這裡只是保險
+            result = {"code": 1, "ok": False, "error": str(e)}
+        out.close()
+        err.close()
+        send({"type": "done", "job": job["id"], "result": result})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+爬蟲 forkserver（RUNNER_MODE=forkserver 時由 app 啟動，見 runner.ForkServer）
+- 開機時 import pandas / selenium / webdriver_manager / dotenv 與各爬蟲模組一次
+- 每個 job fork 一個子行程：換成 job 自己的環境變數、工作目錄與 stdout/stderr，跑完即結束
+  → 和 subprocess 模式一樣是一個 job 一個行程（互不影響、可單獨 kill），但不用重新啟動直譯器與 import
+- 與 app 之間是一對 Unix datagram socket（一則訊息一個 JSON，邊界不會黏在一起）：
+    app → zygote：{"id", "kind", "env", "cwd"} + 兩個 fd（該 job 的 stdout / stderr pipe 寫端）
+    zygote → app：{"type": "ready", "startup_ms"}、{"type": "started", "id", "pid"}、{"type": "exit", "pid", "code"}
+- 只在有 os.fork 的平台可用
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import importlib
+from pathlib import Path
+
+_T0 = time.perf_counter()
+
+sys.path.insert(0, str((Path(__file__).parent / "Mainreptile").resolve()))
+
+import pandas  # noqa: E402,F401
+import selenium.webdriver  # noqa: E402,F401
+import webdriver_manager.chrome  # noqa: E402,F401
+import dotenv  # noqa: E402,F401
+import events  # noqa: E402
+import runtime  # noqa: E402
+from worker import SCRAPER_MODULES  # noqa: E402
+
+MODULES = {kind: importlib.import_module(name) for kind, name in SCRAPER_MODULES.items()}
+
+
+def _send(sock: socket.socket, msg) -> None:
+    sock.send(json.dumps(msg, ensure_ascii=False).encode("utf-8"))
+
+
+def _child(job, out_fd: int, err_fd: int) -> None:
+    """fork 出來的子行程：接上 job 的 pipe、換環境與目錄後執行爬蟲，結束代碼即爬蟲結果。"""
+    code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.close(out_fd)
+        os.close(err_fd)
+        os.environ.clear()
+        os.environ.update(job["env"])
+        os.chdir(job["cwd"])
+        events.reset()
+        credentials = {"username": os.getenv("SHU_USERNAME", ""), "password": os.getenv("SHU_PASSWORD", "")}
+        result = MODULES[job["kind"]].run(credentials, ".", runtime.options_from_env())
+        code = int(result.get("code", 1))
+    except BaseException as e:
+        print(f"[ERROR] forkserver 子行程失敗：{e}", file=sys.stderr)
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def main() -> None:
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    parent = os.getppid()
+    _send(sock, {"type": "ready", "pid": os.getpid(), "startup_ms": int((time.perf_counter() - _T0) * 1000)})
+    while os.getppid() == parent:  # app 結束就跟著結束
+        # 回收已結束的子行程，把 exit code 回報給 app
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            _send(sock, {"type": "exit", "pid": pid, "code": os.waitstatus_to_exitcode(status)})
+
+        ready, _, _ = select.select([sock], [], [], 0.05)
+        if not ready:
+            continue
+        data, fds, _, _ = socket.recv_fds(sock, 65536, 2)
+        if not data:
+            continue
+        job = json.loads(data)
+        out_fd, err_fd = fds
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            _child(job, out_fd, err_fd)
+        os.close(out_fd)
+        os.close(err_fd)
+        _send(sock, {"type": "started", "id": job["id"], "pid": pid})
+
+
+if __name__ == "__main__":
+    main()